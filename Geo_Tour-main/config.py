@@ -37,6 +37,7 @@ TTS_API_KEY = get_secret("TTS_API_KEY") or get_secret("ELEVENLABS_API_KEY")
 BASE_DIR = Path(__file__).parent
 OUTPUT_DIR = BASE_DIR / "output"
 TEMP_DIR = BASE_DIR / "temp"
+CACHE_DIR = BASE_DIR / "cache"  # Generated images/clips reused across runs
 
 # Model settings
 OPENAI_MODEL = "gpt-4o"  # or "gpt-4o-mini" for faster/cheaper
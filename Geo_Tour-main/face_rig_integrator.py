@@ -12,6 +12,9 @@ import wave
 
 from config import TEMP_DIR
 
+# Seconds a health check result is reused before probing the server again
+HEALTH_CHECK_TTL = 5
+
 
 def safe_print(*args, **kwargs):
     """Safely print messages, handling closed file errors in Streamlit"""
@@ -41,6 +44,10 @@ class FaceRigIntegrator:
         self.video_dir = Path(TEMP_DIR) / "face_rig_videos"
         self.audio_dir.mkdir(exist_ok=True, parents=True)
         self.video_dir.mkdir(exist_ok=True, parents=True)
+        # Keep-alive session shared by every request to the face_rig server
+        self.session = requests.Session()
+        self._health_checked_at = None
+        self._health_ok = False
     
     def _retry_api_call(self, func, *args, **kwargs):
         """
@@ -176,7 +183,7 @@ class FaceRigIntegrator:
         """Generate audio using ElevenLabs via face_rig server"""
         endpoint = f"{self.face_rig_url}/generate-tts"
         
-        response = requests.post(
+        response = self.session.post(
             endpoint,
             json={
                 "transcript": transcript,
@@ -197,7 +204,7 @@ class FaceRigIntegrator:
         # Save to local audio directory
         local_audio_path = self.audio_dir / audio_filename
         
-        audio_response = requests.get(audio_url, timeout=300)  # 5 minutes for audio download
+        audio_response = self.session.get(audio_url, timeout=300)  # 5 minutes for audio download
         if audio_response.status_code != 200:
             raise RuntimeError(f"Failed to download audio from face_rig server: {audio_response.status_code}")
         
@@ -218,7 +225,7 @@ class FaceRigIntegrator:
             files = {'audio': audio_file}
             data = {'transcript': transcript}
             
-            response = requests.post(
+            response = self.session.post(
                 endpoint,
                 files=files,
                 data=data,
@@ -234,7 +241,7 @@ class FaceRigIntegrator:
         """Generate emotion keyframes via face_rig server"""
         endpoint = f"{self.face_rig_url}/generate-emotions"
         
-        response = requests.post(
+        response = self.session.post(
             endpoint,
             json={
                 "transcript": transcript,
@@ -318,7 +325,7 @@ class FaceRigIntegrator:
         # Get audio URL relative to face_rig server
         audio_url = f"/audio/{audio_filename}"
         
-        response = requests.post(
+        response = self.session.post(
             endpoint,
             json={
                 "combined_timeline": combined_timeline,
@@ -352,12 +359,18 @@ class FaceRigIntegrator:
             return 0.0
     
     def check_server_health(self) -> bool:
-        """Check if face_rig server is available"""
+        """Check if face_rig server is available (cached for HEALTH_CHECK_TTL seconds)"""
+        now = time.monotonic()
+        if self._health_checked_at is not None and now - self._health_checked_at < HEALTH_CHECK_TTL:
+            return self._health_ok
+        
         try:
-            response = requests.get(f"{self.face_rig_url}/health", timeout=5)
-            return response.status_code == 200
+            response = self.session.get(f"{self.face_rig_url}/health", timeout=5)
+            self._health_ok = response.status_code == 200
         except Exception:
-            return False
+            self._health_ok = False
+        self._health_checked_at = now
+        return self._health_ok
 
 
 if __name__ == "__main__":
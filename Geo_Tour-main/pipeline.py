@@ -58,7 +58,7 @@ class VideoPipeline:
         self.script_gen = ScriptGenerator(openai_api_key)
         self.scene_planner = ScenePlanner(openai_api_key)
         self.storyboard_gen = StoryboardGenerator(video_api_key)
-        self.video_gen = VideoGenerator(video_api_key, svd_model=svd_model, sdxl_model=sdxl_model)
+        self.video_gen = VideoGenerator(video_api_key, svd_model=svd_model, sdxl_model=sdxl_model, enable_cache=True)
         # AudioGenerator removed - using face_rig audio exclusively
         self.assembler = VideoAssembler()
         
@@ -408,8 +408,7 @@ class VideoPipeline:
             result = subprocess.run(cmd, check=True, capture_output=True, text=True)
             
             # Clean up list file
-            if list_file.exists():
-                list_file.unlink()
+            list_file.unlink(missing_ok=True)
             
             return str(combined_audio_path)
             
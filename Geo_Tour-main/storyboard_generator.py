@@ -1,22 +1,49 @@
 """
 Storyboard generation module - generates storyboard images from scene visual descriptions using Replicate
 """
+import re
+import threading
+import httpx
 import replicate
 import requests
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from config import REPLICATE_API_KEY, STORYBOARD_PROVIDER, STORYBOARD_MODEL, TEMP_DIR
 
 
+# Scenes run on worker threads; one line at a time keeps their progress readable
+_print_lock = threading.Lock()
+
+
 def safe_print(*args, **kwargs):
     """Safely print messages, handling closed file errors in Streamlit"""
     try:
-        print(*args, **kwargs)
+        with _print_lock:
+            print(*args, **kwargs)
     except (IOError, OSError, ValueError):
         # Silently fail if stdout is closed (Streamlit context)
         pass
 
 
+# Transient failures worth retrying: known transport exception types first,
+# then one regex search over the message for errors wrapped by the Replicate client
+_TRANSIENT_EXCEPTIONS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    httpx.TimeoutException,
+    httpx.NetworkError,
+    httpx.RemoteProtocolError,
+)
+_RETRYABLE_ERRORS = re.compile(
+    r"Server disconnected|Connection|Timeout|timeout|50[023]|429"
+)
+
+
+def _is_retryable(exc):
+    return isinstance(exc, _TRANSIENT_EXCEPTIONS) or _RETRYABLE_ERRORS.search(str(exc)) is not None
+
+
 class StoryboardGenerator:
     def __init__(self, api_key=None, provider=None, max_retries=3, retry_delay=5):
         self.api_key = api_key or REPLICATE_API_KEY
@@ -56,23 +83,7 @@ class StoryboardGenerator:
                 last_exception = e
                 error_msg = str(e)
                 
-                # Determine if error is retryable
-                retryable_errors = [
-                    "Server disconnected",
-                    "Connection",
-                    "Timeout",
-                    "timeout",
-                    "503",
-                    "502",
-                    "500",
-                    "429",  # Rate limit
-                    "ConnectionError",
-                    "ReadTimeout",
-                ]
-                
-                is_retryable = any(err in error_msg for err in retryable_errors)
-                
-                if not is_retryable:
+                if not _is_retryable(e):
                     safe_print(f"    ❌ Non-retryable error: {error_msg}")
                     raise
                 
@@ -103,21 +114,26 @@ class StoryboardGenerator:
         
         safe_print(f"🎨 Generating {len(scene_plan['scenes'])} storyboard images...")
         
-        image_paths = []
         generator_func = self.providers[self.provider]
+        scenes = scene_plan['scenes']
         
-        for scene in scene_plan['scenes']:
-            safe_print(f"  Scene {scene['scene_number']}: {scene['visual_description'][:50]}...")
-            
-            # Use retry logic for storyboard generation
-            image_path = self._retry_with_backoff(
-                generator_func,
-                visual_description=scene['visual_description'],
-                scene_number=scene['scene_number'],
-                output_dir=output_dir
-            )
+        # Scenes are independent API calls, so request them concurrently
+        with ThreadPoolExecutor(max_workers=max(1, min(8, len(scenes)))) as executor:
+            futures = []
+            for scene in scenes:
+                safe_print(f"  Scene {scene['scene_number']}: {scene['visual_description'][:50]}...")
+                
+                # Use retry logic for storyboard generation
+                futures.append(executor.submit(
+                    self._retry_with_backoff,
+                    generator_func,
+                    visual_description=scene['visual_description'],
+                    scene_number=scene['scene_number'],
+                    output_dir=output_dir
+                ))
             
-            image_paths.append(image_path)
+            # Collect in scene order regardless of completion order
+            image_paths = [future.result() for future in futures]
         
         safe_print(f"✅ Generated {len(image_paths)} storyboard images")
         return image_paths
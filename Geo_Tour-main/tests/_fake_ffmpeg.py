@@ -0,0 +1,35 @@
+"""
+In-process ffmpeg stand-in for the video assembler tests
+"""
+import subprocess
+from collections import deque
+
+
+class FakeFFmpeg:
+    """
+    Drop-in for subprocess.run, injected via VideoAssembler(runner=...)
+
+    Records every command and replays scripted outcomes in order: an int is
+    used as the return code, an exception instance is raised. Once the script
+    runs out every call succeeds with empty output.
+    """
+
+    def __init__(self, outcomes=(), stdout=""):
+        self.outcomes = deque(outcomes)
+        self.stdout = stdout
+        self.calls = []
+        self.inputs = []
+
+    def __call__(self, cmd, check=False, input=None, **kwargs):
+        self.calls.append(cmd)
+        self.inputs.append(input)
+        outcome = self.outcomes.popleft() if self.outcomes else 0
+        if isinstance(outcome, BaseException):
+            raise outcome
+        if check and outcome != 0:
+            raise subprocess.CalledProcessError(outcome, cmd, stderr=b"fake ffmpeg error")
+        return subprocess.CompletedProcess(cmd, outcome, stdout=self.stdout, stderr=b"")
+
+    def command(self, index=-1):
+        """The recorded argv of a call (last one by default)"""
+        return self.calls[index]
@@ -0,0 +1,17 @@
+"""
+Shared OpenAI client mocks for the script generator and scene planner tests
+"""
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+
+def openai_response(content):
+    """Build a lightweight chat-completion response exposing choices[0].message.content"""
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def make_client(content):
+    """Mock OpenAI client whose chat.completions.create returns `content`"""
+    client = Mock()
+    client.chat.completions.create.return_value = openai_response(content)
+    return client
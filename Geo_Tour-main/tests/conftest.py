@@ -2,131 +2,256 @@
 Shared pytest fixtures for video pipeline tests
 """
 import pytest
+import functools
+import io
 import json
 import sys
 import os
-import tempfile
+import uuid
 from pathlib import Path
-from unittest.mock import Mock, MagicMock
+from types import MappingProxyType, SimpleNamespace
+from unittest.mock import DEFAULT, Mock
+
+import responses
+from PIL import Image
+
+@functools.lru_cache(maxsize=1)
+def _load_env(env_path):
+    """
+    Load KEY=VALUE lines from a .env file once per process.
+
+    A plain parser is enough for the test .env; existing environment variables
+    win, matching load_dotenv's default. python-dotenv is still imported once
+    the tests import config, which loads the project .env itself.
+    """
+    if not env_path.exists():
+        return False
+    for line in env_path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        os.environ.setdefault(key.strip(), value.strip().strip("\"'"))
+    return True
+
 
 # Load environment variables from .env file if it exists
-try:
-    from dotenv import load_dotenv
-    env_path = Path(__file__).parent.parent / ".env"
-    if env_path.exists():
-        load_dotenv(env_path)
-        print(f"✅ Loaded environment variables from {env_path}")
-except ImportError:
-    # python-dotenv not installed, skip .env loading
-    pass
+_load_env(Path(__file__).parent.parent / ".env")
 
 # Add current directory to path (modules are in root)
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from tests._openai_mocks import make_client  # noqa: E402
 
-@pytest.fixture
-def temp_dir():
-    """Create a temporary directory for test outputs"""
-    with tempfile.TemporaryDirectory() as tmpdir:
-        yield Path(tmpdir)
+
+# Read-only sample data shared by the session fixtures below
+_SAMPLE_SCRIPT = {
+    "title": "How Rainbows Form",
+    "script": "Rainbows appear when sunlight passes through water droplets in the air. The light bends and separates into different colors, creating the beautiful arc we see in the sky."
+}
+
+_SAMPLE_SCENE_PLAN = {
+    "scenes": [
+        {
+            "scene_number": 1,
+            "narration": "Rainbows appear when sunlight passes through water droplets",
+            "visual_description": "Sunlight rays passing through water droplets, creating a prism effect with rainbow colors",
+            "duration": 6
+        },
+        {
+            "scene_number": 2,
+            "narration": "The light bends and separates into different colors",
+            "visual_description": "Close-up of a single water droplet with light refracting inside, showing color separation",
+            "duration": 5
+        },
+        {
+            "scene_number": 3,
+            "narration": "creating the beautiful arc we see in the sky",
+            "visual_description": "Wide shot of rainbow arc in sky after rain, with vibrant colors",
+            "duration": 6
+        }
+    ]
+}
+
+_MOCK_SCRIPT_JSON = json.dumps({
+    "title": "Test Video",
+    "script": "This is a test script."
+})
 
 
 @pytest.fixture
+def temp_dir(tmp_path):
+    """Per-test output directory (tmp_path is unique per xdist worker and test)"""
+    return tmp_path
+
+
+def _freeze(value):
+    """Read-only view of nested test data: dicts become mappingproxies, lists tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+@pytest.fixture(scope="session")
 def sample_script():
-    """Sample script data for testing"""
-    return {
-        "title": "How Rainbows Form",
-        "script": "Rainbows appear when sunlight passes through water droplets in the air. The light bends and separates into different colors, creating the beautiful arc we see in the sky."
-    }
+    """Sample script data for testing (shared across the session, read-only)"""
+    return _freeze(_SAMPLE_SCRIPT)
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_scene_plan():
-    """Sample scene plan for testing"""
-    return {
-        "scenes": [
-            {
-                "scene_number": 1,
-                "narration": "Rainbows appear when sunlight passes through water droplets",
-                "visual_description": "Sunlight rays passing through water droplets, creating a prism effect with rainbow colors",
-                "duration": 6
-            },
-            {
-                "scene_number": 2,
-                "narration": "The light bends and separates into different colors",
-                "visual_description": "Close-up of a single water droplet with light refracting inside, showing color separation",
-                "duration": 5
-            },
-            {
-                "scene_number": 3,
-                "narration": "creating the beautiful arc we see in the sky",
-                "visual_description": "Wide shot of rainbow arc in sky after rain, with vibrant colors",
-                "duration": 6
-            }
-        ]
-    }
+    """Sample scene plan for testing (shared across the session, read-only)"""
+    return _freeze(_SAMPLE_SCENE_PLAN)
+
+
+@pytest.fixture(scope="session")
+def openai_client_factory():
+    """Factory building a fresh mock OpenAI client per call"""
+    def _make():
+        return make_client(_MOCK_SCRIPT_JSON)
+    return _make
 
 
 @pytest.fixture
-def mock_openai_client():
+def mock_openai_client(openai_client_factory):
     """Mock OpenAI client for testing"""
-    client = Mock()
-    message = Mock()
-    message.content = json.dumps({
-        "title": "Test Video",
-        "script": "This is a test script."
-    })
-    choice = Mock()
-    choice.message = message
-    response = Mock()
-    response.choices = [choice]
-    client.chat.completions.create.return_value = response
-    return client
+    return openai_client_factory()
+
+
+@pytest.fixture(scope="session")
+def replicate_client_factory():
+    """Factory building a fresh mock Replicate client per call"""
+    def _make():
+        client = Mock()
+        # Mock video output
+        client.run.return_value = "https://example.com/video.mp4"
+        # Predictions resolve through the same scripted outputs as run
+        client.predictions.create.side_effect = lambda model=None, version=None, input=None: Mock(
+            id=uuid.uuid4().hex, status="succeeded", error=None,
+            output=client.run(model or version, input=input)
+        )
+        return client
+    return _make
 
 
 @pytest.fixture
-def mock_replicate_client():
+def mock_replicate_client(replicate_client_factory):
     """Mock Replicate client for testing"""
-    client = Mock()
-    # Mock video output
-    client.run.return_value = "https://example.com/video.mp4"
-    return client
+    return replicate_client_factory()
 
 
 @pytest.fixture
-def mock_requests_get():
-    """Mock requests.get for downloading files"""
-    mock_response = Mock()
-    mock_response.content = b"fake video content"
-    mock_response.raise_for_status = Mock()
-    mock_response.iter_content.return_value = [b"chunk1", b"chunk2"]
-    mock_response.status_code = 200
-    return mock_response
+def replicate_delivery():
+    """
+    Serve the CDN downloads the mocked Replicate client hands back.
+
+    Scenes download concurrently; responses patches the requests adapter and
+    is safe to hit from several threads, which a replayed cassette is not.
+    """
+    buffer = io.BytesIO()
+    Image.new("RGB", (16, 9)).save(buffer, format="PNG")
+    with responses.RequestsMock(assert_all_requests_are_fired=False) as rsps:
+        rsps.add(responses.GET, "https://example.com/image.png",
+                 body=buffer.getvalue(), content_type="image/png")
+        rsps.add(responses.GET, "https://example.com/video.mp4",
+                 body=b"fake video content", content_type="video/mp4")
+        yield rsps
 
 
 @pytest.fixture
+def mock_subprocess_run(mocker):
+    """Patch subprocess.run for video_assembler; tests set return_value/side_effect"""
+    return mocker.patch("video_assembler.subprocess.run", return_value=Mock(returncode=0))
+
+
+@pytest.fixture(scope="session")
 def sample_user_prompt():
     """Sample user prompt for testing"""
     return "Explain how rainbows form"
 
 
-@pytest.fixture
-def mock_storyboard_images(temp_dir):
-    """Create mock storyboard image files"""
+@pytest.fixture(scope="session")
+def mock_storyboard_images(tmp_path_factory):
+    """Mock storyboard image files, written once per session (on disk, image-to-video opens them)"""
+    storyboard_dir = tmp_path_factory.mktemp("storyboard")
     images = []
     for i in range(1, 4):
-        img_path = temp_dir / f"storyboard_scene_{i}.png"
+        img_path = storyboard_dir / f"storyboard_scene_{i}.png"
         img_path.write_text(f"Mock image {i}")
         images.append(str(img_path))
-    return images
+    return tuple(images)
 
 
 @pytest.fixture
-def mock_video_clips(temp_dir):
-    """Create mock video clip files"""
+def fake_temp_dir(fs):
+    """Output directory inside pyfakefs' in-memory filesystem; file I/O never hits disk"""
+    return Path(fs.create_dir("/tmp/pipeline-test").path)
+
+
+@pytest.fixture
+def mock_video_clips(fs, fake_temp_dir):
+    """Create mock video clip files in the fake filesystem (clips are only passed by path)"""
     clips = []
     for i in range(1, 4):
-        clip_path = temp_dir / f"scene_{i}.mp4"
-        clip_path.write_text(f"Mock video {i}")
+        clip_path = fake_temp_dir / f"scene_{i}.mp4"
+        fs.create_file(clip_path, contents=f"Mock video {i}")
         clips.append(str(clip_path))
     return clips
+
+
+@pytest.fixture(scope="session")
+def ffmpeg_probe():
+    """Real VideoAssembler built once per session, so ffmpeg is probed only once"""
+    from video_assembler import VideoAssembler
+    return VideoAssembler()
+
+
+@pytest.fixture
+def mocked_pipeline(mocker, temp_dir):
+    """
+    Pre-patch every VideoPipeline collaborator in one place.
+
+    Returns a namespace of the mocked entry points (script, scene, storyboard,
+    video, face_rig, assemble) so tests only set return values.
+    """
+    # A single patch.multiple: one patcher and one cleanup for all collaborators
+    collaborators = mocker.patch.multiple(
+        "pipeline",
+        ScriptGenerator=DEFAULT,
+        ScenePlanner=DEFAULT,
+        StoryboardGenerator=DEFAULT,
+        VideoGenerator=DEFAULT,
+        VideoAssembler=DEFAULT,
+        FaceRigIntegrator=DEFAULT,
+        ensure_directories=DEFAULT,
+        OUTPUT_DIR=temp_dir,
+        TEMP_DIR=temp_dir,
+    )
+
+    face_rig = collaborators["FaceRigIntegrator"].return_value
+    face_rig.check_server_health.return_value = True
+    face_rig.generate_scene_video.side_effect = lambda narration, scene_number: {
+        "video_path": str(temp_dir / f"face_rig_scene_{scene_number}.mp4"),
+        "audio_path": str(temp_dir / f"voiceover_{scene_number}.wav"),
+        "audio_duration": 5.0,
+    }
+
+    return SimpleNamespace(
+        script=collaborators["ScriptGenerator"].return_value.generate,
+        scene=collaborators["ScenePlanner"].return_value.create_plan,
+        storyboard=collaborators["StoryboardGenerator"].return_value.generate,
+        video=collaborators["VideoGenerator"].return_value._generate_clip,
+        face_rig=face_rig.generate_scene_video,
+        assemble=collaborators["VideoAssembler"].return_value.assemble,
+    )
+
+
+# Warm the import cache once per worker; pipeline pulls in every stage module
+import pipeline  # noqa: E402,F401
+import scene_planner  # noqa: E402,F401
+import script_generator  # noqa: E402,F401
+import storyboard_generator  # noqa: E402,F401
+import video_assembler  # noqa: E402,F401
+import video_generator  # noqa: E402,F401
@@ -0,0 +1,28 @@
+"""
+Tests for config module and ffmpeg discovery
+"""
+import os
+import pytest
+from pathlib import Path
+import config
+
+
+def test_directories_under_base_dir():
+    """Test output and temp directories live under the project root"""
+    assert config.OUTPUT_DIR.parent == config.BASE_DIR
+    assert config.TEMP_DIR.parent == config.BASE_DIR
+
+
+def test_ffmpeg_path_env_honored(ffmpeg_probe):
+    """Test FFMPEG_PATH (possibly set via .env loaded by config) takes priority"""
+    ffmpeg_path = os.getenv("FFMPEG_PATH", "").strip()
+    if not ffmpeg_path or not Path(ffmpeg_path).exists():
+        pytest.skip("FFMPEG_PATH not set to an existing path")
+    assert ffmpeg_probe.ffmpeg_cmd.startswith(ffmpeg_path)
+
+
+def test_ffmpeg_available(ffmpeg_probe):
+    """Test a discovered ffmpeg binary passes the -version probe"""
+    if not ffmpeg_probe.ffmpeg_cmd:
+        pytest.skip("ffmpeg not installed")
+    assert ffmpeg_probe._ffmpeg_verified
@@ -0,0 +1,59 @@
+"""
+Tests for face_rig_integrator module (HTTP mocked with responses)
+"""
+import pytest
+import responses
+from face_rig_integrator import FaceRigIntegrator
+
+_SERVER = "http://face-rig.test"
+
+
+@pytest.fixture
+def integrator(tmp_path):
+    """Integrator pointed at a fake server, saving downloads under tmp_path"""
+    integrator = FaceRigIntegrator(face_rig_url=_SERVER, max_retries=1, retry_delay=0)
+    integrator.audio_dir = tmp_path
+    return integrator
+
+
+@responses.activate
+def test_health_check_is_cached(integrator):
+    """Repeated health checks within the TTL hit the server once"""
+    responses.add(responses.GET, f"{_SERVER}/health", json={"status": "ok"}, status=200)
+    
+    assert integrator.check_server_health() is True
+    assert integrator.check_server_health() is True
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_health_check_server_error(integrator):
+    """A non-200 health response marks the server unavailable"""
+    responses.add(responses.GET, f"{_SERVER}/health", status=503)
+    
+    assert integrator.check_server_health() is False
+
+
+@responses.activate
+def test_tts_downloads_audio(integrator, tmp_path):
+    """TTS posts the transcript, then downloads the generated file"""
+    responses.add(
+        responses.POST, f"{_SERVER}/generate-tts",
+        json={"filename": "tts_1.wav", "duration": 1.5}, status=200,
+        match=[responses.matchers.json_params_matcher({"transcript": "Hello", "voice_id": integrator.voice_id})],
+    )
+    responses.add(responses.GET, f"{_SERVER}/audio/tts_1.wav", body=b"RIFF fake wav", status=200)
+    
+    data = integrator._generate_tts("Hello")
+    
+    assert data["path"] == str(tmp_path / "tts_1.wav")
+    assert (tmp_path / "tts_1.wav").read_bytes() == b"RIFF fake wav"
+
+
+@responses.activate
+def test_tts_server_error(integrator):
+    """TTS failures surface as RuntimeError"""
+    responses.add(responses.POST, f"{_SERVER}/generate-tts", body="quota exceeded", status=401)
+    
+    with pytest.raises(RuntimeError, match="TTS generation failed: 401"):
+        integrator._generate_tts("Hello")
@@ -3,10 +3,47 @@ Tests for scene_planner module
 """
 import pytest
 import json
-from unittest.mock import Mock, patch
+import re
+from unittest.mock import patch
+from tests._openai_mocks import make_client
 from scene_planner import ScenePlanner
 
 
+# Error-message patterns compiled once at import time
+_RE_NO_KEY = re.compile(r"OpenAI API key is required")
+_RE_INVALID = re.compile(r"Invalid scene plan structure")
+_RE_MISSING = re.compile(r"Scene missing required fields")
+_RE_PARSE = re.compile(r"Failed to parse scene plan")
+
+# Response payloads serialized once at import time
+_VALID_PLAN_JSON = json.dumps({
+    "scenes": [
+        {
+            "scene_number": 1,
+            "narration": "Rainbows appear when sunlight passes through water droplets",
+            "visual_description": "Sunlight rays passing through water droplets",
+            "duration": 6
+        },
+        {
+            "scene_number": 2,
+            "narration": "The light bends and separates",
+            "visual_description": "Close-up of water droplet with light refracting",
+            "duration": 5
+        }
+    ]
+})
+_INVALID_STRUCT_JSON = json.dumps({"invalid": "structure"})
+_MISSING_FIELDS_JSON = json.dumps({
+    "scenes": [
+        {
+            "scene_number": 1,
+            "narration": "Test"
+            # Missing visual_description and duration
+        }
+    ]
+})
+
+
 def test_scene_planner_init_with_key():
     """Test ScenePlanner initialization with API key"""
     planner = ScenePlanner(api_key="test-key")
@@ -14,40 +51,21 @@ def test_scene_planner_init_with_key():
     assert planner.client is not None
 
 
-def test_scene_planner_init_without_key():
+def test_scene_planner_init_without_key(monkeypatch):
     """Test ScenePlanner initialization without API key raises error"""
-    with patch.dict('os.environ', {}, clear=True):
-        with pytest.raises(ValueError, match="OpenAI API key is required"):
-            ScenePlanner(api_key=None)
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    # The config default is read at import time, so clear the module copy too
+    monkeypatch.setattr("scene_planner.OPENAI_API_KEY", None)
+    with pytest.raises(ValueError, match=_RE_NO_KEY):
+        ScenePlanner(api_key=None)
 
 
-def test_scene_planning_success(mock_openai_client, sample_script):
+def test_scene_planning_success(sample_script):
     """Test successful scene planning"""
-    with patch('scene_planner.OpenAI', return_value=mock_openai_client):
+    client = make_client(_VALID_PLAN_JSON)
+    with patch('scene_planner.OpenAI', return_value=client):
         planner = ScenePlanner(api_key="test-key")
         
-        # Mock the response
-        mock_response = Mock()
-        mock_choice = Mock()
-        mock_choice.message.content = json.dumps({
-            "scenes": [
-                {
-                    "scene_number": 1,
-                    "narration": "Rainbows appear when sunlight passes through water droplets",
-                    "visual_description": "Sunlight rays passing through water droplets",
-                    "duration": 6
-                },
-                {
-                    "scene_number": 2,
-                    "narration": "The light bends and separates",
-                    "visual_description": "Close-up of water droplet with light refracting",
-                    "duration": 5
-                }
-            ]
-        })
-        mock_response.choices = [mock_choice]
-        mock_openai_client.chat.completions.create.return_value = mock_response
-        
         result = planner.create_plan(sample_script)
         
         assert "scenes" in result
@@ -56,54 +74,16 @@ def test_scene_planning_success(mock_openai_client, sample_script):
         assert "visual_description" in result["scenes"][0]
 
 
-def test_scene_planning_invalid_structure(mock_openai_client, sample_script):
-    """Test scene planning with invalid structure"""
-    with patch('scene_planner.OpenAI', return_value=mock_openai_client):
+@pytest.mark.parametrize("content,expected_error", [
+    (_INVALID_STRUCT_JSON, _RE_INVALID),
+    (_MISSING_FIELDS_JSON, _RE_MISSING),
+    ("Invalid JSON", _RE_PARSE),
+], ids=["invalid_structure", "missing_fields", "invalid_json"])
+def test_scene_planning_invalid_response(sample_script, content, expected_error):
+    """Test scene planning rejects malformed responses"""
+    client = make_client(content)
+    with patch('scene_planner.OpenAI', return_value=client):
         planner = ScenePlanner(api_key="test-key")
         
-        mock_response = Mock()
-        mock_choice = Mock()
-        mock_choice.message.content = json.dumps({"invalid": "structure"})
-        mock_response.choices = [mock_choice]
-        mock_openai_client.chat.completions.create.return_value = mock_response
-        
-        with pytest.raises(ValueError, match="Invalid scene plan structure"):
-            planner.create_plan(sample_script)
-
-
-def test_scene_planning_missing_fields(mock_openai_client, sample_script):
-    """Test scene planning with missing required fields"""
-    with patch('scene_planner.OpenAI', return_value=mock_openai_client):
-        planner = ScenePlanner(api_key="test-key")
-        
-        mock_response = Mock()
-        mock_choice = Mock()
-        mock_choice.message.content = json.dumps({
-            "scenes": [
-                {
-                    "scene_number": 1,
-                    "narration": "Test"
-                    # Missing visual_description and duration
-                }
-            ]
-        })
-        mock_response.choices = [mock_choice]
-        mock_openai_client.chat.completions.create.return_value = mock_response
-        
-        with pytest.raises(ValueError, match="Scene missing required fields"):
-            planner.create_plan(sample_script)
-
-
-def test_scene_planning_invalid_json(mock_openai_client, sample_script):
-    """Test scene planning with invalid JSON"""
-    with patch('scene_planner.OpenAI', return_value=mock_openai_client):
-        planner = ScenePlanner(api_key="test-key")
-        
-        mock_response = Mock()
-        mock_choice = Mock()
-        mock_choice.message.content = "Invalid JSON"
-        mock_response.choices = [mock_choice]
-        mock_openai_client.chat.completions.create.return_value = mock_response
-        
-        with pytest.raises(ValueError, match="Failed to parse scene plan"):
+        with pytest.raises(ValueError, match=expected_error):
             planner.create_plan(sample_script)
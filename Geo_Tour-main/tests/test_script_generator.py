@@ -3,10 +3,26 @@ Tests for script_generator module
 """
 import pytest
 import json
-from unittest.mock import Mock, patch
+import re
+from unittest.mock import patch
+from tests._openai_mocks import make_client
 from script_generator import ScriptGenerator
 
 
+# Error-message patterns compiled once at import time
+_RE_NO_KEY = re.compile(r"OpenAI API key is required")
+_RE_PARSE = re.compile(r"Failed to parse script")
+_RE_INVALID = re.compile(r"Invalid script structure")
+_RE_FAILED = re.compile(r"Script generation failed")
+
+# Response payloads serialized once at import time
+_VALID_SCRIPT_JSON = json.dumps({
+    "title": "How Rainbows Form",
+    "script": "Rainbows appear when sunlight passes through water droplets."
+})
+_MISSING_SCRIPT_JSON = json.dumps({"title": "Test"})  # Missing script field
+
+
 def test_script_generator_init_with_key():
     """Test ScriptGenerator initialization with API key"""
     generator = ScriptGenerator(api_key="test-key")
@@ -14,28 +30,21 @@ def test_script_generator_init_with_key():
     assert generator.client is not None
 
 
-def test_script_generator_init_without_key():
+def test_script_generator_init_without_key(monkeypatch):
     """Test ScriptGenerator initialization without API key raises error"""
-    with patch.dict('os.environ', {}, clear=True):
-        with pytest.raises(ValueError, match="OpenAI API key is required"):
-            ScriptGenerator(api_key=None)
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    # The config default is read at import time, so clear the module copy too
+    monkeypatch.setattr("script_generator.OPENAI_API_KEY", None)
+    with pytest.raises(ValueError, match=_RE_NO_KEY):
+        ScriptGenerator(api_key=None)
 
 
-def test_script_generation_success(mock_openai_client, sample_user_prompt):
+def test_script_generation_success(sample_user_prompt):
     """Test successful script generation"""
-    with patch('script_generator.OpenAI', return_value=mock_openai_client):
+    client = make_client(_VALID_SCRIPT_JSON)
+    with patch('script_generator.OpenAI', return_value=client):
         generator = ScriptGenerator(api_key="test-key")
         
-        # Mock the response
-        mock_response = Mock()
-        mock_choice = Mock()
-        mock_choice.message.content = json.dumps({
-            "title": "How Rainbows Form",
-            "script": "Rainbows appear when sunlight passes through water droplets."
-        })
-        mock_response.choices = [mock_choice]
-        mock_openai_client.chat.completions.create.return_value = mock_response
-        
         result = generator.generate(sample_user_prompt)
         
         assert "title" in result
@@ -44,33 +53,23 @@ def test_script_generation_success(mock_openai_client, sample_user_prompt):
         assert len(result["script"]) > 0
 
 
-def test_script_generation_invalid_json(mock_openai_client, sample_user_prompt):
+def test_script_generation_invalid_json(sample_user_prompt):
     """Test script generation with invalid JSON response"""
-    with patch('script_generator.OpenAI', return_value=mock_openai_client):
+    client = make_client("Invalid JSON response")
+    with patch('script_generator.OpenAI', return_value=client):
         generator = ScriptGenerator(api_key="test-key")
         
-        mock_response = Mock()
-        mock_choice = Mock()
-        mock_choice.message.content = "Invalid JSON response"
-        mock_response.choices = [mock_choice]
-        mock_openai_client.chat.completions.create.return_value = mock_response
-        
-        with pytest.raises(ValueError, match="Failed to parse script"):
+        with pytest.raises(ValueError, match=_RE_PARSE):
             generator.generate(sample_user_prompt)
 
 
-def test_script_generation_missing_fields(mock_openai_client, sample_user_prompt):
+def test_script_generation_missing_fields(sample_user_prompt):
     """Test script generation with missing required fields"""
-    with patch('script_generator.OpenAI', return_value=mock_openai_client):
+    client = make_client(_MISSING_SCRIPT_JSON)
+    with patch('script_generator.OpenAI', return_value=client):
         generator = ScriptGenerator(api_key="test-key")
         
-        mock_response = Mock()
-        mock_choice = Mock()
-        mock_choice.message.content = json.dumps({"title": "Test"})  # Missing script field
-        mock_response.choices = [mock_choice]
-        mock_openai_client.chat.completions.create.return_value = mock_response
-        
-        with pytest.raises(ValueError, match="Invalid script structure"):
+        with pytest.raises(ValueError, match=_RE_INVALID):
             generator.generate(sample_user_prompt)
 
 
@@ -81,5 +80,5 @@ def test_script_generation_api_error(mock_openai_client, sample_user_prompt):
         
         mock_openai_client.chat.completions.create.side_effect = Exception("API Error")
         
-        with pytest.raises(RuntimeError, match="Script generation failed"):
+        with pytest.raises(RuntimeError, match=_RE_FAILED):
             generator.generate(sample_user_prompt)
@@ -2,68 +2,189 @@
 Tests for video_assembler module
 """
 import pytest
-from unittest.mock import Mock, patch, MagicMock
+from unittest.mock import patch
 from pathlib import Path
+import video_assembler
 from video_assembler import VideoAssembler
+from tests._fake_ffmpeg import FakeFFmpeg
 
 
-def test_video_assembler_init_with_ffmpeg():
+@pytest.fixture
+def fake_ffmpeg():
+    """Scripted ffmpeg runner; every call succeeds unless outcomes are queued"""
+    return FakeFFmpeg()
+
+
+@pytest.fixture
+def ffmpeg_assembler(fake_ffmpeg):
+    """VideoAssembler driven by FakeFFmpeg, as if ffmpeg (but not ffprobe) were installed"""
+    assembler = VideoAssembler(runner=fake_ffmpeg)
+    assembler.ffmpeg_cmd = "ffmpeg"
+    assembler.ffmpeg_available = True
+    assembler.ffprobe_cmd = None
+    return assembler
+
+
+@pytest.fixture(autouse=True)
+def _fresh_ffmpeg_probe():
+    """Drop the memoized ffmpeg lookup so each test's subprocess patch is honored"""
+    video_assembler._locate_ffmpeg.cache_clear()
+    video_assembler._check_ffmpeg.cache_clear()
+    video_assembler._detect_hw_encoder.cache_clear()
+    yield
+    video_assembler._locate_ffmpeg.cache_clear()
+    video_assembler._check_ffmpeg.cache_clear()
+    video_assembler._detect_hw_encoder.cache_clear()
+
+
+def test_video_assembler_init_with_ffmpeg(tmp_path, monkeypatch, mock_subprocess_run):
     """Test VideoAssembler initialization with ffmpeg available"""
-    with patch('subprocess.run') as mock_run:
-        mock_run.return_value = Mock(returncode=0)
-        assembler = VideoAssembler()
-        assert assembler.ffmpeg_available == True
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text("")
+    monkeypatch.setenv("FFMPEG_PATH", str(ffmpeg))
+    
+    assembler = VideoAssembler()
+    
+    assert assembler.ffmpeg_available == True
+    # The -version probe is deferred until the first assembly
+    assert not mock_subprocess_run.called
 
 
-def test_video_assembler_init_without_ffmpeg():
+def test_video_assembler_init_without_ffmpeg(tmp_path, monkeypatch):
     """Test VideoAssembler initialization without ffmpeg"""
-    with patch('subprocess.run', side_effect=FileNotFoundError()):
-        assembler = VideoAssembler()
-        assert assembler.ffmpeg_available == False
+    monkeypatch.setenv("FFMPEG_PATH", "")
+    monkeypatch.setenv("PATH", str(tmp_path))
+    
+    assembler = VideoAssembler()
+    assert assembler.ffmpeg_available == False
 
 
-def test_video_assembly_mock_mode(temp_dir, mock_video_clips):
+def test_broken_ffmpeg_detected_on_first_assembly(ffmpeg_assembler, fake_ffmpeg, temp_dir):
+    """A binary that fails `-version` sends assembly to the mock fallback"""
+    fake_ffmpeg.outcomes.append(FileNotFoundError())
+    
+    result = ffmpeg_assembler.assemble(["a.mp4"], "voice.mp3", temp_dir / "output.mp4")
+    
+    assert fake_ffmpeg.command(0)[1] == "-version"
+    assert len(fake_ffmpeg.calls) == 1
+    assert "Mock Final Video" in Path(result).read_text()
+
+
+def test_video_assembly_mock_mode(fs, fake_temp_dir, mock_video_clips, mock_subprocess_run):
     """Test video assembly in mock mode (no ffmpeg)"""
-    with patch('subprocess.run', side_effect=FileNotFoundError()):
-        assembler = VideoAssembler()
-        audio_path = temp_dir / "voiceover.mp3"
-        audio_path.write_text("mock audio")
-        
-        result = assembler.assemble(mock_video_clips, str(audio_path), temp_dir / "output.mp4")
-        
-        assert Path(result).exists()
+    mock_subprocess_run.side_effect = FileNotFoundError()
+    assembler = VideoAssembler()
+    audio_path = fake_temp_dir / "voiceover.mp3"
+    fs.create_file(audio_path, contents="mock audio")
+    
+    result = assembler.assemble(mock_video_clips, str(audio_path), fake_temp_dir / "output.mp4")
+    
+    assert Path(result).exists()
 
 
-def test_video_assembly_with_ffmpeg(temp_dir, mock_video_clips):
+def test_video_assembly_with_ffmpeg(fs, fake_temp_dir, mock_video_clips, ffmpeg_assembler, fake_ffmpeg):
     """Test video assembly with ffmpeg available"""
-    with patch('subprocess.run') as mock_run:
-        mock_run.return_value = Mock(returncode=0)
-        
-        assembler = VideoAssembler()
-        audio_path = temp_dir / "voiceover.mp3"
-        audio_path.write_text("mock audio")
-        
-        output_path = temp_dir / "output.mp4"
-        result = assembler.assemble(mock_video_clips, str(audio_path), output_path)
-        
-        assert result == str(output_path)
-        # Verify ffmpeg was called
-        assert mock_run.called
-
-
-def test_video_assembly_ffmpeg_error(temp_dir, mock_video_clips):
+    audio_path = fake_temp_dir / "voiceover.mp3"
+    fs.create_file(audio_path, contents="mock audio")
+    
+    output_path = fake_temp_dir / "output.mp4"
+    result = ffmpeg_assembler.assemble(mock_video_clips, str(audio_path), output_path)
+    
+    assert result == str(output_path)
+    # Past the -version probe, the final concat + mux wrote the output
+    assert fake_ffmpeg.command(0)[1] == "-version"
+    final = fake_ffmpeg.command()
+    assert "concat" in final and final[-1] == str(output_path)
+
+
+def test_video_assembly_ffmpeg_error(fs, fake_temp_dir, mock_video_clips, ffmpeg_assembler, fake_ffmpeg):
     """Test video assembly falls back to mock on ffmpeg error"""
-    with patch('subprocess.run') as mock_run:
-        # First call (check) succeeds, subsequent calls fail
-        mock_run.side_effect = [
-            Mock(returncode=0),  # ffmpeg check
-            Mock(returncode=1)   # ffmpeg concat fails
-        ]
-        
-        assembler = VideoAssembler()
-        audio_path = temp_dir / "voiceover.mp3"
-        audio_path.write_text("mock audio")
-        
-        # Should fall back to mock assembly
-        result = assembler.assemble(mock_video_clips, str(audio_path), temp_dir / "output.mp4")
-        assert Path(result).exists()
+    fake_ffmpeg.outcomes.extend([0, 1])  # -version passes, ffmpeg concat fails
+    audio_path = fake_temp_dir / "voiceover.mp3"
+    fs.create_file(audio_path, contents="mock audio")
+    
+    # Should fall back to mock assembly
+    result = ffmpeg_assembler.assemble(mock_video_clips, str(audio_path), fake_temp_dir / "output.mp4")
+    assert len(fake_ffmpeg.calls) == 2
+    assert "concat" in fake_ffmpeg.command(1)
+    assert Path(result).exists()
+    assert "Mock Final Video" in Path(result).read_text()
+
+
+def test_mixed_format_clips_are_normalized(ffmpeg_assembler):
+    """Clips with differing resolutions are re-encoded before stream-copy concat"""
+    assembler = ffmpeg_assembler
+    assembler.ffprobe_cmd = "ffprobe"
+    
+    formats = {"a.mp4": ("h264", 1280, 720, "24/1"), "b.mp4": ("h264", 1024, 576, "30/1")}
+    with patch.object(assembler, '_probe', side_effect=formats.get), \
+         patch.object(assembler, '_normalize_clip') as mock_normalize:
+        paths, temporary = assembler._normalize_clips(["a.mp4", "b.mp4"], "concatenated")
+    
+    assert mock_normalize.call_count == 2
+    assert all(call.args[2:] == (1280, 720, "24/1") for call in mock_normalize.call_args_list)
+    assert paths == [str(p) for p in temporary]
+
+
+def test_face_rig_overlay_is_a_single_ffmpeg_pass(temp_dir, ffmpeg_assembler, fake_ffmpeg, monkeypatch):
+    """Concat, overlay and audio mux run as one ffmpeg invocation"""
+    monkeypatch.setattr(video_assembler, "_detect_hw_encoder", lambda cmd, runner: "libx264")
+    
+    ffmpeg_assembler._compose_with_overlay(
+        ["a.mp4", "b.mp4"], ["fa.mp4", "fb.mp4"], "voice.mp3", temp_dir / "out.mp4"
+    )
+    
+    assert len(fake_ffmpeg.calls) == 1
+    cmd = fake_ffmpeg.command()
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    assert "[0:v][1:v]concat=n=2" in graph
+    assert "[2:v][3:v]concat=n=2" in graph
+    # Without a probed main width the PiP is sized against the main video in-graph
+    assert "[face_rig][main]scale2ref=w=trunc(main_w/8)*2:h=-2[overlay][base]" in graph
+    assert "[base][overlay]overlay" in graph
+    assert cmd[cmd.index("[out]") + 2] == "4:a"
+    assert "-filter_complex_threads" in cmd and cmd[cmd.index("-threads") + 1] == "0"
+
+
+def test_concat_list_is_piped_on_stdin(ffmpeg_assembler, fake_ffmpeg):
+    """The concat demuxer reads its file list from stdin, not a temp file"""
+    ffmpeg_assembler._concatenate_clips(["/clips/it's.mp4", "/clips/b.mp4"], "/out/final.mp4")
+    
+    cmd = fake_ffmpeg.command()
+    assert cmd[cmd.index("-i") + 1] == "pipe:0"
+    piped = fake_ffmpeg.inputs[-1].decode()
+    assert piped.splitlines() == ["file '/clips/it'\\''s.mp4'", "file '/clips/b.mp4'"]
+
+
+def test_hw_encoder_falls_back_to_libx264():
+    """Listed hardware encoders that fail the test encode are skipped"""
+    fake_ffmpeg = FakeFFmpeg(
+        outcomes=[0, 1, 1],  # -encoders listing, nvenc test encode (no GPU), qsv test encode (no iGPU)
+        stdout=" V....D h264_nvenc  NVIDIA NVENC\n V....D h264_qsv  Intel QSV\n",
+    )
+    
+    assert video_assembler._detect_hw_encoder("ffmpeg", fake_ffmpeg) == "libx264"
+    assert len(fake_ffmpeg.calls) == 3
+
+
+def test_hw_encoder_selected_when_usable(ffmpeg_assembler, fake_ffmpeg):
+    """The first working hardware encoder gets its extra options"""
+    fake_ffmpeg.stdout = " V....D h264_nvenc  NVIDIA NVENC\n"
+    
+    assert ffmpeg_assembler._video_encoder_args() == ["-c:v", "h264_nvenc", "-preset", "p4", "-tune", "hq"]
+
+
+def test_face_rig_overlay_is_prescaled(temp_dir, ffmpeg_assembler, fake_ffmpeg, monkeypatch):
+    """With the main width known, face_rig clips are shrunk up front and the final graph has no scaler"""
+    monkeypatch.setattr(video_assembler, "_detect_hw_encoder", lambda cmd, runner: "libx264")
+    ffmpeg_assembler.ffprobe_cmd = "ffprobe"
+    monkeypatch.setattr(ffmpeg_assembler, "_probe", lambda clip: ("h264", 1300, 732, "24/1"))
+    
+    ffmpeg_assembler._compose_with_overlay(["a.mp4"], ["fa.mp4", "fb.mp4"], "voice.mp3", temp_dir / "out.mp4")
+    
+    prescale_cmd, final_cmd = fake_ffmpeg.calls
+    # A quarter of the main width (325), rounded down to even for yuv420p
+    assert "scale=324:-2" in prescale_cmd[prescale_cmd.index("-filter_complex") + 1]
+    final_graph = final_cmd[final_cmd.index("-filter_complex") + 1]
+    assert "scale" not in final_graph
+    assert "[main][1:v]overlay" in final_graph
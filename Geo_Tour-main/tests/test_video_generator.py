@@ -1,10 +1,20 @@
 """
 Tests for video_generator module
 """
+import io
+import httpx
 import pytest
-from unittest.mock import Mock, patch, mock_open
+from unittest.mock import Mock
 from pathlib import Path
-from video_generator import VideoGenerator
+from video_generator import DIAGRAM_MODEL, VideoGenerator, _check_diagram_code, _stream_to_file
+
+_IMAGE_URL = "https://example.com/image.png"
+_VIDEO_URL = "https://example.com/video.mp4"
+
+
+def _replicate_outputs(generator):
+    """Text-to-image calls return the image URL, image-to-video calls the video URL"""
+    return lambda model, **kwargs: _IMAGE_URL if model == generator.sdxl_model else _VIDEO_URL
 
 
 def test_video_generator_init():
@@ -23,38 +33,56 @@ def test_video_generator_mock_mode(temp_dir, sample_scene_plan):
         assert Path(clip_path).exists()
 
 
-def test_video_generation_text_to_video(temp_dir, sample_scene_plan, mock_replicate_client, mock_requests_get):
+def test_video_generation_text_to_video(temp_dir, sample_scene_plan, mock_replicate_client, replicate_delivery, monkeypatch):
     """Test text-to-video generation with Replicate"""
-    with patch('video_generator.replicate.Client', return_value=mock_replicate_client):
-        with patch('requests.get', return_value=mock_requests_get):
-            generator = VideoGenerator(api_key="test-key")
-            
-            mock_replicate_client.run.return_value = "https://example.com/video.mp4"
-            
-            result = generator.generate_clips(sample_scene_plan, output_dir=temp_dir)
-            
-            assert len(result) == len(sample_scene_plan["scenes"])
-            mock_replicate_client.run.assert_called()
-
-
-def test_video_generation_image_to_video(temp_dir, sample_scene_plan, mock_storyboard_images, mock_replicate_client, mock_requests_get):
+    client_cls = Mock(return_value=mock_replicate_client)
+    monkeypatch.setattr('video_generator.replicate.Client', client_cls)
+    generator = VideoGenerator(api_key="test-key")
+    
+    mock_replicate_client.run.side_effect = _replicate_outputs(generator)
+    
+    result = generator.generate_clips(sample_scene_plan, output_dir=temp_dir)
+    
+    # Scenes run concurrently but share one client and keep scene order
+    assert [Path(p).name for p in result] == [
+        f"scene_{scene['scene_number']}.mp4" for scene in sample_scene_plan["scenes"]
+    ]
+    client_cls.assert_called_once_with(api_token="test-key")
+    mock_replicate_client.run.assert_called()
+    # Downloads stream through the shared session unchanged
+    assert Path(result[0]).read_bytes() == b"fake video content"
+
+
+def test_video_generation_image_to_video(temp_dir, sample_scene_plan, mock_storyboard_images, mock_replicate_client, replicate_delivery, monkeypatch):
     """Test image-to-video generation with storyboard images"""
-    with patch('video_generator.replicate.Client', return_value=mock_replicate_client):
-        with patch('requests.get', return_value=mock_requests_get):
-            generator = VideoGenerator(api_key="test-key")
-            
-            mock_replicate_client.run.return_value = "https://example.com/video.mp4"
-            
-            result = generator.generate_clips(
-                sample_scene_plan, 
-                output_dir=temp_dir,
-                storyboard_images=mock_storyboard_images
-            )
-            
-            assert len(result) == len(sample_scene_plan["scenes"])
-            # Verify image-to-video was called (check for image parameter)
-            calls = mock_replicate_client.run.call_args_list
-            assert len(calls) > 0
+    monkeypatch.setattr('video_generator.replicate.Client', Mock(return_value=mock_replicate_client))
+    generator = VideoGenerator(api_key="test-key")
+    outputs = _replicate_outputs(generator)
+    uploads = []
+
+    def run(model, **kwargs):
+        # The upload buffer is closed once the run returns, so read it during the call
+        upload = kwargs["input"].get("image")
+        if upload is not None:
+            uploads.append((type(upload), upload.getvalue()))
+        return outputs(model, **kwargs)
+
+    mock_replicate_client.run.side_effect = run
+    
+    result = generator.generate_clips(
+        sample_scene_plan, 
+        output_dir=temp_dir,
+        storyboard_images=mock_storyboard_images
+    )
+    
+    assert len(result) == len(sample_scene_plan["scenes"])
+    # Verify image-to-video was called (check for image parameter)
+    calls = mock_replicate_client.run.call_args_list
+    assert len(calls) > 0
+    # The storyboard is uploaded from memory, not from a reopened file handle
+    assert uploads and all(upload_type is io.BytesIO for upload_type, _ in uploads)
+    assert {data for _, data in uploads} <= {Path(p).read_bytes() for p in mock_storyboard_images}
+    assert all(c.kwargs["input"]["image"].closed for c in calls if "image" in c.kwargs["input"])
 
 
 def test_video_generation_no_api_key(temp_dir, sample_scene_plan):
@@ -66,22 +94,576 @@ def test_video_generation_no_api_key(temp_dir, sample_scene_plan):
     assert len(result) == len(sample_scene_plan["scenes"])
 
 
-def test_video_generation_stability_provider(temp_dir, sample_scene_plan, mock_replicate_client, mock_requests_get):
+def test_video_generation_stability_provider(temp_dir, sample_scene_plan, mock_replicate_client, replicate_delivery, monkeypatch):
     """Test Stability AI provider via Replicate"""
-    with patch('video_generator.replicate.Client', return_value=mock_replicate_client):
-        with patch('requests.get', return_value=mock_requests_get):
-            generator = VideoGenerator(api_key="test-key")
-            
-            mock_replicate_client.run.return_value = "https://example.com/video.mp4"
-            
-            result = generator.generate_clips(sample_scene_plan, output_dir=temp_dir)
-            
-            assert len(result) == len(sample_scene_plan["scenes"])
-
-
-def test_video_generator_invalid_provider(temp_dir, sample_scene_plan):
+    monkeypatch.setattr('video_generator.replicate.Client', Mock(return_value=mock_replicate_client))
+    generator = VideoGenerator(api_key="test-key")
+    
+    mock_replicate_client.run.side_effect = _replicate_outputs(generator)
+    
+    result = generator.generate_clips(sample_scene_plan, output_dir=temp_dir)
+    
+    assert len(result) == len(sample_scene_plan["scenes"])
+
+
+def test_video_generator_invalid_provider(temp_dir, sample_scene_plan, monkeypatch):
     """Test video generator with invalid provider falls back to mock"""
+    # An unreachable provider: every call fails as a transient network error,
+    # without DNS lookups or real backoff sleeps between the retries
+    client = Mock()
+    client.run.side_effect = httpx.ConnectError("Name or service not known")
+    client.predictions.create.side_effect = client.run.side_effect
+    monkeypatch.setattr('video_generator.replicate.Client', Mock(return_value=client))
+    monkeypatch.setattr('video_generator.time.sleep', lambda seconds: None)
     generator = VideoGenerator(api_key="test-key")
     
     result = generator.generate_clips(sample_scene_plan, output_dir=temp_dir)
     assert len(result) == len(sample_scene_plan["scenes"])
+
+
+class _RateLimited(Exception):
+    """Stand-in for an HTTP error carrying the server's response"""
+
+    def __init__(self, headers):
+        super().__init__("429 Too Many Requests")
+        self.response = Mock(headers=headers)
+
+
+def test_retry_honors_retry_after(monkeypatch):
+    """A Retry-After header sets the wait instead of the computed backoff"""
+    sleeps = []
+    monkeypatch.setattr("video_generator.time.sleep", sleeps.append)
+    monkeypatch.setattr(VideoGenerator, "_last_rate_limit", None)
+    monkeypatch.setattr(VideoGenerator, "_rate_limit_interval", None)
+    generator = VideoGenerator(api_key="test-key", retry_delay=5)
+    func = Mock(side_effect=[_RateLimited({"Retry-After": "7"}), "ok"])
+
+    assert generator._retry_with_backoff(func) == "ok"
+    assert sleeps == [7.0]
+
+
+def test_retry_backoff_is_jittered_and_capped(monkeypatch):
+    """Without Retry-After the wait is jittered around the exponential step"""
+    sleeps = []
+    monkeypatch.setattr("video_generator.time.sleep", sleeps.append)
+    monkeypatch.setattr(VideoGenerator, "_rate_limit_interval", None)
+    generator = VideoGenerator(api_key="test-key", retry_delay=100, max_retries=2)
+    func = Mock(side_effect=[ConnectionError("Connection reset"), "ok"])
+
+    assert generator._retry_with_backoff(func) == "ok"
+    assert len(sleeps) == 1 and 0 < sleeps[0] <= 60
+
+
+def test_retry_non_retryable_raises_immediately(monkeypatch):
+    """Errors that don't look transient are raised without sleeping"""
+    sleeps = []
+    monkeypatch.setattr("video_generator.time.sleep", sleeps.append)
+    generator = VideoGenerator(api_key="test-key")
+    func = Mock(side_effect=ValueError("invalid prompt"))
+
+    with pytest.raises(ValueError):
+        generator._retry_with_backoff(func)
+    assert func.call_count == 1
+    assert sleeps == []
+
+
+def test_stream_to_file_trims_preallocation(tmp_path):
+    """A body shorter than its Content-Length leaves no preallocated tail"""
+    resp = Mock(headers={"Content-Length": "4096"}, raw=io.BytesIO(b"fake video content"))
+    out = tmp_path / "clip.mp4"
+
+    with open(out, "wb") as f:
+        assert _stream_to_file(resp, f) == len(b"fake video content")
+    assert out.read_bytes() == b"fake video content"
+
+
+def test_video_generation_reuses_cache(temp_dir, sample_scene_plan, mock_replicate_client, replicate_delivery, monkeypatch):
+    """A repeated scene plan is served from the cache without calling Replicate"""
+    monkeypatch.setattr('video_generator.replicate.Client', Mock(return_value=mock_replicate_client))
+    generator = VideoGenerator(api_key="test-key", enable_cache=True, cache_dir=temp_dir / "cache")
+    mock_replicate_client.run.side_effect = _replicate_outputs(generator)
+
+    first = generator.generate_clips(sample_scene_plan, output_dir=temp_dir / "first")
+    calls = mock_replicate_client.run.call_count
+    second = generator.generate_clips(sample_scene_plan, output_dir=temp_dir / "second")
+
+    assert mock_replicate_client.run.call_count == calls
+    assert [Path(p).read_bytes() for p in second] == [Path(p).read_bytes() for p in first]
+
+
+@pytest.mark.parametrize("image_format,expected", [("jpeg", "JPEG"), ("png", "PNG")])
+@pytest.mark.parametrize("mode,fmt", [("RGB", "JPEG"), ("RGB", "PNG"), ("RGBA", "PNG"), ("P", "PNG")])
+def test_encode_image_normalizes_to_rgb(mode, fmt, image_format, expected):
+    """Sources are re-encoded once as RGB in the configured format"""
+    from PIL import Image
+    source = io.BytesIO()
+    Image.new(mode, (16, 9)).save(source, format=fmt)
+    generator = VideoGenerator(api_key="test-key", image_format=image_format)
+
+    encoded = generator._encode_image(source.getvalue())
+
+    img = Image.open(io.BytesIO(encoded))
+    assert (img.format, img.mode, img.size) == (expected, "RGB", (16, 9))
+
+
+@pytest.mark.parametrize("image_format,fmt", [("jpeg", "JPEG"), ("png", "PNG")])
+def test_encode_image_passes_matching_format_through(image_format, fmt):
+    """An RGB image already in the target format is forwarded byte-for-byte"""
+    from PIL import Image
+    source = io.BytesIO()
+    Image.new("RGB", (16, 9)).save(source, format=fmt)
+    generator = VideoGenerator(api_key="test-key", image_format=image_format)
+
+    assert generator._encode_image(source.getvalue()) == source.getvalue()
+
+
+def test_invalid_image_format():
+    """Unknown intermediate encodings are rejected up front"""
+    with pytest.raises(ValueError, match="not supported"):
+        VideoGenerator(api_key="test-key", image_format="tiff")
+
+
+def test_retry_recognizes_transport_exceptions(monkeypatch):
+    """Transport errors are retried by type even when the message says nothing useful"""
+    import requests
+    monkeypatch.setattr("video_generator.time.sleep", lambda _: None)
+    generator = VideoGenerator(api_key="test-key", retry_delay=0)
+    func = Mock(side_effect=[requests.ConnectionError("boom"), "ok"])
+
+    assert generator._retry_with_backoff(func) == "ok"
+    assert func.call_count == 2
+
+
+def test_each_scene_animates_after_its_own_image(temp_dir, sample_scene_plan, mock_replicate_client, replicate_delivery, monkeypatch):
+    """Image-to-video for a scene starts only once that scene's text-to-image call has run"""
+    monkeypatch.setattr('video_generator.replicate.Client', Mock(return_value=mock_replicate_client))
+    generator = VideoGenerator(api_key="test-key")
+    mock_replicate_client.run.side_effect = _replicate_outputs(generator)
+
+    generator.generate_clips(sample_scene_plan, output_dir=temp_dir)
+
+    calls = [(c.args[0], c.kwargs["input"]["prompt"]) for c in mock_replicate_client.run.call_args_list]
+    for scene in sample_scene_plan["scenes"]:
+        prompt = scene["visual_description"]
+        assert calls.index((generator.sdxl_model, prompt)) < calls.index((generator.svd_model, prompt))
+
+
+def test_encode_image_rejects_non_image_bytes():
+    """Content that isn't a PNG/JPEG/WebP is rejected from its signature alone"""
+    generator = VideoGenerator(api_key="test-key")
+
+    with pytest.raises(ValueError, match="Unrecognized image data"):
+        generator._encode_image(b"<html>Service Unavailable</html>")
+
+
+def test_repeated_descriptions_share_one_image(temp_dir, sample_scene_plan, mock_replicate_client, replicate_delivery, monkeypatch):
+    """Scenes with the same visual description trigger a single text-to-image call"""
+    monkeypatch.setattr('video_generator.replicate.Client', Mock(return_value=mock_replicate_client))
+    generator = VideoGenerator(api_key="test-key")
+    mock_replicate_client.run.side_effect = _replicate_outputs(generator)
+    first = sample_scene_plan["scenes"][0]
+    plan = {"scenes": [dict(scene, visual_description=first["visual_description"]) for scene in sample_scene_plan["scenes"]]}
+
+    result = generator.generate_clips(plan, output_dir=temp_dir)
+
+    models = [c.args[0] for c in mock_replicate_client.run.call_args_list]
+    assert models.count(generator.sdxl_model) == 1
+    assert models.count(generator.svd_model) == len(plan["scenes"])
+    assert len(result) == len(plan["scenes"])
+
+
+def test_diagram_scene_reuses_cache(temp_dir, monkeypatch):
+    """A repeated diagram description is copied from the cache instead of re-rendered"""
+    def render(description, duration, scene_number, output_dir):
+        path = Path(output_dir) / f"scene_{scene_number}.mp4"
+        path.write_bytes(b"diagram")
+        return str(path)
+
+    generator = VideoGenerator(api_key="test-key", enable_cache=True, cache_dir=temp_dir / "cache")
+    render_mock = Mock(side_effect=render)
+    monkeypatch.setattr(generator, "_generate_matplotlib_diagram", render_mock)
+
+    generator._generate_clip_internal("Layers of  the\nEarth", 6, 1, temp_dir, scene_type="diagram")
+    clip = generator._generate_clip_internal("Layers of the Earth", 6, 2, temp_dir, scene_type="diagram")
+
+    assert render_mock.call_count == 1
+    assert Path(clip).read_bytes() == b"diagram"
+
+
+def test_cache_miss_does_not_overwrite_linked_entry(temp_dir, monkeypatch):
+    """Regenerating a scene whose output was linked from the cache leaves that entry intact"""
+    def render(description, duration, scene_number, output_dir):
+        path = Path(output_dir) / f"scene_{scene_number}.mp4"
+        with open(path, "wb") as f:  # in place, as ffmpeg -y does
+            f.write(description.encode())
+        return str(path)
+
+    generator = VideoGenerator(api_key="test-key", enable_cache=True, cache_dir=temp_dir / "cache")
+    monkeypatch.setattr(generator, "_generate_matplotlib_diagram", Mock(side_effect=render))
+
+    generator._generate_clip_internal("A", 6, 1, temp_dir, scene_type="diagram")
+    generator._generate_clip_internal("A", 6, 1, temp_dir, scene_type="diagram")  # hit: linked in
+    generator._generate_clip_internal("B", 6, 1, temp_dir, scene_type="diagram")  # miss: same file name
+
+    entry_a = generator.cache_dir / f"{generator._cache_key(DIAGRAM_MODEL, {'description': 'A', 'duration': 6})}.mp4"
+    assert entry_a.read_bytes() == b"A"
+    assert (temp_dir / "scene_1.mp4").read_bytes() == b"B"
+
+
+def test_inline_video_output_skips_download(temp_dir, sample_scene_plan, mock_replicate_client, monkeypatch):
+    """A data: URL from a sync-mode prediction is written directly, without an HTTP GET"""
+    import base64
+    monkeypatch.setattr('video_generator.replicate.Client', Mock(return_value=mock_replicate_client))
+    generator = VideoGenerator(api_key="test-key")
+    inline = "data:video/mp4;base64," + base64.b64encode(b"inline clip").decode()
+    monkeypatch.setattr(generator, "_download_video", Mock(side_effect=AssertionError("unexpected download")))
+    image = temp_dir / "storyboard.png"
+    image.write_bytes(b"\x89PNG\r\n\x1a\n")
+    mock_replicate_client.run.return_value = inline
+
+    clip = generator._generate_replicate_video("desc", 6, 1, temp_dir, storyboard_image=str(image))
+
+    assert Path(clip).read_bytes() == b"inline clip"
+
+
+def test_scene_image_bytes_are_not_read_back(temp_dir, mock_replicate_client, monkeypatch):
+    """A generated (path, bytes) image goes to image-to-video without a disk read"""
+    import base64
+    monkeypatch.setattr('video_generator.replicate.Client', Mock(return_value=mock_replicate_client))
+    generator = VideoGenerator(api_key="test-key")
+    mock_replicate_client.run.return_value = "data:video/mp4;base64," + base64.b64encode(b"clip").decode()
+    image_path = temp_dir / "scene_1_image.png"  # never written
+
+    clip = generator._generate_replicate_video(
+        "desc", 6, 1, temp_dir, storyboard_image=(image_path, b"\x89PNG\r\n\x1a\n")
+    )
+
+    assert Path(clip).read_bytes() == b"clip"
+
+
+def test_download_retry_honors_retry_after(temp_dir, monkeypatch):
+    """Download retries use the same Retry-After aware wait as model calls"""
+    sleeps = []
+    monkeypatch.setattr("video_generator.time.sleep", sleeps.append)
+    generator = VideoGenerator(api_key="test-key")
+    ok = Mock(headers={}, raw=io.BytesIO(b"clip"))
+    ok.__enter__ = Mock(return_value=ok)
+    ok.__exit__ = Mock(return_value=False)
+    monkeypatch.setattr(generator._session, "get", Mock(side_effect=[_RateLimited({"Retry-After": "3"}), ok]))
+
+    generator._download_video("https://example.com/video.mp4", temp_dir / "clip.mp4")
+
+    assert sleeps == [3.0]
+    assert (temp_dir / "clip.mp4").read_bytes() == b"clip"
+
+
+def test_slideshow_images_generated_concurrently_in_order(temp_dir, monkeypatch):
+    """Slideshow frames are requested in parallel and handed to ffmpeg in frame order"""
+    import sys
+    import types
+    genai = types.ModuleType("google.generativeai")
+    genai.configure = Mock()
+    model = Mock()
+    model.generate_content.side_effect = lambda _: Mock(parts=[Mock(inline_data=Mock(data=b"\x89PNG\r\n\x1a\n" + b"\0" * 2000))])
+    genai.GenerativeModel = Mock(return_value=model)
+    monkeypatch.setitem(sys.modules, "google.generativeai", genai)
+    monkeypatch.setattr("video_generator.GEMINI_API_KEY", "test-key")
+    generator = VideoGenerator(api_key="test-key")
+    slideshow = Mock()
+    monkeypatch.setattr(generator, "_create_slideshow_video", slideshow)
+
+    generator._generate_3d_visualization("Earth's layers", 8, 1, temp_dir)
+
+    assert model.generate_content.call_count == 4
+    image_paths = slideshow.call_args.args[0]
+    assert [p.name for p in image_paths] == [f"image_{i:03d}.png" for i in range(4)]
+
+
+def test_slideshow_concat_list_fed_on_stdin(temp_dir, monkeypatch):
+    """The concat list goes to ffmpeg on stdin; nothing is written next to the output"""
+    run = Mock()
+    monkeypatch.setattr("video_generator.subprocess.run", run)
+    images = [temp_dir / "image_000.png", temp_dir / "it's.png"]
+
+    VideoGenerator(api_key="test-key")._create_slideshow_video(images, 8, temp_dir / "clip.mp4")
+
+    cmd = run.call_args.args[0]
+    assert cmd[cmd.index("-i") + 1] == "pipe:0"
+    assert cmd[cmd.index("-tune") + 1] == "stillimage"
+    list_content = run.call_args.kwargs["input"]
+    assert list_content.count("duration 4.0") == 2
+    assert "it'\\''s.png" in list_content
+    assert list(temp_dir.iterdir()) == []
+
+
+def test_gemini_configured_once_across_retries(temp_dir, monkeypatch):
+    """Diagram retries reuse one configured Gemini model instead of rebuilding it"""
+    import sys
+    import types
+    genai = types.ModuleType("google.generativeai")
+    genai.configure = Mock()
+    genai.GenerativeModel = Mock()
+    monkeypatch.setitem(sys.modules, "google.generativeai", genai)
+    monkeypatch.setattr("video_generator.GEMINI_API_KEY", "test-key")
+    generator = VideoGenerator(api_key="test-key")
+    attempt = Mock(side_effect=[SyntaxError("bad code"), "scene_1.mp4", "scene_2.mp4"])
+    monkeypatch.setattr(generator, "_generate_matplotlib_diagram_attempt", attempt)
+
+    generator._generate_matplotlib_diagram("Earth's layers", 6, 1, temp_dir)
+    generator._generate_matplotlib_diagram("Earth's layers", 6, 2, temp_dir)
+
+    genai.configure.assert_called_once_with(api_key="test-key")
+    genai.GenerativeModel.assert_called_once_with("gemini-3-pro-preview")
+    assert {c.args[0] for c in attempt.call_args_list} == {genai.GenerativeModel.return_value}
+
+
+class _InlinePool:
+    """multiprocessing.Pool stand-in that renders in the calling process"""
+
+    def __init__(self, processes):
+        self.processes = processes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def imap(self, func, iterable):
+        return map(func, iterable)
+
+
+def test_diagram_frames_piped_to_ffmpeg_in_order(temp_dir, monkeypatch):
+    """Rendered diagram frames stream into ffmpeg's rawvideo stdin in frame order"""
+    monkeypatch.setattr("video_generator.multiprocessing.get_context", lambda method: Mock(Pool=_InlinePool))
+    monkeypatch.setattr("video_generator._render_diagram_frame", lambda code_path, frame: bytes([frame]))
+    proc = Mock()
+    proc.wait.return_value = 0
+    proc.stderr.read.return_value = b""
+    popen = Mock(return_value=proc)
+    monkeypatch.setattr("video_generator.subprocess.Popen", popen)
+
+    VideoGenerator(api_key="test-key")._render_diagram_video(temp_dir / "scene.py", 5, temp_dir / "scene.mp4")
+
+    cmd = popen.call_args.args[0]
+    assert cmd[cmd.index("-f") + 1] == "rawvideo"
+    assert cmd[cmd.index("-s") + 1] == "1920x1080"
+    assert [c.args[0] for c in proc.stdin.write.call_args_list] == [bytes([i]) for i in range(5)]
+    proc.stdin.close.assert_called_once()
+
+
+def test_diagram_render_failure_stops_ffmpeg(temp_dir, monkeypatch):
+    """A frame that fails to render kills the encoder and surfaces the error"""
+    def render(code_path, frame):
+        raise ValueError("bad frame")
+
+    monkeypatch.setattr("video_generator.multiprocessing.get_context", lambda method: Mock(Pool=_InlinePool))
+    monkeypatch.setattr("video_generator._render_diagram_frame", render)
+    proc = Mock()
+    monkeypatch.setattr("video_generator.subprocess.Popen", Mock(return_value=proc))
+
+    with pytest.raises(RuntimeError, match="bad frame"):
+        VideoGenerator(api_key="test-key")._render_diagram_video(temp_dir / "scene.py", 5, temp_dir / "scene.mp4")
+    proc.kill.assert_called_once()
+
+
+def test_diagram_pool_shares_cpus_between_scenes(temp_dir, monkeypatch):
+    """Each diagram scene's pool gets cpu_count // max_parallel processes"""
+    pool = Mock(side_effect=_InlinePool)
+    monkeypatch.setattr("video_generator.multiprocessing.get_context", lambda method: Mock(Pool=pool))
+    monkeypatch.setattr("video_generator._render_diagram_frame", lambda code_path, frame: b"")
+    monkeypatch.setattr("video_generator.os.cpu_count", lambda: 16)
+    proc = Mock()
+    proc.wait.return_value = 0
+    proc.stderr.read.return_value = b""
+    monkeypatch.setattr("video_generator.subprocess.Popen", Mock(return_value=proc))
+
+    VideoGenerator(api_key="test-key", max_parallel=4)._render_diagram_video(temp_dir / "scene.py", 240, temp_dir / "scene.mp4")
+
+    pool.assert_called_once_with(4)
+
+
+def test_render_diagram_frame_checks_shape(tmp_path):
+    """Frames come back as packed RGB; wrong-sized frames are rejected"""
+    pytest.importorskip("numpy")
+    from video_generator import _render_diagram_frame
+    code_path = tmp_path / "scene.py"
+    code_path.write_text(
+        "import numpy as np\n"
+        "def render_frame(frame):\n"
+        "    height = 1080 if frame == 0 else 720\n"
+        "    return np.full((height, 1920, 4), frame, dtype=np.uint8)\n"
+    )
+
+    assert _render_diagram_frame(str(code_path), 0) == bytes(1920 * 1080 * 3)
+    with pytest.raises(RuntimeError, match="shape"):
+        _render_diagram_frame(str(code_path), 1)
+
+
+@pytest.mark.parametrize("code,error", [
+    ("def render_frame(frame)\n    pass\n", "Code execution failed"),
+    ("def animate(frame):\n    pass\n", "render_frame"),
+    ("def render_frame(frame):\n    ax.text(0, 0, 'Crust', letter_spacing=2)\n", "letter_spacing"),
+    ("def render_frame(frame):\n    ax.text(0, 0, 'Core', **{'text_spacing': 1})\n", "text_spacing"),
+])
+def test_check_diagram_code_rejects_bad_code(code, error):
+    """Broken generated code is rejected before any frame is rendered"""
+    with pytest.raises(RuntimeError, match=error):
+        _check_diagram_code(code, "scene_1_matplotlib.py")
+
+
+def test_check_diagram_code_accepts_render_frame():
+    """Valid code passes the static checks"""
+    _check_diagram_code("def render_frame(frame):\n    return frame\n", "scene_1_matplotlib.py")
+
+
+def test_slideshow_image_rejects_non_image_data(temp_dir):
+    """A text reply in place of an image fails the frame before anything is written"""
+    model = Mock()
+    model.generate_content.return_value = Mock(parts=[Mock(inline_data=Mock(data=b"I cannot draw that" * 100))])
+
+    with pytest.raises(RuntimeError, match="not a recognized image"):
+        VideoGenerator(api_key="test-key")._generate_slideshow_image(model, "Earth's layers", temp_dir, 0, 1)
+    assert list(temp_dir.iterdir()) == []
+
+
+def test_failed_clip_cancels_queued_scenes(temp_dir, sample_scene_plan, monkeypatch):
+    """The first scene to fail for good cancels the scenes still waiting for a worker"""
+    import time
+    generator = VideoGenerator(api_key="test-key", max_parallel=1)
+    monkeypatch.setattr(generator, "_submit_scene_images", lambda executor, scenes, *args: [None] * len(scenes))
+    started = []
+
+    def clip_job(scene_image, scene_number, **kwargs):
+        started.append(scene_number)
+        if scene_number == 1:
+            raise RuntimeError("model unavailable")
+        # Holds the only worker while generate_clips sees the failure
+        time.sleep(0.5)
+        return "clip.mp4"
+
+    monkeypatch.setattr(generator, "_generate_clip_when_ready", clip_job)
+
+    with pytest.raises(RuntimeError, match="model unavailable"):
+        generator.generate_clips(sample_scene_plan, output_dir=temp_dir)
+    # Scene 2 may already have been picked up; scene 3 never starts
+    assert 3 not in started
+
+
+def test_gemini_setup_starts_with_the_image_jobs(temp_dir, sample_scene_plan, monkeypatch):
+    """Plans with diagram scenes begin Gemini setup before the clip jobs need it"""
+    import sys
+    import types
+    genai = types.ModuleType("google.generativeai")
+    genai.configure = Mock()
+    genai.GenerativeModel = Mock()
+    monkeypatch.setitem(sys.modules, "google.generativeai", genai)
+    monkeypatch.setattr("video_generator.GEMINI_API_KEY", "test-key")
+    generator = VideoGenerator(api_key="test-key")
+    monkeypatch.setattr(generator, "_generate_clip_when_ready", Mock(return_value="clip.mp4"))
+    plan = {"scenes": [dict(scene, scene_type="diagram") for scene in sample_scene_plan["scenes"]]}
+
+    generator.generate_clips(plan, output_dir=temp_dir)
+
+    genai.GenerativeModel.assert_called_with("gemini-3-pro-preview")
+
+
+def test_retry_resumes_inflight_prediction(temp_dir, mock_replicate_client, monkeypatch):
+    """A retry after a dropped poll resumes the registered prediction instead of starting another"""
+    monkeypatch.setattr('video_generator.replicate.Client', Mock(return_value=mock_replicate_client))
+    generator = VideoGenerator(api_key="test-key", enable_cache=True, cache_dir=temp_dir / "cache")
+    monkeypatch.setattr(generator, "_download_video", lambda url, path: Path(path).write_bytes(b"clip"))
+    image = temp_dir / "storyboard.png"
+    image.write_bytes(b"\x89PNG\r\n\x1a\n")
+    dropped = Mock(id="pred-1", status="processing")
+    dropped.wait.side_effect = ConnectionError("Server disconnected")
+    mock_replicate_client.predictions.create.side_effect = [dropped]
+    mock_replicate_client.predictions.get.return_value = Mock(
+        id="pred-1", status="succeeded", output="https://example.com/video.mp4"
+    )
+
+    with pytest.raises(ConnectionError):
+        generator._generate_replicate_video("desc", 6, 1, temp_dir, storyboard_image=str(image))
+    # The in-flight id survives a restart alongside the cache
+    restarted = VideoGenerator(api_key="test-key", enable_cache=True, cache_dir=temp_dir / "cache")
+    assert list(restarted._prediction_ids.values()) == ["pred-1"]
+    clip = generator._generate_replicate_video("desc", 6, 1, temp_dir, storyboard_image=str(image))
+
+    assert Path(clip).read_bytes() == b"clip"
+    mock_replicate_client.predictions.create.assert_called_once()
+    mock_replicate_client.predictions.get.assert_called_once_with("pred-1")
+    assert generator._prediction_ids == {}
+
+
+def test_failed_download_forgets_succeeded_prediction(temp_dir, mock_replicate_client, monkeypatch):
+    """A succeeded prediction whose output can't be downloaded is not resumed by the retry"""
+    monkeypatch.setattr('video_generator.replicate.Client', Mock(return_value=mock_replicate_client))
+    generator = VideoGenerator(api_key="test-key", enable_cache=True, cache_dir=temp_dir / "cache")
+    outcomes = iter([RuntimeError("404 Not Found"), b"clip"])
+
+    def download(url, path):
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        Path(path).write_bytes(outcome)
+
+    monkeypatch.setattr(generator, "_download_video", download)
+    image = temp_dir / "storyboard.png"
+    image.write_bytes(b"\x89PNG\r\n\x1a\n")
+
+    with pytest.raises(RuntimeError, match="404"):
+        generator._generate_replicate_video("desc", 6, 1, temp_dir, storyboard_image=str(image))
+    assert generator._prediction_ids == {}
+    clip = generator._generate_replicate_video("desc", 6, 1, temp_dir, storyboard_image=str(image))
+
+    assert Path(clip).read_bytes() == b"clip"
+    assert mock_replicate_client.predictions.create.call_count == 2
+    mock_replicate_client.predictions.get.assert_not_called()
+
+
+def test_unreachable_prediction_is_replaced(temp_dir, mock_replicate_client, monkeypatch):
+    """A registered prediction that can no longer be fetched is forgotten and started afresh"""
+    monkeypatch.setattr('video_generator.replicate.Client', Mock(return_value=mock_replicate_client))
+    generator = VideoGenerator(api_key="test-key", enable_cache=True, cache_dir=temp_dir / "cache")
+    mock_replicate_client.predictions.get.side_effect = RuntimeError("404 Not Found")
+    mock_replicate_client.predictions.create.side_effect = [Mock(id="pred-2", status="succeeded", output="ok")]
+    generator._remember_prediction("key", "pred-1")
+
+    assert generator._run_prediction(generator.svd_model, {}, "key") == "ok"
+    mock_replicate_client.predictions.create.assert_called_once()
+    assert generator._prediction_ids == {"key": "pred-2"}
+
+
+def test_generated_image_passed_to_video_model_by_url(temp_dir, sample_scene_plan, mock_replicate_client, replicate_delivery, monkeypatch):
+    """A freshly generated scene image reaches the video model as its delivery URL, not a re-upload"""
+    monkeypatch.setattr('video_generator.replicate.Client', Mock(return_value=mock_replicate_client))
+    generator = VideoGenerator(api_key="test-key")
+    mock_replicate_client.run.side_effect = _replicate_outputs(generator)
+
+    generator.generate_clips(sample_scene_plan, output_dir=temp_dir)
+
+    images = [c.kwargs["input"]["image"] for c in mock_replicate_client.run.call_args_list if c.args[0] == generator.svd_model]
+    assert images == [_IMAGE_URL] * len(sample_scene_plan["scenes"])
+
+
+def test_failed_url_run_falls_back_to_upload(temp_dir, mock_replicate_client, replicate_delivery, monkeypatch):
+    """If the model cannot use the delivery URL, the downloaded bytes are uploaded instead"""
+    monkeypatch.setattr('video_generator.replicate.Client', Mock(return_value=mock_replicate_client))
+    generator = VideoGenerator(api_key="test-key")
+    uploads = []
+
+    def run(model, **kwargs):
+        if model == generator.sdxl_model:
+            return _IMAGE_URL
+        image = kwargs["input"]["image"]
+        if isinstance(image, str):
+            raise RuntimeError("Prediction failed: could not fetch image")
+        uploads.append(image.getvalue())
+        return _VIDEO_URL
+
+    mock_replicate_client.run.side_effect = run
+
+    clip = generator._generate_replicate_video("desc", 6, 1, temp_dir)
+
+    assert uploads == [Path(temp_dir / "t2i_scene_1.jpg").read_bytes()]
+    assert Path(clip).exists()
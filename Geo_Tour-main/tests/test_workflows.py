@@ -1,134 +1,70 @@
 """
 Tests for specific workflows
 """
-import sys
-import os
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
 import pytest
-from unittest.mock import Mock, patch
-from pathlib import Path
 from pipeline import VideoPipeline
 
+_SCENE = {
+    "scene_number": 1,
+    "narration": "Test",
+    "visual_description": "Test visual",
+    "duration": 5
+}
+
+
+def _run_workflow(mocked_pipeline, prompt, scenes, **pipeline_kwargs):
+    """Run the pipeline against the mocked stages with the given scene list"""
+    mocked_pipeline.script.return_value = {"title": "Test", "script": "Test"}
+    mocked_pipeline.scene.return_value = {"scenes": scenes}
+    
+    pipeline = VideoPipeline(
+        openai_api_key="test-key",
+        video_provider="replicate",
+        tts_provider="mock",
+        **pipeline_kwargs
+    )
+    return pipeline.run(prompt)
+
 
-def test_workflow_a_text_to_video(temp_dir, sample_user_prompt):
+def test_workflow_a_text_to_video(mocked_pipeline, temp_dir, sample_user_prompt):
     """Test Workflow A: Direct text-to-video (no storyboard)"""
-    with patch('script_generator.ScriptGenerator.generate') as mock_script:
-        with patch('scene_planner.ScenePlanner.create_plan') as mock_scene:
-            with patch('video_generator.VideoGenerator.generate_clips') as mock_video:
-                with patch('audio_generator.AudioGenerator.generate') as mock_audio:
-                    with patch('video_assembler.VideoAssembler.assemble') as mock_assemble:
-                        # Setup mocks
-                        mock_script.return_value = {"title": "Test", "script": "Test"}
-                        mock_scene.return_value = {
-                            "scenes": [
-                                {
-                                    "scene_number": 1,
-                                    "narration": "Test",
-                                    "visual_description": "Test visual",
-                                    "duration": 5
-                                }
-                            ]
-                        }
-                        mock_video.return_value = [str(temp_dir / "scene_1.mp4")]
-                        mock_audio.return_value = str(temp_dir / "voiceover.mp3")
-                        mock_assemble.return_value = str(temp_dir / "final.mp4")
-                        
-                        # Create files
-                        (temp_dir / "scene_1.mp4").write_text("mock")
-                        (temp_dir / "voiceover.mp3").write_text("mock")
-                        (temp_dir / "final.mp4").write_text("mock")
-                        
-                        pipeline = VideoPipeline(
-                            openai_api_key="test-key",
-                            video_provider="replicate",
-                            tts_provider="mock",
-                            use_storyboard=False
-                        )
-                        
-                        result = pipeline.run(sample_user_prompt)
-                        
-                        assert result["success"] == True
-                        # Verify storyboard was NOT called
-                        assert "storyboard" not in result["project_data"]["steps"]
-                        # Verify video generator was called without storyboard images
-                        mock_video.assert_called_once()
-                        call_args = mock_video.call_args
-                        assert call_args[1].get("storyboard_images") is None
+    mocked_pipeline.video.return_value = str(temp_dir / "scene_1.mp4")
+    mocked_pipeline.assemble.return_value = str(temp_dir / "final.mp4")
+    
+    result = _run_workflow(mocked_pipeline, sample_user_prompt, [dict(_SCENE)], use_storyboard=False)
+    
+    assert result["success"] == True
+    # Verify storyboard was NOT called
+    assert "storyboard" not in result["project_data"]["steps"]
+    mocked_pipeline.storyboard.assert_not_called()
+    # Verify video generator was called without a storyboard image
+    mocked_pipeline.video.assert_called_once()
+    assert mocked_pipeline.video.call_args.args[4] is None
 
 
-def test_workflow_b_storyboard_guided(temp_dir, sample_user_prompt):
+def test_workflow_b_storyboard_guided(mocked_pipeline, temp_dir, sample_user_prompt):
     """Test Workflow B: Storyboard-guided image-to-video"""
-    with patch('video_pipeline.script_generator.ScriptGenerator.generate') as mock_script:
-        with patch('video_pipeline.scene_planner.ScenePlanner.create_plan') as mock_scene:
-            with patch('storyboard_generator.StoryboardGenerator.generate') as mock_storyboard:
-                with patch('video_pipeline.video_generator.VideoGenerator.generate_clips') as mock_video:
-                    with patch('video_pipeline.audio_generator.AudioGenerator.generate') as mock_audio:
-                        with patch('video_pipeline.video_assembler.VideoAssembler.assemble') as mock_assemble:
-                            # Setup mocks
-                            mock_script.return_value = {"title": "Test", "script": "Test"}
-                            mock_scene.return_value = {
-                                "scenes": [
-                                    {
-                                        "scene_number": 1,
-                                        "narration": "Test",
-                                        "visual_description": "Test visual",
-                                        "duration": 5
-                                    }
-                                ]
-                            }
-                            storyboard_images = [str(temp_dir / "storyboard_1.png")]
-                            mock_storyboard.return_value = storyboard_images
-                            mock_video.return_value = [str(temp_dir / "scene_1.mp4")]
-                            mock_audio.return_value = str(temp_dir / "voiceover.mp3")
-                            mock_assemble.return_value = str(temp_dir / "final.mp4")
-                            
-                            # Create files
-                            (temp_dir / "storyboard_1.png").write_text("mock")
-                            (temp_dir / "scene_1.mp4").write_text("mock")
-                            (temp_dir / "voiceover.mp3").write_text("mock")
-                            (temp_dir / "final.mp4").write_text("mock")
-                            
-                            pipeline = VideoPipeline(
-                                openai_api_key="test-key",
-                                video_provider="replicate",
-                                tts_provider="mock",
-                                use_storyboard=True
-                            )
-                            
-                            result = pipeline.run(sample_user_prompt)
-                            
-                            assert result["success"] == True
-                            # Verify storyboard was generated
-                            assert "storyboard" in result["project_data"]["steps"]
-                            mock_storyboard.assert_called_once()
-                            # Verify video generator was called WITH storyboard images
-                            mock_video.assert_called_once()
-                            call_args = mock_video.call_args
-                            assert call_args[1].get("storyboard_images") == storyboard_images
+    storyboard_images = [str(temp_dir / "storyboard_1.png")]
+    mocked_pipeline.storyboard.return_value = storyboard_images
+    mocked_pipeline.video.return_value = str(temp_dir / "scene_1.mp4")
+    mocked_pipeline.assemble.return_value = str(temp_dir / "final.mp4")
+    
+    result = _run_workflow(mocked_pipeline, sample_user_prompt, [dict(_SCENE)], use_storyboard=True)
+    
+    assert result["success"] == True
+    # Verify storyboard was generated
+    assert "storyboard" in result["project_data"]["steps"]
+    mocked_pipeline.storyboard.assert_called_once()
+    # Verify video generator was called WITH the storyboard image
+    mocked_pipeline.video.assert_called_once()
+    assert mocked_pipeline.video.call_args.args[4] == storyboard_images[0]
 
 
-def test_workflow_replicate_provider(temp_dir, sample_user_prompt):
+def test_workflow_replicate_provider(mocked_pipeline, temp_dir, sample_user_prompt):
     """Test workflow with Replicate provider"""
-    with patch('script_generator.ScriptGenerator.generate') as mock_script:
-        with patch('scene_planner.ScenePlanner.create_plan') as mock_scene:
-            with patch('video_generator.VideoGenerator.generate_clips') as mock_video:
-                with patch('audio_generator.AudioGenerator.generate') as mock_audio:
-                    with patch('video_assembler.VideoAssembler.assemble') as mock_assemble:
-                        mock_script.return_value = {"title": "Test", "script": "Test"}
-                        mock_scene.return_value = {"scenes": []}
-                        mock_video.return_value = []
-                        mock_audio.return_value = str(temp_dir / "voiceover.mp3")
-                        mock_assemble.return_value = str(temp_dir / "final.mp4")
-                        
-                        (temp_dir / "voiceover.mp3").write_text("mock")
-                        (temp_dir / "final.mp4").write_text("mock")
-                        
-                        pipeline = VideoPipeline(
-                            openai_api_key="test-key",
-                            video_provider="replicate",
-                            tts_provider="mock"
-                        )
-                        
-                        result = pipeline.run(sample_user_prompt)
-                        assert result["success"] == True
+    mocked_pipeline.video.return_value = str(temp_dir / "scene_1.mp4")
+    mocked_pipeline.assemble.return_value = str(temp_dir / "final.mp4")
+    
+    result = _run_workflow(mocked_pipeline, sample_user_prompt, [dict(_SCENE)])
+    
+    assert result["success"] == True
@@ -3,9 +3,16 @@ Video assembly module - combines clips and audio into final video
 """
 import subprocess
 import os
+import functools
+import json
 import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from config import OUTPUT_DIR, TEMP_DIR
+from config import OUTPUT_DIR, TEMP_DIR, ensure_directories
+
+# Default output/temp locations exist from import on; only custom
+# destinations need a mkdir per call (see _ensure_parent)
+ensure_directories()
 
 
 def safe_print(*args, **kwargs):
@@ -17,48 +24,139 @@ def safe_print(*args, **kwargs):
         pass
 
 
-class VideoAssembler:
-    def __init__(self):
-        self.ffmpeg_cmd = self._find_ffmpeg()
-        self.ffmpeg_available = self._check_ffmpeg()
+def _ensure_parent(path):
+    """Create path's directory unless it is one of the pre-created defaults"""
+    if path.parent not in (OUTPUT_DIR, TEMP_DIR):
+        path.parent.mkdir(exist_ok=True)
+
+
+# Picture-in-picture width: a quarter of the main video, rounded down to an even
+# number so libx264/yuv420p accept it. The expression is the filtergraph form
+# (scale2ref's main_w is the main video), _pip_width the up-front one.
+PIP_WIDTH_EXPR = "trunc(main_w/8)*2"
+
+
+def _pip_width(main_width):
+    return (main_width // 4) & ~1
+
+
+@functools.lru_cache(maxsize=4)
+def _locate_ffmpeg(path_env, ffmpeg_path_env):
+    """
+    Resolve the ffmpeg executable
+    
+    Cached per (PATH, FFMPEG_PATH) pair so repeated VideoAssembler()
+    constructions skip the PATH walk, while changing either variable
+    still triggers a fresh search.
+    """
+    # Honor explicit env var
+    p = ffmpeg_path_env.strip()
+    if p:
+        exe = p
+        if os.path.isdir(p):
+            exe = os.path.join(p, "ffmpeg.exe") if os.name == "nt" else os.path.join(p, "ffmpeg")
+        if os.path.isfile(exe):
+            return exe
+    # Search PATH
+    found = shutil.which("ffmpeg", path=path_env or None)
+    if found:
+        return found
+    # Common Windows locations
+    candidates = [
+        r"C:\\ffmpeg\\bin\\ffmpeg.exe",
+        r"C:\\Program Files\\ffmpeg\\bin\\ffmpeg.exe",
+        r"C:\\Program Files (x86)\\ffmpeg\\bin\\ffmpeg.exe"
+    ]
+    for c in candidates:
+        if os.path.isfile(c):
+            return c
+    return None
+
+
+@functools.lru_cache(maxsize=1)
+def _check_ffmpeg(ffmpeg_cmd, runner):
+    """Run `ffmpeg -version` once per resolved executable"""
+    try:
+        if not ffmpeg_cmd:
+            return False
+        runner(
+            [ffmpeg_cmd, "-version"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True
+        )
+        return True
+    except Exception:
+        return False
+
+
+# Hardware H.264 encoders in order of preference, with their extra options
+HW_ENCODERS = {
+    "h264_nvenc": ["-preset", "p4", "-tune", "hq"],  # NVIDIA
+    "h264_qsv": [],  # Intel Quick Sync
+    "h264_videotoolbox": [],  # macOS
+    "h264_amf": [],  # AMD
+}
+
+
+@functools.lru_cache(maxsize=1)
+def _detect_hw_encoder(ffmpeg_cmd, runner):
+    """
+    Pick the first hardware H.264 encoder that actually works, else libx264
+    
+    `ffmpeg -encoders` only lists what the build supports, so each candidate is
+    confirmed with a tiny test encode before it is used (e.g. nvenc builds on
+    machines without an NVIDIA GPU).
+    """
+    if not ffmpeg_cmd:
+        return "libx264"
+    try:
+        result = runner(
+            [ffmpeg_cmd, "-hide_banner", "-encoders"],
+            check=True, capture_output=True, text=True
+        )
+        listed = result.stdout
+    except Exception:
+        return "libx264"
     
-    def _check_ffmpeg(self):
+    for encoder in HW_ENCODERS:
+        if encoder not in listed:
+            continue
         try:
-            if not self.ffmpeg_cmd:
-                return False
-            subprocess.run(
-                [self.ffmpeg_cmd, "-version"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                check=True
+            runner(
+                [ffmpeg_cmd, "-hide_banner", "-loglevel", "error",
+                 "-f", "lavfi", "-i", "color=c=black:s=256x256:d=0.1",
+                 "-c:v", encoder, "-f", "null", "-"],
+                check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=15
             )
-            return True
+            return encoder
         except Exception:
-            return False
+            continue
+    return "libx264"
 
-    def _find_ffmpeg(self):
-        # Honor explicit env var
-        p = os.getenv("FFMPEG_PATH", "").strip()
-        if p:
-            exe = p
-            if os.path.isdir(p):
-                exe = os.path.join(p, "ffmpeg.exe") if os.name == "nt" else os.path.join(p, "ffmpeg")
-            if os.path.isfile(exe):
-                return exe
-        # Search PATH
-        found = shutil.which("ffmpeg")
-        if found:
-            return found
-        # Common Windows locations
-        candidates = [
-            r"C:\\ffmpeg\\bin\\ffmpeg.exe",
-            r"C:\\Program Files\\ffmpeg\\bin\\ffmpeg.exe",
-            r"C:\\Program Files (x86)\\ffmpeg\\bin\\ffmpeg.exe"
-        ]
-        for c in candidates:
-            if os.path.isfile(c):
-                return c
-        return None
+
+class VideoAssembler:
+    def __init__(self, runner=None):
+        """
+        Args:
+            runner: Callable with subprocess.run's signature used for every
+                    ffmpeg/ffprobe invocation (defaults to subprocess.run)
+        """
+        # Resolved at call time rather than as a default argument so that
+        # patching subprocess.run still reaches the assembler
+        self.runner = runner or subprocess.run
+        self.ffmpeg_cmd = _locate_ffmpeg(os.environ.get("PATH", ""), os.getenv("FFMPEG_PATH", ""))
+        # A resolved binary is enough here; `ffmpeg -version` runs on first use
+        self.ffmpeg_available = self.ffmpeg_cmd is not None
+        # Let the full-resolution re-encode use every core (filters + encoder)
+        cpu_count = str(os.cpu_count() or 1)
+        self.thread_args = ["-filter_threads", cpu_count, "-filter_complex_threads", cpu_count]
+        self.ffprobe_cmd = self._find_ffprobe()
+    
+    @functools.cached_property
+    def _ffmpeg_verified(self):
+        """Whether the resolved ffmpeg actually runs (checked lazily, once)"""
+        return _check_ffmpeg(self.ffmpeg_cmd, self.runner)
     
     def assemble(self, clip_paths, audio_path, output_path=None, face_rig_videos=None):
         """
@@ -73,115 +171,280 @@ class VideoAssembler:
         Returns:
             str: Path to assembled video
         """
-        if not self.ffmpeg_available:
+        if not (self.ffmpeg_available and self._ffmpeg_verified):
             return self._mock_assemble(clip_paths, audio_path, output_path)
         
         output_path = output_path or str(OUTPUT_DIR / "final_video.mp4")
         output_path = Path(output_path)
-        output_path.parent.mkdir(exist_ok=True)
+        _ensure_parent(output_path)
         
         safe_print("🎞️  Assembling video...")
         
         try:
-            # Step 1: Concatenate video clips
-            concat_path = TEMP_DIR / "concatenated.mp4"
-            self._concatenate_clips(clip_paths, concat_path)
-            
-            # Step 2: Add face_rig overlay if provided
             if face_rig_videos:
+                # Concat, overlay and audio mux in a single ffmpeg pass
                 safe_print("🎭 Adding face_rig picture-in-picture overlay...")
-                with_overlay_path = TEMP_DIR / "with_overlay.mp4"
-                self._add_face_rig_overlay(concat_path, face_rig_videos, with_overlay_path)
-                concat_path = with_overlay_path
-            
-            # Step 3: Add audio to video
-            self._add_audio(concat_path, audio_path, output_path)
-            
-            # Cleanup temp files
-            if (TEMP_DIR / "concatenated.mp4").exists():
-                (TEMP_DIR / "concatenated.mp4").unlink()
-            if (TEMP_DIR / "with_overlay.mp4").exists():
-                (TEMP_DIR / "with_overlay.mp4").unlink()
+                self._compose_with_overlay(clip_paths, face_rig_videos, audio_path, output_path)
+            else:
+                # No re-encode needed: stream-copy the clips and mux the audio in one go
+                self._concatenate_clips(clip_paths, output_path, audio_path=audio_path)
             
             safe_print(f"✅ Video assembled: {output_path}")
             return str(output_path)
             
         except Exception as e:
             safe_print(f"❌ Assembly failed: {e}")
+            # With -loglevel error, stderr holds only ffmpeg's actual error lines
+            stderr = getattr(e, "stderr", None)
+            if isinstance(stderr, bytes):
+                safe_print(stderr.decode("utf-8", errors="replace").strip())
             return self._mock_assemble(clip_paths, audio_path, output_path)
     
-    def _concatenate_clips(self, clip_paths, output_path):
-        """Concatenate multiple video clips"""
-        # Create file list for ffmpeg
-        list_path = TEMP_DIR / "clips_list.txt"
+    def _find_ffprobe(self):
+        """Locate ffprobe next to the resolved ffmpeg binary, falling back to PATH"""
+        if self.ffmpeg_cmd:
+            ffmpeg_path = Path(self.ffmpeg_cmd)
+            candidate = ffmpeg_path.with_name(ffmpeg_path.name.replace("ffmpeg", "ffprobe"))
+            if candidate.is_file():
+                return str(candidate)
+        return shutil.which("ffprobe")
+    
+    def _probe(self, clip):
+        """
+        Read the first video stream's format
+        
+        Returns:
+            tuple: (codec_name, width, height, r_frame_rate), or None if unreadable
+        """
+        cmd = [
+            self.ffprobe_cmd,
+            "-v", "error",
+            "-select_streams", "v:0",
+            "-show_entries", "stream=codec_name,width,height,r_frame_rate",
+            "-of", "json",
+            str(clip)
+        ]
+        try:
+            result = self.runner(cmd, check=True, capture_output=True, text=True)
+            streams = json.loads(result.stdout).get("streams", [])
+        except Exception:
+            return None
+        if not streams:
+            return None
+        stream = streams[0]
+        return (stream.get("codec_name"), stream.get("width"), stream.get("height"), stream.get("r_frame_rate"))
+    
+    def _normalize_clips(self, clip_paths, prefix):
+        """
+        Make clips safe for stream-copy concatenation
         
-        with open(list_path, 'w', encoding='utf-8') as f:
-            for clip in clip_paths:
-                # Escape single quotes and write path
-                escaped_path = str(Path(clip)).replace("'", "'\\''")
-                f.write(f"file '{escaped_path}'\n")
+        Clips sharing codec, resolution and frame rate are returned untouched.
+        Otherwise every clip is re-encoded to the first clip's format, with the
+        ffmpeg jobs running in parallel (the work happens in the child processes).
         
-        # Concatenate using ffmpeg
+        Returns:
+            tuple: (paths to concatenate, list of temporary files to clean up)
+        """
+        if not self.ffprobe_cmd or len(clip_paths) < 2:
+            return list(clip_paths), []
+        
+        with ThreadPoolExecutor(max_workers=min(len(clip_paths), os.cpu_count() or 1)) as executor:
+            formats = list(executor.map(self._probe, clip_paths))
+        
+        if None in formats or len(set(formats)) == 1:
+            return list(clip_paths), []
+        
+        _, width, height, frame_rate = formats[0]
+        safe_print(f"  ⚙️  Normalizing {len(clip_paths)} clips with mixed formats to {width}x{height}...")
+        
+        normalized = [TEMP_DIR / f"{prefix}_normalized_{i}.mp4" for i in range(len(clip_paths))]
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+            futures = [
+                executor.submit(self._normalize_clip, clip, out, width, height, frame_rate)
+                for clip, out in zip(clip_paths, normalized)
+            ]
+            for future in as_completed(futures):
+                future.result()
+        
+        return [str(p) for p in normalized], normalized
+    
+    def _normalize_clip(self, clip, output_path, width, height, frame_rate):
+        """Re-encode a single clip to the target resolution and frame rate"""
         cmd = [
             self.ffmpeg_cmd, "-y",
-            "-f", "concat",
-            "-safe", "0",
-            "-i", str(list_path),
-            "-c", "copy",
+            "-loglevel", "error",
+            "-i", str(clip),
+            "-vf", f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                   f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={frame_rate}",
+            "-c:v", "libx264",
+            "-preset", "ultrafast",
+            "-pix_fmt", "yuv420p",
+            "-an",
             str(output_path)
         ]
+        self.runner(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    
+    def _concatenate_clips(self, clip_paths, output_path, audio_path=None):
+        """
+        Concatenate multiple video clips with stream copy
         
-        subprocess.run(cmd, check=True, capture_output=True)
+        Args:
+            clip_paths: List of video clip paths
+            output_path: Path for the concatenated video
+            audio_path: Optional audio track to mux in the same pass
+        """
+        clip_paths, normalized = self._normalize_clips(clip_paths, Path(output_path).stem)
         
-        # Cleanup
-        list_path.unlink()
-    
-    def _add_audio(self, video_path, audio_path, output_path):
-        """Add audio track to video"""
+        # Build the concat list in memory and feed it on stdin. Paths are made
+        # absolute since there is no list file for ffmpeg to resolve them against.
+        list_content = "".join(
+            "file '" + os.path.abspath(clip).replace("'", "'\\''") + "'\n"  # Escape single quotes
+            for clip in clip_paths
+        )
+        
+        # Concatenate using ffmpeg
         cmd = [
             self.ffmpeg_cmd, "-y",
-            "-i", str(video_path),
-            "-i", str(audio_path),
-            "-c:v", "copy",
-            "-c:a", "aac",
-            "-shortest",  # Match to shortest input (video or audio)
-            str(output_path)
+            "-loglevel", "error",
+            "-protocol_whitelist", "pipe,file",
+            "-f", "concat",
+            "-safe", "0",
+            "-i", "pipe:0",
         ]
+        if audio_path:
+            cmd += [
+                "-i", str(audio_path),
+                "-map", "0:v",
+                "-map", "1:a",
+                "-c:v", "copy",
+                "-c:a", "aac",
+                "-shortest",  # Match to shortest input (video or audio)
+            ]
+        else:
+            cmd += ["-c", "copy"]
+        cmd.append(str(output_path))
         
-        subprocess.run(cmd, check=True, capture_output=True)
+        try:
+            self.runner(
+                cmd,
+                input=list_content.encode("utf-8"),
+                check=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE
+            )
+        finally:
+            # Cleanup
+            for path in normalized:
+                path.unlink(missing_ok=True)
     
-    def _add_face_rig_overlay(self, main_video_path, face_rig_videos, output_path):
+    def _compose_with_overlay(self, clip_paths, face_rig_videos, audio_path, output_path):
         """
-        Add face_rig videos as picture-in-picture overlays in the bottom right
+        Build the final video with face_rig picture-in-picture in one final ffmpeg pass
+        
+        Main clips are concatenated with the concat filter, the face_rig track is
+        overlaid in the bottom right, and the audio is mapped in, so the decoded
+        main video never round-trips through temp files. The face_rig track is
+        prepared (concatenated and shrunk to PiP size) concurrently with main clip
+        normalization, so the final filtergraph carries no scaler.
         
         Args:
-            main_video_path: Path to main video
+            clip_paths: List of main video clip paths
             face_rig_videos: List of face_rig video paths (one per scene)
-            output_path: Path for output video with overlay
+            audio_path: Path to audio file
+            output_path: Path for final output video
         """
-        # First, concatenate face_rig videos
-        face_rig_concat_path = TEMP_DIR / "face_rig_concatenated.mp4"
-        self._concatenate_clips(face_rig_videos, face_rig_concat_path)
+        main_format = self._probe(clip_paths[0]) if self.ffprobe_cmd else None
+        main_width = main_format[1] if main_format else None
         
-        # Now overlay the concatenated face_rig video on the main video
-        # Position in bottom right corner, scaled to 25% of main video width
-        # Using overlay filter with positioning
-        cmd = [
-            self.ffmpeg_cmd, "-y",
-            "-i", str(main_video_path),  # Main video
-            "-i", str(face_rig_concat_path),  # Overlay video
-            "-filter_complex",
-            "[1:v]scale=iw*0.25:-1[overlay];"  # Scale overlay to 25% width
-            "[0:v][overlay]overlay=main_w-overlay_w-20:main_h-overlay_h-20",  # Position bottom-right with 20px margin
-            "-c:a", "copy",  # Copy audio from main video
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            main_future = executor.submit(self._normalize_clips, clip_paths, "main")
+            overlay_future = executor.submit(self._prepare_overlay, face_rig_videos, main_width)
+            clip_paths, main_normalized = main_future.result()
+            overlay_inputs, overlay_temporary, prescaled = overlay_future.result()
+        
+        num_clips = len(clip_paths)
+        num_overlay = len(overlay_inputs)
+        audio_index = num_clips + num_overlay
+        
+        cmd = [self.ffmpeg_cmd, "-y", "-loglevel", "error", *self.thread_args]
+        for path in list(clip_paths) + list(overlay_inputs) + [audio_path]:
+            cmd += ["-i", str(path)]
+        
+        main_inputs = "".join(f"[{i}:v]" for i in range(num_clips))
+        filter_graph = f"{main_inputs}concat=n={num_clips}:v=1:a=0[main];"
+        if prescaled:
+            base_label, overlay_label = "[main]", f"[{num_clips}:v]"
+        else:
+            # Main width unknown up front: concat the face_rig clips in the graph and
+            # scale them against the main video, to the same size as the prescaled path
+            face_rig_inputs = "".join(f"[{num_clips + j}:v]" for j in range(num_overlay))
+            filter_graph += (
+                f"{face_rig_inputs}concat=n={num_overlay}:v=1:a=0[face_rig];"
+                f"[face_rig][main]scale2ref=w={PIP_WIDTH_EXPR}:h=-2[overlay][base];"
+            )
+            base_label, overlay_label = "[base]", "[overlay]"
+        filter_graph += f"{base_label}{overlay_label}overlay=main_w-overlay_w-20:main_h-overlay_h-20[out]"  # Bottom-right, 20px margin
+        
+        cmd += [
+            "-filter_complex", filter_graph,
+            "-map", "[out]",
+            "-map", f"{audio_index}:a",
+            *self._video_encoder_args(),
+            "-threads", "0",
+            "-c:a", "aac",
+            "-shortest",
             str(output_path)
         ]
         
-        subprocess.run(cmd, check=True, capture_output=True)
+        try:
+            self.runner(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        finally:
+            for path in main_normalized + overlay_temporary:
+                path.unlink(missing_ok=True)
+    
+    def _prepare_overlay(self, face_rig_videos, main_width):
+        """
+        Get the face_rig clips ready to be overlaid
+        
+        Returns:
+            tuple: (overlay input paths, temporary files to clean up, whether the
+                    overlay is already concatenated and scaled to PiP size)
+        """
+        face_rig_videos, temporary = self._normalize_clips(face_rig_videos, "face_rig")
+        if not main_width:
+            return face_rig_videos, temporary, False
+        
+        scaled_path = TEMP_DIR / "face_rig_scaled.mp4"
+        temporary = temporary + [scaled_path]
+        num_face_rig = len(face_rig_videos)
         
-        # Cleanup
-        if face_rig_concat_path.exists():
-            face_rig_concat_path.unlink()
+        cmd = [self.ffmpeg_cmd, "-y", "-loglevel", "error"]
+        for path in face_rig_videos:
+            cmd += ["-i", str(path)]
+        face_rig_inputs = "".join(f"[{j}:v]" for j in range(num_face_rig))
+        cmd += [
+            "-filter_complex",
+            f"{face_rig_inputs}concat=n={num_face_rig}:v=1:a=0,scale={_pip_width(main_width)}:-2[pip]",
+            "-map", "[pip]",
+            "-c:v", "libx264",
+            "-preset", "ultrafast",
+            "-an",
+            str(scaled_path)
+        ]
+        try:
+            self.runner(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        except Exception:
+            for path in temporary:
+                path.unlink(missing_ok=True)
+            raise
+        return [str(scaled_path)], temporary, True
+    
+    def _video_encoder_args(self):
+        """Encoder options for re-encoding passes, preferring a hardware encoder"""
+        encoder = _detect_hw_encoder(self.ffmpeg_cmd, self.runner)
+        if encoder != "libx264":
+            safe_print(f"  ⚡ Using hardware encoder: {encoder}")
+        return ["-c:v", encoder, *HW_ENCODERS.get(encoder, [])]
     
     def _mock_assemble(self, clip_paths, audio_path, output_path):
         """
@@ -190,7 +453,7 @@ class VideoAssembler:
         """
         output_path = output_path or str(OUTPUT_DIR / "final_video.txt")
         output_path = Path(output_path)
-        output_path.parent.mkdir(exist_ok=True)
+        _ensure_parent(output_path)
         
         with open(output_path, 'w', encoding='utf-8') as f:
             f.write("Mock Final Video\n")
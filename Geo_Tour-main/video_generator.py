@@ -5,35 +5,441 @@ Generates clips per scene using:
 - Image-to-Video: stability-ai/stable-video-diffusion
 - Matplotlib diagrams with animations
 """
+import ast
+import functools
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import subprocess
+import threading
+import uuid
 import replicate
 import requests
 import time
+from requests.adapters import HTTPAdapter
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from email.utils import parsedate_to_datetime
 from pathlib import Path
+from PIL import Image
+try:
+    # SIMD base64 decoder; the stdlib module has the same b64decode signature
+    import pybase64 as _b64
+except ImportError:
+    import base64 as _b64
 from config import (
+    CACHE_DIR,
     REPLICATE_API_KEY,
     STABILITY_MODEL,
     STORYBOARD_MODEL,
     TEMP_DIR,
     GEMINI_API_KEY,
 )
+from storyboard_generator import _is_retryable
+
+
+_RATE_LIMITED = re.compile(r"429|rate limit", re.IGNORECASE)
+
+# Reused read buffer size for streaming downloads to disk
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+_DATA_URL_PNG_PREFIX = "data:image/png;base64,"
+
+
+def _sniff_image_format(data):
+    """PIL format name from the file signature, without decoding; None if unrecognized"""
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "PNG"
+    if data[:3] == b"\xff\xd8\xff":
+        return "JPEG"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+# zlib level for intermediate PNGs; Pillow's default of 6 dominates re-encode time
+PNG_COMPRESS_LEVEL = 1
+
+# Gemini model that writes the matplotlib code for diagram scenes
+DIAGRAM_MODEL = "gemini-3-pro-preview"
+# Diagram frames are rendered as raw RGB and piped straight into ffmpeg
+DIAGRAM_WIDTH, DIAGRAM_HEIGHT, DIAGRAM_FPS = 1920, 1080, 24
+
+# Gemini model that draws the frames of 3D visualization slideshows
+SLIDESHOW_MODEL = "gemini-3-pro-image-preview"
+
+# Image-to-video request profiles. SVD runs at 6 fps and needs the XT variant
+# from 25 frames (~4.2 s) up; the tag for every clamped frame count is precomputed.
+SVD_FPS = 6
+_SVD_VIDEO_LENGTHS = {
+    frames: "25_frames_with_svd_xt" if frames >= 25 else "14_frames_with_svd"
+    for frames in range(14, 26)
+}
+SEEDANCE_MIN_DURATION = 2
+SEEDANCE_MAX_DURATION = 12
+# Per-model inputs that do not depend on the scene
+_SEEDANCE_INPUT = {"resolution": "1080p", "aspect_ratio": "16:9", "fps": 24, "camera_fixed": False}
+_SVD_INPUT = {
+    "frames_per_second": SVD_FPS,
+    "sizing_strategy": "maintain_aspect_ratio",
+    "motion_bucket_id": 127,
+    "cond_aug": 0.02,
+    "decoding_t": 14
+}
+
+# Encodings for the intermediate text-to-image file: PIL format, suffix, save options.
+# The file is only uploaded to image-to-video and cached, so JPEG's encode speed wins;
+# PNG stays available for lossless input.
+IMAGE_ENCODINGS = {
+    "jpeg": ("JPEG", ".jpg", {"quality": 92, "subsampling": 0}),
+    "png": ("PNG", ".png", {"optimize": False, "compress_level": PNG_COMPRESS_LEVEL}),
+}
+
+# Longest computed backoff; a server-provided Retry-After is honored as-is
+MAX_RETRY_WAIT = 60
+
+
+def _retry_after(exc):
+    """Seconds to wait from an exception's Retry-After header, or None"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    value = headers.get("Retry-After") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _stream_to_file(resp, f):
+    """
+    Copy a streamed response body into an open binary file.
+
+    The body is read into one reused buffer rather than a fresh bytes object per
+    chunk, and the file is preallocated when the final size is known up front.
+    TLS keeps decryption in userspace, so a socket-to-file sendfile isn't possible.
+    Writes stay buffered (no O_DIRECT): the assembler reads every clip straight
+    back, and the page cache is what serves that read.
+    """
+    length = resp.headers.get("Content-Length")
+    encoding = resp.headers.get("Content-Encoding", "identity")
+    if length and length.isdigit() and encoding == "identity" and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(f.fileno(), 0, int(length))
+        except OSError:
+            pass  # Not supported on this filesystem; the writes extend the file anyway
+    buffer = bytearray(DOWNLOAD_CHUNK_SIZE)
+    view = memoryview(buffer)
+    written = 0
+    while True:
+        n = resp.raw.readinto(buffer)
+        if not n:
+            break
+        f.write(view[:n])
+        written += n
+    # Drop any preallocated tail if the body came up short
+    f.truncate(written)
+    return written
+
+
+try:
+    from replicate.helpers import FileOutput as _FILE_OUTPUT_CLS
+except Exception:
+    _FILE_OUTPUT_CLS = None
+
+# Keys probed, in priority order, when pulling a URL or image out of model output
+_URL_ITEM_KEYS = ("url", "image", "video")
+_URL_DICT_KEYS = ("output", "url", "image", "video")
+_IMAGE_ITEM_KEYS = ("url", "image", "image_url", "base64", "image_base64", "data", "content")
+_IMAGE_DICT_KEYS = ("output", "url", "image", "image_url", "base64", "image_base64", "images", "data", "content")
+
+
+def _fingerprint(model, inputs):
+    """Stable hash of a model call: sha256 of the model and its sorted JSON inputs"""
+    payload = json.dumps([model, inputs], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _first_present(item, keys):
+    """Value of the first key present in item, else None"""
+    return next((item[k] for k in keys if k in item), None)
+
+
+def _url_from_list(data):
+    first = data[0] if data else None
+    if isinstance(first, dict):
+        return _first_present(first, _URL_ITEM_KEYS)
+    return first if isinstance(first, str) else None
+
+
+def _url_from_dict(data):
+    for k in _URL_DICT_KEYS:
+        v = data.get(k)
+        if isinstance(v, str):
+            return v
+        if isinstance(v, list) and v:
+            if isinstance(v[0], str):
+                return v[0]
+            if isinstance(v[0], dict):
+                return v[0].get("url")
+    return None
+
+
+def _image_from_list(output):
+    item = output[0] if output else None
+    if isinstance(item, dict):
+        return _first_present(item, _IMAGE_ITEM_KEYS)
+    if isinstance(item, str) or (_FILE_OUTPUT_CLS and isinstance(item, _FILE_OUTPUT_CLS)):
+        return item
+    return None
+
+
+def _image_from_dict(output):
+    images = output.get("images")
+    if isinstance(images, list) and images and isinstance(images[0], dict):
+        val = images[0].get("content") or images[0].get("url")
+        if val:
+            return val
+    for k in _IMAGE_DICT_KEYS:
+        v = output.get(k)
+        if isinstance(v, str):
+            return v
+        if isinstance(v, list) and v:
+            if isinstance(v[0], str):
+                return v[0]
+            if isinstance(v[0], dict):
+                val = _first_present(v[0], _IMAGE_ITEM_KEYS)
+                if val:
+                    return val
+    return None
+
+
+def _identity(value):
+    return value
+
+
+_URL_EXTRACTORS = {str: _identity, list: _url_from_list, dict: _url_from_dict}
+_IMAGE_EXTRACTORS = {str: _identity, list: _image_from_list, dict: _image_from_dict}
+if _FILE_OUTPUT_CLS:
+    _IMAGE_EXTRACTORS[_FILE_OUTPUT_CLS] = _identity
+
+
+def _dispatch_output(extractors, output):
+    """Run the extractor for output's type; one dict lookup for the exact built-in types"""
+    extract = extractors.get(type(output))
+    if extract is None:
+        extract = next((fn for cls, fn in extractors.items() if isinstance(output, cls)), None)
+    return extract(output) if extract else None
+
+
+# Text properties Gemini keeps inventing; matplotlib only rejects them mid-render
+_INVALID_MPL_PROPERTIES = {"letter_spacing", "text_spacing"}
+
+
+def _check_diagram_code(code, filename):
+    """
+    Static checks on generated diagram code, run before any frame is rendered
+
+    Failures raise RuntimeError with a message meant for the retry prompt, so
+    Gemini can fix the code without a pool of workers hitting the same error.
+    """
+    try:
+        tree = ast.parse(code, filename)
+    except SyntaxError as e:
+        raise RuntimeError(f"Code execution failed: {e}")
+
+    if not any(isinstance(node, ast.FunctionDef) and node.name == "render_frame" for node in tree.body):
+        raise RuntimeError("Generated code does not contain a top-level 'render_frame' function")
+
+    used = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.keyword):
+            used.add(node.arg)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+            used.add(node.value)
+    invalid = sorted(used & _INVALID_MPL_PROPERTIES)
+    if invalid:
+        raise RuntimeError(f"Generated code uses invalid matplotlib properties: {', '.join(invalid)}. Remove them.")
+
+
+# render_frame of each generated diagram script, loaded once per Pool worker
+_frame_renderers = {}
+
+
+def _render_diagram_frame(code_path, frame):
+    """Pool task: draw one frame of the diagram script at code_path as packed RGB bytes"""
+    render_frame = _frame_renderers.get(code_path)
+    if render_frame is None:
+        namespace = {"__name__": "__diagram__"}
+        exec(compile(Path(code_path).read_text(), code_path, "exec"), namespace)
+        if "render_frame" not in namespace:
+            raise RuntimeError("Generated code does not contain 'render_frame' function")
+        render_frame = _frame_renderers[code_path] = namespace["render_frame"]
+
+    # Drop the alpha channel if the script returned buffer_rgba() as-is
+    pixels = render_frame(frame)[..., :3]
+    if pixels.shape != (DIAGRAM_HEIGHT, DIAGRAM_WIDTH, 3):
+        raise RuntimeError(
+            f"render_frame returned shape {pixels.shape}, expected ({DIAGRAM_HEIGHT}, {DIAGRAM_WIDTH}, 3)"
+        )
+    return pixels.astype("uint8", copy=False).tobytes()
+
+
+# Scenes run on worker threads; one line at a time keeps their progress readable
+_print_lock = threading.Lock()
 
 
 def safe_print(*args, **kwargs):
     """Safely print messages, handling closed file errors in Streamlit"""
     try:
-        print(*args, **kwargs)
+        with _print_lock:
+            print(*args, **kwargs)
     except (IOError, OSError, ValueError):
         # Silently fail if stdout is closed (Streamlit context)
         pass
 
 
 class VideoGenerator:
-    def __init__(self, api_key=None, svd_model=None, sdxl_model=None, max_retries=3, retry_delay=5):
+    # Smoothed interval between recent 429s across all generators in the process
+    _rate_limit_lock = threading.Lock()
+    _last_rate_limit = None
+    _rate_limit_interval = None
+
+    def __init__(self, api_key=None, svd_model=None, sdxl_model=None, max_retries=3, retry_delay=5, max_parallel=4,
+                 enable_cache=False, cache_dir=None, image_format="jpeg"):
         self.api_key = api_key or REPLICATE_API_KEY
         self.svd_model = svd_model or STABILITY_MODEL
         self.sdxl_model = sdxl_model or STORYBOARD_MODEL
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.max_parallel = max(1, max_parallel)
+        # Caps in-flight predictions across generate_clips and direct _generate_clip callers
+        self._replicate_slots = threading.Semaphore(self.max_parallel)
+        # Keep-alive pool shared by concurrent scene downloads; each scene thread
+        # streams its own clip, so the pool must hold one connection per scene
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=max(16, self.max_parallel))
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        # Content-addressed store of generated images/clips, keyed by model + inputs
+        self.enable_cache = enable_cache
+        self.cache_dir = Path(cache_dir or CACHE_DIR)
+        # Input fingerprint + scene -> id of its image-to-video prediction, so a retry
+        # resumes that prediction; persisted with the cache to survive a re-run
+        self._predictions_lock = threading.Lock()
+        self._prediction_ids = self._load_prediction_ids()
+        # Text-to-image path -> the delivery URL its bytes came from, which the
+        # image-to-video run can take directly instead of a re-upload
+        self._hosted_images = {}
+        if image_format not in IMAGE_ENCODINGS:
+            raise ValueError(f"Image format '{image_format}' not supported. Available: {list(IMAGE_ENCODINGS.keys())}")
+        self.image_format = image_format
+
+    @functools.cached_property
+    def _client(self):
+        """Replicate client shared by every scene"""
+        replicate_key = self.api_key or REPLICATE_API_KEY
+        if not replicate_key:
+            raise RuntimeError("Replicate API key is required")
+        return replicate.Client(api_token=replicate_key)
+
+    @functools.cached_property
+    def _genai(self):
+        """google.generativeai, configured once for every Gemini scene"""
+        import google.generativeai as genai
+
+        if not GEMINI_API_KEY:
+            raise RuntimeError("Gemini API key required. Set GEMINI_API_KEY in Streamlit secrets or environment variable")
+        genai.configure(api_key=GEMINI_API_KEY)
+        return genai
+
+    @functools.cached_property
+    def _diagram_model(self):
+        """Gemini model shared by every diagram scene and retry"""
+        return self._genai.GenerativeModel(DIAGRAM_MODEL)
+
+    @functools.cached_property
+    def _slideshow_model(self):
+        """Gemini image model shared by every 3D visualization scene"""
+        return self._genai.GenerativeModel(SLIDESHOW_MODEL)
+
+    def _run_model(self, model, **kwargs):
+        """Run a Replicate model, waiting for a free slot first"""
+        with self._replicate_slots:
+            return self._client.run(model, **kwargs)
+
+    def _run_prediction(self, model, inputs, key):
+        """
+        Run a Replicate model as an explicit prediction and return its output
+
+        The prediction id is registered under key before polling, so a
+        retry after a dropped poll picks the same prediction back up instead of
+        paying for another inference. Failed, canceled or unreachable ones are
+        started afresh.
+        """
+        with self._replicate_slots:
+            prediction = None
+            prediction_id = self._prediction_ids.get(key)
+            if prediction_id:
+                try:
+                    prediction = self._client.predictions.get(prediction_id)
+                except Exception as e:
+                    # e.g. a 404 once Replicate has expired the prediction
+                    safe_print(f"    ⚠️  Could not resume prediction {prediction_id} ({e}); starting a new one")
+                    self._remember_prediction(key, None)
+                else:
+                    if prediction.status in ("failed", "canceled"):
+                        prediction = None
+                    else:
+                        safe_print(f"    ♻️  Resuming prediction {prediction_id}")
+            if prediction is None:
+                if ":" in model:
+                    prediction = self._client.predictions.create(version=model.split(":", 1)[1], input=inputs)
+                else:
+                    prediction = self._client.predictions.create(model=model, input=inputs)
+                self._remember_prediction(key, prediction.id)
+            prediction.wait()
+        if prediction.status != "succeeded":
+            self._remember_prediction(key, None)
+            raise RuntimeError(f"Prediction {prediction.id} {prediction.status}: {prediction.error}")
+        return prediction.output
+
+    @property
+    def _predictions_file(self):
+        return self.cache_dir / "predictions.json"
+
+    def _load_prediction_ids(self):
+        """Predictions left in flight by an earlier run; only kept when caching is on"""
+        if not self.enable_cache:
+            return {}
+        try:
+            return json.loads(self._predictions_file.read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _remember_prediction(self, key, prediction_id):
+        """Register (or with None, forget) the prediction for key"""
+        with self._predictions_lock:
+            if prediction_id is None:
+                if self._prediction_ids.pop(key, None) is None:
+                    return
+            else:
+                self._prediction_ids[key] = prediction_id
+            if not self.enable_cache:
+                return
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            staging = self.cache_dir / f".predictions.{uuid.uuid4().hex}.json"
+            staging.write_text(json.dumps(self._prediction_ids))
+            os.replace(staging, self._predictions_file)
     
     def generate_clips(self, scene_plan, output_dir=None, storyboard_images=None):
         """
@@ -51,37 +457,130 @@ class VideoGenerator:
         output_dir = Path(output_dir)
         output_dir.mkdir(exist_ok=True)
         
-        safe_print(f"🎥 Generating {len(scene_plan['scenes'])} video clips...")
+        scenes = scene_plan['scenes']
+        safe_print(f"🎥 Generating {len(scenes)} video clips...")
         
-        clip_paths = []
+        clip_paths = [None] * len(scenes)
         
-        for idx, scene in enumerate(scene_plan['scenes']):
-            scene_type = scene.get('scene_type', 'video')
-            type_icon = "📊" if scene_type == "diagram" else "🎥"
-            safe_print(f"  {type_icon} Scene {scene['scene_number']} ({scene_type}): {scene['visual_description'][:50]}...")
-
-            # Get corresponding storyboard image if available
-            storyboard_image = None
-            if storyboard_images and idx < len(storyboard_images):
-                storyboard_image = storyboard_images[idx]
-
-            clip_path = self._generate_clip(
-                description=scene['visual_description'],
-                duration=scene['duration'],
-                scene_number=scene['scene_number'],
-                output_dir=output_dir,
-                storyboard_image=storyboard_image,
-                scene_type=scene_type
-            )
-
-            clip_paths.append(clip_path)
+        # Two-stage pipeline: text-to-image jobs are submitted up front, and each
+        # scene's image-to-video job starts as soon as its own image is ready
+        workers = max(1, min(len(scenes), self.max_parallel))
+        with ThreadPoolExecutor(max_workers=workers) as image_pool, \
+                ThreadPoolExecutor(max_workers=workers) as video_pool:
+            scene_images = self._submit_scene_images(image_pool, scenes, output_dir, storyboard_images)
+            if any(scene.get('scene_type', 'video') == "diagram" for scene in scenes):
+                # Import and configure Gemini while the image jobs run; the first diagram
+                # scene re-raises any setup error itself, so the Future is not awaited
+                image_pool.submit(lambda: self._diagram_model)
+            futures = {}
+            for idx, scene in enumerate(scenes):
+                scene_type = scene.get('scene_type', 'video')
+                type_icon = "📊" if scene_type == "diagram" else "🎥"
+                safe_print(f"  {type_icon} Scene {scene['scene_number']} ({scene_type}): {scene['visual_description'][:50]}...")
+
+                future = video_pool.submit(
+                    self._generate_clip_when_ready,
+                    scene_images[idx],
+                    description=scene['visual_description'],
+                    duration=scene['duration'],
+                    scene_number=scene['scene_number'],
+                    output_dir=output_dir,
+                    scene_type=scene_type
+                )
+                futures[future] = idx
+
+            # Keep clips in scene order regardless of completion order
+            try:
+                for future in as_completed(futures):
+                    clip_paths[futures[future]] = future.result()
+            except BaseException:
+                # Fail fast: don't pay for queued scenes once one has failed for good
+                image_pool.shutdown(wait=False, cancel_futures=True)
+                video_pool.shutdown(wait=False, cancel_futures=True)
+                raise
         
         safe_print(f"✅ Generated {len(clip_paths)} clips")
         return clip_paths
     
+    def _submit_scene_images(self, executor, scenes, output_dir, storyboard_images=None):
+        """
+        Submit text-to-image jobs for scenes without a usable storyboard
+
+        The predictions go out back to back, so they land on warm workers
+        instead of trickling in between minutes-long image-to-video runs.
+        Scenes with the same visual description share one job.
+
+        Returns:
+            list: Per scene, a storyboard path, a Future of (image_path, image_bytes),
+            or None for diagram scenes
+        """
+        scene_images = [None] * len(scenes)
+        # Prompt hash -> the job generating that image
+        pending = {}
+        for idx, scene in enumerate(scenes):
+            if scene.get('scene_type', 'video') == "diagram":
+                continue
+            if storyboard_images and idx < len(storyboard_images) and storyboard_images[idx] \
+                    and Path(storyboard_images[idx]).exists():
+                scene_images[idx] = storyboard_images[idx]
+                continue
+            prompt_hash = hashlib.blake2b(scene['visual_description'].encode("utf-8"), digest_size=16).hexdigest()
+            if prompt_hash not in pending:
+                pending[prompt_hash] = executor.submit(
+                    self._retry_with_backoff,
+                    self._generate_scene_image,
+                    scene['visual_description'],
+                    scene['scene_number'],
+                    output_dir
+                )
+            scene_images[idx] = pending[prompt_hash]
+        return scene_images
+
+    def _generate_clip_when_ready(self, scene_image, **kwargs):
+        """Wait for the scene's image job if there is one, then generate the clip"""
+        if isinstance(scene_image, Future):
+            # Hand on the (path, bytes) pair so the image is not read back from disk
+            scene_image = scene_image.result()
+        return self._generate_clip(storyboard_image=scene_image, **kwargs)
+
+    @classmethod
+    def _note_rate_limit(cls):
+        """Fold a 429 into the EWMA of 429 interarrival times"""
+        with cls._rate_limit_lock:
+            now = time.monotonic()
+            if cls._last_rate_limit is not None:
+                interval = now - cls._last_rate_limit
+                if cls._rate_limit_interval is None:
+                    cls._rate_limit_interval = interval
+                else:
+                    cls._rate_limit_interval = 0.7 * cls._rate_limit_interval + 0.3 * interval
+            cls._last_rate_limit = now
+
+    def _congestion_factor(self):
+        """Stretch waits (up to 4x) while 429s arrive faster than the base retry delay"""
+        cls = type(self)
+        interval = cls._rate_limit_interval
+        if not interval or not self.retry_delay:
+            return 1.0
+        # The signal goes stale once the endpoint has been quiet for a while
+        if time.monotonic() - cls._last_rate_limit > MAX_RETRY_WAIT:
+            return 1.0
+        return min(4.0, max(1.0, self.retry_delay / interval))
+
+    def _retry_wait(self, exc, attempt):
+        """Seconds to sleep before the next attempt"""
+        if _RATE_LIMITED.search(str(exc)):
+            self._note_rate_limit()
+        retry_after = _retry_after(exc)
+        if retry_after is not None:
+            return retry_after
+        # Capped exponential backoff with jitter so concurrent scenes don't retry in lockstep
+        wait = self.retry_delay * (2 ** attempt) * random.uniform(0.5, 1.5)
+        return min(MAX_RETRY_WAIT, wait * self._congestion_factor())
+
     def _retry_with_backoff(self, func, *args, **kwargs):
         """
-        Execute a function with exponential backoff retry logic
+        Execute a function with retries, honoring Retry-After when the server sends one
         
         Args:
             func: Function to execute
@@ -102,30 +601,14 @@ class VideoGenerator:
                 last_exception = e
                 error_msg = str(e)
                 
-                # Determine if error is retryable
-                retryable_errors = [
-                    "Server disconnected",
-                    "Connection",
-                    "Timeout",
-                    "timeout",
-                    "503",
-                    "502",
-                    "500",
-                    "429",  # Rate limit
-                    "ConnectionError",
-                    "ReadTimeout",
-                ]
-                
-                is_retryable = any(err in error_msg for err in retryable_errors)
-                
-                if not is_retryable:
+                if not _is_retryable(e):
                     safe_print(f"    ❌ Non-retryable error: {error_msg}")
                     raise
                 
                 if attempt < self.max_retries - 1:
-                    wait_time = self.retry_delay * (2 ** attempt)  # Exponential backoff
+                    wait_time = self._retry_wait(e, attempt)
                     safe_print(f"    ⚠️  Attempt {attempt + 1}/{self.max_retries} failed: {error_msg}")
-                    safe_print(f"    ⏳ Retrying in {wait_time} seconds...")
+                    safe_print(f"    ⏳ Retrying in {wait_time:.1f} seconds...")
                     time.sleep(wait_time)
                 else:
                     safe_print(f"    ❌ All {self.max_retries} attempts failed")
@@ -148,7 +631,8 @@ class VideoGenerator:
             duration: Scene duration in seconds
             scene_number: Scene number
             output_dir: Output directory
-            storyboard_image: Optional storyboard image path
+            storyboard_image: Optional storyboard image path, or an
+                (image_path, image_bytes) pair already in memory
             scene_type: "video" or "diagram"
 
         Returns:
@@ -156,33 +640,39 @@ class VideoGenerator:
         """
         # Route to appropriate generator based on scene type
         if scene_type == "diagram":
-            return self._generate_matplotlib_diagram(description, duration, scene_number, output_dir)
+            return self._generate_cached_diagram(description, duration, scene_number, output_dir)
         else:
             return self._generate_replicate_video(description, duration, scene_number, output_dir, storyboard_image)
 
+    def _generate_cached_diagram(self, description, duration, scene_number, output_dir):
+        """Diagram scene through the content cache; Gemini + render only on a miss"""
+        # Whitespace-insensitive, so reflowed descriptions of the same diagram still hit
+        diagram_input = {"description": " ".join(description.split()), "duration": duration}
+        key = self._cache_key(DIAGRAM_MODEL, diagram_input)
+        clip_path = Path(output_dir) / f"scene_{scene_number}.mp4"
+        if self._cache_fetch(key, ".mp4", clip_path):
+            safe_print(f"    ♻️  Reusing cached diagram: {clip_path.name}")
+            return str(clip_path)
+        video_path = self._generate_matplotlib_diagram(description, duration, scene_number, output_dir)
+        self._cache_store(key, ".mp4", video_path, DIAGRAM_MODEL, diagram_input)
+        return video_path
+
     def _generate_matplotlib_diagram(self, description, duration, scene_number, output_dir, max_retries=3):
         """Generate a labeled matplotlib diagram with simple animation using gemini-3-pro-preview"""
-        import google.generativeai as genai
-
-        # Get Gemini API key
-        if not GEMINI_API_KEY:
-            raise RuntimeError("Gemini API key required. Set GEMINI_API_KEY in Streamlit secrets or environment variable")
-
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel("gemini-3-pro-preview")
+        model = self._diagram_model
 
         last_error = None
 
         for attempt in range(max_retries):
             try:
                 if attempt == 0:
-                    safe_print(f"    📊 Generating matplotlib code with gemini-3-pro-preview...")
+                    safe_print(f"    📊 Generating matplotlib code with {DIAGRAM_MODEL}...")
                     error_context = ""
                 else:
                     safe_print(f"    🔄 Retry {attempt}/{max_retries-1}: Regenerating code after error...")
                     error_context = f"\n\nIMPORTANT: The previous code failed with this error:\n{last_error}\n\nPlease fix this error and generate valid matplotlib code that will run without errors."
 
-                return self._generate_matplotlib_diagram_attempt(description, duration, scene_number, output_dir, error_context)
+                return self._generate_matplotlib_diagram_attempt(model, description, duration, scene_number, output_dir, error_context)
 
             except Exception as e:
                 last_error = str(e)
@@ -193,12 +683,9 @@ class VideoGenerator:
 
         raise RuntimeError("Matplotlib diagram generation failed")
 
-    def _generate_matplotlib_diagram_attempt(self, description, duration, scene_number, output_dir, error_context=""):
+    def _generate_matplotlib_diagram_attempt(self, model, description, duration, scene_number, output_dir, error_context=""):
         """Single attempt to generate matplotlib diagram"""
-        import google.generativeai as genai
-
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel("gemini-3-pro-preview")
+        num_frames = max(1, int(duration * DIAGRAM_FPS))
 
         # Create prompt for matplotlib code generation
         prompt = f"""Generate Python matplotlib code to create a labeled diagram with a simple animation based on this description:
@@ -207,20 +694,18 @@ class VideoGenerator:
 
 Requirements:
 1. Create a labeled diagram (use plt.text() or plt.annotate() for labels)
-2. Add a simple animation that lasts approximately {duration} seconds at 24 fps
-3. Use matplotlib.animation.FuncAnimation for the animation
-4. The animation should be smooth and professional (e.g., highlighting layers, zooming, fading elements)
-5. Save the animation as an MP4 file at 1920x1080 resolution, 24 fps
+2. Add a simple animation of exactly {num_frames} frames ({duration} seconds at {DIAGRAM_FPS} fps)
+3. Define a function render_frame(frame) that draws frame number `frame` (0 to {num_frames - 1}) and returns it as a numpy uint8 RGB array of shape ({DIAGRAM_HEIGHT}, {DIAGRAM_WIDTH}, 3)
+4. render_frame must depend only on `frame`: frames are rendered in parallel, in separate processes and in any order, so keep no state between calls
+5. The animation should be smooth and professional (e.g., highlighting layers, zooming, fading elements)
 6. Use 'Agg' backend for non-interactive rendering
-7. The code should be complete and runnable as-is
+7. The code should be complete and runnable as-is; do NOT save any files, use FuncAnimation or call ffmpeg
 8. ONLY use valid matplotlib properties - do NOT use properties that don't exist like 'letter_spacing'
 
 Output ONLY the Python code, no explanations. The code should:
 - Import all necessary libraries (matplotlib, numpy, etc.)
-- Set figure size to (19.2, 10.8) for 1920x1080
+- Set figure size to (19.2, 10.8) with dpi=100 for {DIAGRAM_WIDTH}x{DIAGRAM_HEIGHT}
 - Use matplotlib.use('Agg') at the start
-- Save the animation using writer = FFMpegWriter(fps=24, bitrate=5000)
-- Include the save path as a parameter that can be passed in
 - Use ONLY valid matplotlib text properties: fontsize, fontweight, color, alpha, ha, va, fontfamily, fontstyle
 - DO NOT use invalid properties like letter_spacing, text_spacing, or any other non-existent properties{error_context}
 
@@ -229,104 +714,113 @@ Example structure:
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from matplotlib.animation import FFMpegWriter
 import numpy as np
 
-def create_diagram_animation(output_path, duration={duration}):
-    fig, ax = plt.subplots(figsize=(19.2, 10.8), dpi=100)
-
-    # Your diagram code here
-
-    def animate(frame):
-        # Animation logic here
-        pass
+FRAMES = {num_frames}
+fig, ax = plt.subplots(figsize=(19.2, 10.8), dpi=100)
 
-    fps = 24
-    frames = int(duration * fps)
-    anim = animation.FuncAnimation(fig, animate, frames=frames, interval=1000/fps)
+def render_frame(frame):
+    ax.clear()
+    progress = frame / FRAMES
 
-    writer = FFMpegWriter(fps=fps, bitrate=5000)
-    anim.save(output_path, writer=writer)
-    plt.close()
+    # Your diagram and animation logic for this frame here
 
-# This will be called externally
-# create_diagram_animation('output.mp4', {duration})
+    fig.canvas.draw()
+    return np.asarray(fig.canvas.buffer_rgba())[..., :3]
 ```
 
 Generate the complete, runnable code now:"""
 
-        try:
-            response = model.generate_content(prompt)
-
-            # Extract code from response
-            code = response.text.strip()
+        response = model.generate_content(prompt)
 
-            # Remove markdown code blocks if present
-            if code.startswith("```python"):
-                code = code.split("```python")[1]
-                code = code.split("```")[0]
-            elif code.startswith("```"):
-                code = code.split("```")[1]
-                code = code.split("```")[0]
+        # Extract code from response
+        code = response.text.strip()
 
-            code = code.strip()
+        # Remove markdown code blocks if present
+        if code.startswith("```python"):
+            code = code.split("```python")[1]
+            code = code.split("```")[0]
+        elif code.startswith("```"):
+            code = code.split("```")[1]
+            code = code.split("```")[0]
 
-            safe_print(f"    ✅ Generated matplotlib code ({len(code)} chars)")
+        code = code.strip()
 
-            # Save generated code for debugging
-            code_path = Path(output_dir) / f"scene_{scene_number}_matplotlib.py"
-            with open(code_path, 'w') as f:
-                f.write(code)
-            safe_print(f"    💾 Saved code to: {code_path.name}")
+        safe_print(f"    ✅ Generated matplotlib code ({len(code)} chars)")
 
-            safe_print(f"    🎬 Executing matplotlib code to create animation...")
+        # Save generated code for debugging; the frame workers also load it from here
+        code_path = Path(output_dir) / f"scene_{scene_number}_matplotlib.py"
+        with open(code_path, 'w') as f:
+            f.write(code)
+        safe_print(f"    💾 Saved code to: {code_path.name}")
 
-            # Create output path
-            video_path = Path(output_dir) / f"scene_{scene_number}.mp4"
+        # Surface bad code here rather than once per worker
+        _check_diagram_code(code, str(code_path))
 
-            # Execute the code with better error handling
-            exec_globals = {}
-            try:
-                exec(code, exec_globals)
-            except Exception as e:
-                raise RuntimeError(f"Code execution failed: {e}")
+        safe_print(f"    🎬 Rendering {num_frames} frames to create animation...")
 
-            # Call the function
-            if 'create_diagram_animation' not in exec_globals:
-                raise RuntimeError("Generated code does not contain 'create_diagram_animation' function")
-
-            try:
-                exec_globals['create_diagram_animation'](str(video_path), duration)
-            except Exception as e:
-                raise RuntimeError(f"Animation creation failed: {e}")
+        # Create output path
+        video_path = Path(output_dir) / f"scene_{scene_number}.mp4"
+        self._render_diagram_video(code_path, num_frames, video_path)
 
-            # Verify the video was created
-            if not video_path.exists():
-                raise RuntimeError(f"Video file was not created at: {video_path}")
+        if video_path.stat().st_size < 1000:
+            raise RuntimeError(f"Video file is too small ({video_path.stat().st_size} bytes), likely corrupted")
 
-            if video_path.stat().st_size < 1000:
-                raise RuntimeError(f"Video file is too small ({video_path.stat().st_size} bytes), likely corrupted")
+        safe_print(f"    ✅ Matplotlib animation saved: {video_path.name}")
+        return str(video_path)
 
-            safe_print(f"    ✅ Matplotlib animation saved: {video_path.name}")
-            return str(video_path)
+    def _render_diagram_video(self, code_path, num_frames, video_path):
+        """
+        Render the diagram frames across processes and pipe them, in order, to ffmpeg
 
+        Frames only depend on their index, so a process pool draws them in parallel
+        while ffmpeg encodes raw RGB from stdin; no per-frame image files are written.
+        Workers are spawned rather than forked because scenes run on threads, and
+        up to max_parallel scenes render at once, so each pool gets its share of the CPUs.
+        """
+        render = functools.partial(_render_diagram_frame, str(code_path))
+        processes = max(1, min((os.cpu_count() or 1) // self.max_parallel, num_frames))
+
+        cmd = [
+            "ffmpeg",
+            "-y",
+            "-loglevel", "error",
+            "-f", "rawvideo",
+            "-pix_fmt", "rgb24",
+            "-s", f"{DIAGRAM_WIDTH}x{DIAGRAM_HEIGHT}",
+            "-r", str(DIAGRAM_FPS),
+            "-i", "pipe:0",
+            "-c:v", "libx264",
+            "-crf", "18",
+            "-preset", "medium",
+            "-pix_fmt", "yuv420p",
+            "-movflags", "+faststart",
+            str(video_path)
+        ]
+        # Unbuffered, so closing stdin after ffmpeg died cannot raise on a final flush
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+        try:
+            with multiprocessing.get_context("spawn").Pool(processes) as pool:
+                for frame_bytes in pool.imap(render, range(num_frames)):
+                    proc.stdin.write(frame_bytes)
+            proc.stdin.close()
+        except BrokenPipeError:
+            # ffmpeg exited early; its stderr below says why
+            proc.stdin.close()
         except Exception as e:
-            # Re-raise to trigger retry
-            raise
+            proc.kill()
+            proc.wait()
+            raise RuntimeError(f"Animation creation failed: {e}")
+
+        stderr = proc.stderr.read().decode(errors="replace")
+        if proc.wait() != 0:
+            raise RuntimeError(f"FFmpeg encoding failed: {stderr.strip()}")
 
     def _generate_3d_visualization(self, description, duration, scene_number, output_dir):
         """Generate a 3D visualization using gemini-3-pro-image-preview slideshow"""
-        import google.generativeai as genai
-
-        # Get Gemini API key
-        if not GEMINI_API_KEY:
-            raise RuntimeError("Gemini API key required. Set GEMINI_API_KEY in Streamlit secrets or environment variable")
+        model = self._slideshow_model
 
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel("gemini-3-pro-image-preview")
-
-        safe_print(f"    🎨 Generating image slideshow with gemini-3-pro-image-preview...")
+        safe_print(f"    🎨 Generating image slideshow with {SLIDESHOW_MODEL}...")
 
         # Calculate number of images (one every 2 seconds, minimum 3 images)
         num_images = max(3, int(duration / 2))
@@ -336,49 +830,14 @@ Generate the complete, runnable code now:"""
         images_dir = Path(output_dir) / f"scene_{scene_number}_images"
         images_dir.mkdir(exist_ok=True)
 
-        # Generate images with gemini-3-pro-image-preview
-        image_paths = []
-        for i in range(num_images):
-            safe_print(f"       Generating image {i+1}/{num_images}...")
-
-            try:
-                response = model.generate_content(description)
-
-                # Save image from response
-                image_path = images_dir / f"image_{i:03d}.png"
-
-                # Debug: check response structure
-                import base64
-
-                # Extract image data from response
-                if hasattr(response, 'parts') and len(response.parts) > 0:
-                    part = response.parts[0]
-
-                    # Check if it's inline_data
-                    if hasattr(part, 'inline_data') and part.inline_data:
-                        image_data = part.inline_data.data
-
-                        # Save directly if already bytes, otherwise decode from base64
-                        if isinstance(image_data, bytes):
-                            with open(image_path, 'wb') as f:
-                                f.write(image_data)
-                        else:
-                            with open(image_path, 'wb') as f:
-                                f.write(base64.b64decode(image_data))
-                    else:
-                        raise ValueError(f"No inline_data in response part. Part has: {dir(part)}")
-                else:
-                    raise ValueError(f"No parts in response. Response has: {dir(response)}")
-
-                # Verify the image was saved correctly
-                if not image_path.exists() or image_path.stat().st_size < 1000:
-                    raise ValueError(f"Image file is too small or doesn't exist: {image_path.stat().st_size if image_path.exists() else 0} bytes")
-
-                image_paths.append(image_path)
-                safe_print(f"       ✅ Image {i+1} saved ({image_path.stat().st_size} bytes)")
-
-            except Exception as e:
-                raise RuntimeError(f"Image generation failed for image {i+1}: {e}")
+        # Generate images with gemini-3-pro-image-preview. Each frame is an independent
+        # request; the same prompt still yields distinct images, so run them concurrently.
+        with ThreadPoolExecutor(max_workers=max(1, min(num_images, self.max_parallel))) as executor:
+            futures = [
+                executor.submit(self._generate_slideshow_image, model, description, images_dir, i, num_images)
+                for i in range(num_images)
+            ]
+            image_paths = [future.result() for future in futures]
 
         # Create slideshow video using FFmpeg
         safe_print(f"    🎬 Creating slideshow video...")
@@ -391,6 +850,45 @@ Generate the complete, runnable code now:"""
         except Exception as e:
             raise RuntimeError(f"Slideshow creation failed: {e}")
 
+    def _generate_slideshow_image(self, model, description, images_dir, i, num_images):
+        """Generate and save slideshow frame i; returns its path"""
+        safe_print(f"       Generating image {i+1}/{num_images}...")
+
+        try:
+            response = model.generate_content(description)
+
+            # Save image from response
+            image_path = images_dir / f"image_{i:03d}.png"
+
+            # Extract image data from response
+            if hasattr(response, 'parts') and len(response.parts) > 0:
+                part = response.parts[0]
+
+                # Check if it's inline_data
+                if hasattr(part, 'inline_data') and part.inline_data:
+                    image_data = part.inline_data.data
+                    # Usually raw bytes already; older clients hand back base64
+                    if not isinstance(image_data, bytes):
+                        image_data = _b64.b64decode(image_data)
+                else:
+                    raise ValueError(f"No inline_data in response part. Part has: {dir(part)}")
+            else:
+                raise ValueError(f"No parts in response. Response has: {dir(response)}")
+
+            # Validate before writing: the signature check needs no decode, and ffmpeg
+            # probes the content rather than trusting the .png suffix
+            if _sniff_image_format(image_data) is None:
+                raise ValueError("Response data is not a recognized image format")
+            if len(image_data) < 1000:
+                raise ValueError(f"Image data is too small: {len(image_data)} bytes")
+            image_path.write_bytes(image_data)
+
+            safe_print(f"       ✅ Image {i+1} saved ({len(image_data)} bytes)")
+            return image_path
+
+        except Exception as e:
+            raise RuntimeError(f"Image generation failed for image {i+1}: {e}")
+
     def _create_slideshow_video(self, image_paths, duration, output_path):
         """
         Create a slideshow video from images using FFmpeg with smooth transitions
@@ -400,8 +898,6 @@ Generate the complete, runnable code now:"""
             duration: Total duration in seconds
             output_path: Output video path
         """
-        import subprocess
-
         if not image_paths:
             raise ValueError("No images provided for slideshow")
 
@@ -410,271 +906,288 @@ Generate the complete, runnable code now:"""
         # Calculate duration per image (with slight overlap for transitions)
         image_duration = duration / num_images
 
-        # Create a temporary file list for FFmpeg concat
-        concat_file = output_path.parent / f"concat_{output_path.stem}.txt"
+        # Build the concat list in memory and feed it on stdin; paths are absolute
+        # since there is no list file for ffmpeg to resolve them against
+        def entry(img_path):
+            return "file '" + str(Path(img_path).absolute()).replace("'", "'\\''") + "'\n"
 
-        try:
-            # Write concat file with duration for each image
-            with open(concat_file, 'w') as f:
-                for img_path in image_paths:
-                    f.write(f"file '{img_path.absolute()}'\n")
-                    f.write(f"duration {image_duration}\n")
-                # Add last image again without duration (FFmpeg requirement)
-                f.write(f"file '{image_paths[-1].absolute()}'\n")
-
-            # FFmpeg command to create slideshow with crossfade transitions
-            # Specs: 1920x1080, 24fps, H.264, yuv420p (matching pipeline specs)
-            cmd = [
-                "ffmpeg",
-                "-y",  # Overwrite output
-                "-f", "concat",
-                "-safe", "0",
-                "-i", str(concat_file),
-                "-vf", f"scale=1920:1080:force_original_aspect_ratio=decrease,pad=1920:1080:(ow-iw)/2:(oh-ih)/2,format=yuv420p,fps=24",
-                "-c:v", "libx264",
-                "-crf", "18",  # High quality
-                "-preset", "medium",
-                "-movflags", "+faststart",
-                str(output_path)
-            ]
-
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                check=True
-            )
+        list_content = "".join(
+            entry(img_path) + f"duration {image_duration}\n" for img_path in image_paths
+        )
+        # Add last image again without duration (FFmpeg requirement)
+        list_content += entry(image_paths[-1])
+
+        # FFmpeg command to create slideshow with crossfade transitions
+        # Specs: 1920x1080, 24fps, H.264, yuv420p (matching pipeline specs)
+        cmd = [
+            "ffmpeg",
+            "-y",  # Overwrite output
+            "-protocol_whitelist", "pipe,file",
+            "-f", "concat",
+            "-safe", "0",
+            "-i", "pipe:0",
+            "-vf", f"scale=1920:1080:force_original_aspect_ratio=decrease,pad=1920:1080:(ow-iw)/2:(oh-ih)/2,format=yuv420p,fps=24",
+            "-c:v", "libx264",
+            "-crf", "18",  # High quality
+            # Each still is held for seconds: the repeats are near-free skip blocks,
+            # so the slower presets' motion search buys nothing here
+            "-tune", "stillimage",
+            "-preset", "veryfast",
+            "-movflags", "+faststart",
+            str(output_path)
+        ]
 
-            return True
+        subprocess.run(
+            cmd,
+            input=list_content,
+            capture_output=True,
+            text=True,
+            check=True
+        )
 
-        finally:
-            # Clean up concat file
-            if concat_file.exists():
-                concat_file.unlink()
+        return True
+
+    def _generate_scene_image(self, description, scene_number, output_dir):
+        """Text-to-image for one scene; returns (image_path, image_bytes)"""
+        image_suffix = IMAGE_ENCODINGS[self.image_format][1]
+        image_path = Path(output_dir) / f"t2i_scene_{scene_number}{image_suffix}"
+        if "google/imagen-3" in self.sdxl_model:
+            image_label = "Google Imagen 3"
+            image_input = {
+                "prompt": description,
+                "aspect_ratio": "16:9",
+                # Ask for the intermediate encoding so the result is saved without a re-encode
+                "output_format": "jpg" if self.image_format == "jpeg" else "png",
+                "safety_filter_level": "block_only_high"
+            }
+        else:
+            image_label = "Stability SDXL"
+            image_input = {
+                "prompt": description,
+                "width": 1024,
+                "height": 576,
+                "num_outputs": 1
+            }
+        image_key = self._cache_key(self.sdxl_model, {**image_input, "encoding": self.image_format})
+        if self._cache_fetch(image_key, image_suffix, image_path):
+            safe_print("    ♻️  Reusing cached image")
+            return image_path, image_path.read_bytes()
+        safe_print(f"    🎨 Generating image via {image_label}...")
+        output_img = self._run_model(self.sdxl_model, input=image_input, use_file_output=False)
+        # Save output image (supports URL or base64 output formats)
+        image_bytes = self._save_image_output(output_img, image_path)
+        image_url = _dispatch_output(_URL_EXTRACTORS, output_img)
+        if isinstance(image_url, str) and image_url.startswith("http"):
+            self._hosted_images[str(image_path)] = image_url
+        self._cache_store(image_key, image_suffix, image_path, self.sdxl_model, image_input)
+        return image_path, image_bytes
 
     def _generate_replicate_video(self, description, duration, scene_number, output_dir, storyboard_image=None):
         """Generate a video using Replicate API (original implementation)"""
-        replicate_key = self.api_key or REPLICATE_API_KEY
-        if not replicate_key:
-            raise RuntimeError("Replicate API key is required")
-
-        client = replicate.Client(api_token=replicate_key)
         clip_path = output_dir / f"scene_{scene_number}.mp4"
 
-        # Ensure we have an image: use provided storyboard or create one from text
-        image_path = None
-        if storyboard_image and Path(storyboard_image).exists():
+        # Ensure we have an image: use provided storyboard or create one from text.
+        # The bytes stay in memory for the image-to-video upload and cache key.
+        if isinstance(storyboard_image, tuple):
+            image_path, image_bytes = storyboard_image
+        elif storyboard_image and Path(storyboard_image).exists():
             image_path = storyboard_image
-        if not image_path:
-            image_path = output_dir / f"t2i_scene_{scene_number}.png"
-            if "google/imagen-3" in self.sdxl_model:
-                safe_print("    🎨 Generating image via Google Imagen 3...")
-                output_img = client.run(
-                    self.sdxl_model,
-                    input={
-                        "prompt": description,
-                        "aspect_ratio": "16:9",
-                        "output_format": "png",
-                        "safety_filter_level": "block_only_high"
-                    },
-                    use_file_output=False
-                )
-            else:
-                safe_print("    🎨 Generating image via Stability SDXL...")
-                output_img = client.run(
-                    self.sdxl_model,
-                    input={
-                        "prompt": description,
-                        "width": 1024,
-                        "height": 576,
-                        "num_outputs": 1
-                    },
-                    use_file_output=False
-                )
-            # Save output image (supports URL or base64 output formats)
-            self._save_image_output(output_img, image_path)
+            image_bytes = Path(storyboard_image).read_bytes()
+        else:
+            image_path, image_bytes = self._generate_scene_image(description, scene_number, output_dir)
 
         # Image-to-video via selected Replicate model
         if "bytedance/seedance" in self.svd_model:
-            safe_print("    🎬 Generating video via ByteDance Seedance...")
-            output_vid = client.run(
-                self.svd_model,
-                input={
-                    "image": open(image_path, "rb"),
-                    "prompt": description,
-                    "duration": max(2, min(int(duration), 12)),
-                    "resolution": "1080p",
-                    "aspect_ratio": "16:9",
-                    "fps": 24,
-                    "camera_fixed": False
-                },
-                use_file_output=False
-            )
+            video_label = "    🎬 Generating video via ByteDance Seedance..."
+            image_field = "image"
+            video_input = {
+                **_SEEDANCE_INPUT,
+                "prompt": description,
+                "duration": max(SEEDANCE_MIN_DURATION, min(int(duration), SEEDANCE_MAX_DURATION))
+            }
         else:
             # Stable Video Diffusion schema
-            desired_frames = max(14, min(duration * 6, 25))
-            video_length = "25_frames_with_svd_xt" if desired_frames >= 25 else "14_frames_with_svd"
-            fps = 6
-            safe_print("    🎬 Generating video from image via Stable Video Diffusion...")
-            output_vid = client.run(
-                self.svd_model,
-                input={
-                    "input_image": open(image_path, "rb"),
-                    "video_length": video_length,
-                    "frames_per_second": fps,
-                    "sizing_strategy": "maintain_aspect_ratio",
-                    "motion_bucket_id": 127,
-                    "cond_aug": 0.02,
-                    "decoding_t": 14
-                },
-                use_file_output=False
-            )
-
-        video_url = self._first_url(output_vid)
-        if not video_url:
-            raise RuntimeError("No video URL returned from image-to-video model")
-        self._download_video(video_url, clip_path)
+            video_length = _SVD_VIDEO_LENGTHS[max(14, min(int(duration * SVD_FPS), 25))]
+            video_label = "    🎬 Generating video from image via Stable Video Diffusion..."
+            image_field = "input_image"
+            video_input = {**_SVD_INPUT, "video_length": video_length}
+
+        # The source image is keyed by content, so an edited storyboard misses the cache
+        # and starts a new prediction rather than resuming the old one
+        image_digest = hashlib.sha256(image_bytes).hexdigest()
+        fingerprint = _fingerprint(self.svd_model, {**video_input, image_field: image_digest})
+        video_key = fingerprint if self.enable_cache else None
+        # Per scene, so identical scenes still get predictions of their own
+        prediction_key = f"{fingerprint}:{scene_number}"
+        if self._cache_fetch(video_key, ".mp4", clip_path):
+            safe_print(f"    ♻️  Reusing cached video: {clip_path.name}")
+            return str(clip_path)
+
+        safe_print(video_label)
+        output_vid = None
+        # An image generated this run is still hosted by Replicate; passing its URL
+        # skips uploading the bytes we just downloaded
+        image_url = self._hosted_images.get(str(image_path))
+        if image_url:
+            try:
+                output_vid = self._run_prediction(self.svd_model, {image_field: image_url, **video_input}, prediction_key)
+            except RuntimeError as e:
+                # e.g. the delivery URL expired before the model fetched it
+                self._hosted_images.pop(str(image_path), None)
+                safe_print(f"    ⚠️  Run from image URL failed ({e}); uploading the image instead")
+        if output_vid is None:
+            # A fresh buffer per attempt: a retry never re-sends a stream left at EOF,
+            # and the upload copy is released as soon as the run returns or fails
+            with io.BytesIO(image_bytes) as image_file:
+                image_file.name = Path(image_path).name  # Upload filename/content type for the client
+                output_vid = self._run_prediction(self.svd_model, {image_field: image_file, **video_input}, prediction_key)
+
+        try:
+            video_url = self._first_url(output_vid)
+            if not video_url:
+                raise RuntimeError("No video URL returned from image-to-video model")
+            if video_url.startswith("data:"):
+                # Sync-mode predictions (Prefer: wait) can return the output inline; no second hop
+                clip_path.write_bytes(_b64.b64decode(video_url.split(",", 1)[1], validate=False))
+            else:
+                self._download_video(video_url, clip_path)
+        finally:
+            # Saved or not, the output is done with: a succeeded prediction always
+            # resumes, so keeping it after a failed download (e.g. an expired URL)
+            # would hand every retry and later run the same dead output
+            self._remember_prediction(prediction_key, None)
+        self._cache_store(video_key, ".mp4", clip_path, self.svd_model, video_input)
         safe_print(f"    ✅ Video saved: {clip_path.name}")
         return str(clip_path)
     
+    def _cache_key(self, model, inputs):
+        """Stable hash of a model call, or None when caching is off"""
+        if not self.enable_cache:
+            return None
+        return _fingerprint(model, inputs)
+
+    @staticmethod
+    def _link_or_copy(src, dst):
+        """Hard-link src to dst, copying when the two aren't on one filesystem"""
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+
+    def _cache_fetch(self, key, suffix, output_path):
+        """
+        Materialize a cached result at output_path; returns False on a miss
+
+        output_path is unlinked either way: a file left there by an earlier hit
+        is a hard link to its cache entry, and the generator writes a miss in
+        place, which would otherwise overwrite that entry through the shared inode.
+        """
+        Path(output_path).unlink(missing_ok=True)
+        if key is None:
+            return False
+        cached = self.cache_dir / f"{key}{suffix}"
+        if not cached.exists():
+            return False
+        self._link_or_copy(cached, output_path)
+        return True
+
+    def _cache_store(self, key, suffix, output_path, model, inputs):
+        """Insert a generated file; concurrent writers race to an atomic rename"""
+        if key is None:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        staging = self.cache_dir / f".{key}.{uuid.uuid4().hex}{suffix}"
+        self._link_or_copy(output_path, staging)
+        os.replace(staging, self.cache_dir / f"{key}{suffix}")
+        meta = {"model": model, "inputs": inputs, "created": time.time()}
+        (self.cache_dir / f"{key}.json").write_text(json.dumps(meta, indent=2, default=str))
+
     def _download_video(self, url, output_path):
         """Download video with retry logic"""
         for attempt in range(self.max_retries):
             try:
-                resp = requests.get(url, timeout=300, stream=True)
-                resp.raise_for_status()
-                with open(output_path, 'wb') as f:
-                    for chunk in resp.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
+                with self._session.get(url, timeout=300, stream=True) as resp:
+                    resp.raise_for_status()
+                    resp.raw.decode_content = True
+                    with open(output_path, 'wb') as f:
+                        _stream_to_file(resp, f)
                 return
             except Exception as e:
                 if attempt < self.max_retries - 1:
-                    wait_time = self.retry_delay * (2 ** attempt)
+                    wait_time = self._retry_wait(e, attempt)
                     safe_print(f"    ⚠️  Download attempt {attempt + 1}/{self.max_retries} failed: {str(e)}")
-                    safe_print(f"    ⏳ Retrying download in {wait_time} seconds...")
+                    safe_print(f"    ⏳ Retrying download in {wait_time:.1f} seconds...")
                     time.sleep(wait_time)
                 else:
                     safe_print(f"    ❌ Failed to download video after {self.max_retries} attempts")
                     raise RuntimeError(f"Failed to download video from {url}: {str(e)}")
     
+    def _encode_image(self, data):
+        """Normalize image bytes to RGB in self.image_format; matching RGB input passes through untouched"""
+        pil_format, _, save_options = IMAGE_ENCODINGS[self.image_format]
+        source_format = _sniff_image_format(data)
+        if source_format is None:
+            raise ValueError("Unrecognized image data")
+        img = Image.open(io.BytesIO(data))
+        # Open only parses the header, so the common matching case never decodes pixels
+        if source_format == pil_format and img.mode == "RGB":
+            return data
+        # Lets JPEG decode straight to RGB at full size instead of converting afterwards
+        img.draft("RGB", img.size)
+        img.load()
+        # Only palette/alpha/grayscale sources need a converted copy
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        buffer = io.BytesIO()
+        img.save(buffer, format=pil_format, **save_options)
+        return buffer.getvalue()
+
     def _download_image(self, url, output_path):
-        import io
-        from PIL import Image
-        resp = requests.get(url, timeout=60)
-        resp.raise_for_status()
+        """Download an image to output_path in self.image_format and return the encoded bytes"""
+        with self._session.get(url, timeout=60, stream=True) as resp:
+            resp.raise_for_status()
+            resp.raw.decode_content = True
+            buffer = io.BytesIO()
+            shutil.copyfileobj(resp.raw, buffer, length=DOWNLOAD_CHUNK_SIZE)
         try:
-            img = Image.open(io.BytesIO(resp.content))
-            img.load()
+            png = self._encode_image(buffer.getvalue())
         except Exception:
             raise RuntimeError(f"Invalid image content at URL: {url}")
         try:
-            if img.mode in ("P", "RGBA", "LA"):
-                img = img.convert("RGB")
-            img.save(output_path, format="PNG")
+            Path(output_path).write_bytes(png)
         except Exception:
             raise RuntimeError(f"Failed to save image to: {output_path}")
+        return png
 
     def _first_url(self, data):
-        if isinstance(data, list):
-            if not data:
-                return None
-            first = data[0]
-            if isinstance(first, str):
-                return first
-            if isinstance(first, dict):
-                for k in ("url", "image", "video"):
-                    if k in first:
-                        return first[k]
-                return None
-        if isinstance(data, dict):
-            for k in ("output", "url", "image", "video"):
-                v = data.get(k)
-                if isinstance(v, str):
-                    return v
-                if isinstance(v, list) and v:
-                    if isinstance(v[0], str):
-                        return v[0]
-                    if isinstance(v[0], dict):
-                        return v[0].get("url")
-        if isinstance(data, str):
-            return data
-        return None
+        """First URL in a model's output (str, list or dict shaped)"""
+        return _dispatch_output(_URL_EXTRACTORS, data)
 
     def _save_image_output(self, output, output_path):
-        import io, base64
-        from PIL import Image
-        try:
-            from replicate.helpers import FileOutput
-        except Exception:
-            FileOutput = None
-        val = None
-        if FileOutput and isinstance(output, FileOutput):
-            data = output.read()
-            img = Image.open(io.BytesIO(data))
-            img = img.convert("RGB")
-            img.save(output_path, format="PNG")
-            return
-        if isinstance(output, str):
-            val = output
-        elif isinstance(output, list):
-            if output:
-                item = output[0]
-                if FileOutput and isinstance(item, FileOutput):
-                    data = item.read()
-                    img = Image.open(io.BytesIO(data))
-                    img = img.convert("RGB")
-                    img.save(output_path, format="PNG")
-                    return
-                if isinstance(item, str):
-                    val = item
-                elif isinstance(item, dict):
-                    for k in ("url", "image", "image_url", "base64", "image_base64", "data", "content"):
-                        if k in item:
-                            val = item[k]
-                            break
-        elif isinstance(output, dict):
-            if "images" in output and isinstance(output["images"], list) and output["images"]:
-                first = output["images"][0]
-                if isinstance(first, dict):
-                    val = first.get("content") or first.get("url")
-            if not val:
-                for k in ("output", "url", "image", "image_url", "base64", "image_base64", "images", "data", "content"):
-                    v = output.get(k)
-                    if isinstance(v, str):
-                        val = v
-                        break
-                    if isinstance(v, list) and v:
-                        if isinstance(v[0], str):
-                            val = v[0]
-                            break
-                        if isinstance(v[0], dict):
-                            for kk in ("url", "image", "image_url", "base64", "image_base64", "data", "content"):
-                                if kk in v[0]:
-                                    val = v[0][kk]
-                                    break
-                            if val:
-                                break
+        """Save a text-to-image result to output_path in self.image_format and return the encoded bytes"""
+        val = _dispatch_output(_IMAGE_EXTRACTORS, output)
+        if _FILE_OUTPUT_CLS and isinstance(val, _FILE_OUTPUT_CLS):
+            png = self._encode_image(val.read())
+            Path(output_path).write_bytes(png)
+            return png
         if not val:
             raise RuntimeError("No image output received")
         if isinstance(val, str) and val.startswith("http"):
-            self._download_image(val, output_path)
-            return
+            return self._download_image(val, output_path)
         try:
-            if isinstance(val, str) and val.startswith("data:"):
+            if isinstance(val, str) and val.startswith(_DATA_URL_PNG_PREFIX):
+                b64 = val[len(_DATA_URL_PNG_PREFIX):]
+            elif isinstance(val, str) and val.startswith("data:"):
                 b64 = val.split(",", 1)[1]
             elif isinstance(val, str):
                 b64 = val
             else:
                 raise RuntimeError("Unsupported image output format")
-            data = base64.b64decode(b64, validate=False)
-            img = Image.open(io.BytesIO(data))
-            img.load()
-            if img.mode in ("P", "RGBA", "LA"):
-                img = img.convert("RGB")
-            img.save(output_path, format="PNG")
+            png = self._encode_image(_b64.b64decode(b64, validate=False))
+            Path(output_path).write_bytes(png)
         except Exception:
             raise RuntimeError("Failed to decode image output")
+        return png
 
     # 16:9 aspect is requested at model level (Imagen-3: aspect_ratio, SDXL: width/height)
 
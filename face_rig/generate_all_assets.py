@@ -25,13 +25,15 @@ Options:
     --skip-tilts        Skip stage 2 (head poses)
     --skip-sequences    Skip stage 3 (expression transitions)
     --skip-neutral-pose Skip stage 4 (pose transitions)
-    --dry-run           Print commands without executing
+    --dry-run           Print the equivalent commands without executing
 """
 
 import argparse
-import subprocess
+import importlib
+import json
 import sys
 import os
+import traceback
 from pathlib import Path
 from typing import List, Optional
 
@@ -55,19 +57,24 @@ def print_stage(stage_num: int, stage_name: str):
     print(f"{'='*80}{Colors.RESET}\n")
 
 
-def run_command(cmd: List[str], description: str, dry_run: bool = False) -> bool:
+def run_stage(module: str, argv: List[str], cfg: dict, description: str, dry_run: bool = False) -> bool:
     """
-    Run a command and return success status.
+    Run a generation script's main() in this process and return success status.
+    
+    Stages share one interpreter, so openai/PIL are imported once and the
+    parsed expressions.json is handed to each script instead of re-read.
     
     Args:
-        cmd: Command and arguments as list
+        module: Script module name, e.g. "generate_head_tilts"
+        argv: Command-line arguments for the script
+        cfg: Parsed expressions.json
         description: Human-readable description
-        dry_run: If True, print command without executing
+        dry_run: If True, print the equivalent command without executing
     
     Returns:
         True if successful, False otherwise
     """
-    cmd_str = ' '.join(cmd)
+    cmd_str = ' '.join(["python", f"{module}.py", *argv])
     
     if dry_run:
         print(f"{Colors.CYAN}[DRY RUN]{Colors.RESET} {description}")
@@ -78,28 +85,19 @@ def run_command(cmd: List[str], description: str, dry_run: bool = False) -> bool
     print(f"  {Colors.CYAN}{cmd_str}{Colors.RESET}\n")
     
     try:
-        result = subprocess.run(
-            cmd,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True
-        )
-        
-        # Print output
-        if result.stdout:
-            for line in result.stdout.splitlines():
-                print(f"  {line}")
-        
+        importlib.import_module(module).main(argv, cfg=cfg)
         print(f"{Colors.GREEN}✓{Colors.RESET} {description} completed\n")
         return True
         
-    except subprocess.CalledProcessError as e:
+    except SystemExit as e:
+        # argparse rejected the arguments (it already printed why)
+        print(f"{Colors.RED}✗{Colors.RESET} {description} failed! (exit code {e.code})\n")
+        return False
+    except Exception:
         print(f"{Colors.RED}✗{Colors.RESET} {description} failed!")
         print(f"{Colors.RED}Error output:{Colors.RESET}")
-        if e.stdout:
-            for line in e.stdout.splitlines():
-                print(f"  {line}")
+        for line in traceback.format_exc().splitlines():
+            print(f"  {line}")
         print()
         return False
     except KeyboardInterrupt:
@@ -141,6 +139,7 @@ def check_prerequisites(base_image: Path, config: Path) -> bool:
 
 def stage_1_extremes(
     config: Path,
+    cfg: dict,
     base_image: Path,
     endpoints_dir: Path,
     size: str,
@@ -155,9 +154,7 @@ def stage_1_extremes(
     poses = ["center", "tilt_left_small", "tilt_right_small", "nod_up_small", "nod_down_small"]
     
     for pose in poses:
-        cmd = [
-            sys.executable,
-            "generate_extreme_expressions.py",
+        argv = [
             "--config", str(config),
             "--base-image", str(base_image),
             "--pose", pose,
@@ -168,10 +165,12 @@ def stage_1_extremes(
         ]
         
         if overwrite:
-            cmd.append("--overwrite")
+            argv.append("--overwrite")
         
-        if not run_command(
-            cmd,
+        if not run_stage(
+            "generate_extreme_expressions",
+            argv,
+            cfg,
             f"Generating extreme expressions for pose: {pose}",
             dry_run
         ):
@@ -182,6 +181,7 @@ def stage_1_extremes(
 
 def stage_2_tilts(
     config: Path,
+    cfg: dict,
     endpoints_dir: Path,
     size: str,
     max_workers: int,
@@ -191,9 +191,7 @@ def stage_2_tilts(
     """Stage 2: Generate head pose tilts for each expression"""
     print_stage(2, "Generate Head Pose Variants")
     
-    cmd = [
-        sys.executable,
-        "generate_head_tilts.py",
+    argv = [
         "--config", str(config),
         "--endpoints-dir", str(endpoints_dir),
         "--base-neutral", str(endpoints_dir / "neutral__center.png"),
@@ -203,10 +201,12 @@ def stage_2_tilts(
     ]
     
     if overwrite:
-        cmd.append("--overwrite")
+        argv.append("--overwrite")
     
-    return run_command(
-        cmd,
+    return run_stage(
+        "generate_head_tilts",
+        argv,
+        cfg,
         "Generating head pose variants for all expressions",
         dry_run
     )
@@ -214,6 +214,7 @@ def stage_2_tilts(
 
 def stage_3_sequences(
     config: Path,
+    cfg: dict,
     endpoints_dir: Path,
     sequences_dir: Path,
     size: str,
@@ -225,22 +226,23 @@ def stage_3_sequences(
     """Stage 3: Generate expression-to-expression transition sequences"""
     print_stage(3, "Generate Expression Transition Sequences")
     
-    cmd = [
-        sys.executable,
-        "generate_all_sequences.py",
+    argv = [
         "--config", str(config),
         "--endpoints-dir", str(endpoints_dir),
         "--sequences-dir", str(sequences_dir),
         "--max-depth", str(max_depth),
         "--size", size,
-        "--max-workers", str(max_workers)
+        "--max-workers", str(max_workers),
+        "--cache-dir", str(sequences_dir.parent / "tween_cache")
     ]
     
     if overwrite:
-        cmd.append("--overwrite")
+        argv.append("--overwrite")
     
-    return run_command(
-        cmd,
+    return run_stage(
+        "generate_all_sequences",
+        argv,
+        cfg,
         "Generating expression-to-expression transitions",
         dry_run
     )
@@ -248,6 +250,7 @@ def stage_3_sequences(
 
 def stage_4_neutral_pose(
     config: Path,
+    cfg: dict,
     endpoints_dir: Path,
     sequences_dir: Path,
     size: str,
@@ -259,23 +262,24 @@ def stage_4_neutral_pose(
     """Stage 4: Generate neutral pose-to-pose transitions"""
     print_stage(4, "Generate Neutral Pose Transitions")
     
-    cmd = [
-        sys.executable,
-        "generate_neutral_pose_sequences.py",
+    argv = [
         "--config", str(config),
         "--endpoints-dir", str(endpoints_dir),
         "--sequences-dir", str(sequences_dir),
         "--source-pose", "center",
         "--size", size,
         "--max-workers", str(max_workers),
-        "--max-depth", str(max_depth)
+        "--max-depth", str(max_depth),
+        "--cache-dir", str(sequences_dir.parent / "tween_cache")
     ]
     
     if overwrite:
-        cmd.append("--overwrite")
+        argv.append("--overwrite")
     
-    return run_command(
-        cmd,
+    return run_stage(
+        "generate_neutral_pose_sequences",
+        argv,
+        cfg,
         "Generating neutral pose-to-pose transitions",
         dry_run
     )
@@ -402,6 +406,10 @@ Examples:
         print(f"\n{Colors.RED}Aborting due to missing prerequisites.{Colors.RESET}\n")
         return 1
     
+    # Parse the config once; every stage gets the same dict
+    with open(args.config) as f:
+        cfg = json.load(f)
+    
     # Create output directories
     if not args.dry_run:
         args.endpoints_dir.mkdir(parents=True, exist_ok=True)
@@ -418,6 +426,7 @@ Examples:
         stages_run += 1
         if not stage_1_extremes(
             args.config,
+            cfg,
             args.base_image,
             args.endpoints_dir,
             args.size,
@@ -436,6 +445,7 @@ Examples:
         stages_run += 1
         if not stage_2_tilts(
             args.config,
+            cfg,
             args.endpoints_dir,
             args.size,
             args.max_workers,
@@ -453,6 +463,7 @@ Examples:
         stages_run += 1
         if not stage_3_sequences(
             args.config,
+            cfg,
             args.endpoints_dir,
             args.sequences_dir,
             args.size,
@@ -472,6 +483,7 @@ Examples:
         stages_run += 1
         if not stage_4_neutral_pose(
             args.config,
+            cfg,
             args.endpoints_dir,
             args.sequences_dir,
             args.size,
@@ -9,10 +9,11 @@ midpoint refinement (binary subdivision) up to max_depth.
 - Uses expressions.json["base_paths"] to find (start_expr, end_expr) pairs
 - For each (base_path, pose) where both endpoints exist:
     - Creates: <sequences_dir>/<base_path_id>__<pose>/
-    - Copies endpoints as 000.png (t=0.0) and 100.png (t=1.0)
-    - For depth = 1..max_depth:
-        - For each adjacent pair of frames, generate a midpoint frame.
-- Writes manifest.json in each sequence directory.
+    - Hard-links (or copies) endpoints as 000.png (t=0.0) and 100.png (t=1.0)
+    - Splits [0, 1] at its midpoint, then each half, down to max_depth levels.
+      A segment's two halves are scheduled as soon as its midpoint exists, so
+      sequences never wait on stragglers from other segments.
+- Rewrites manifest.json in each sequence directory as each tween lands.
 
 With max_depth=2, the default, you get tweens at 0.25, 0.5, 0.75.
 
@@ -28,17 +29,11 @@ Example:
 """
 
 import argparse
-import base64
 import json
 import os
-import shutil
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from dataclasses import dataclass
-from io import BytesIO
 from typing import Dict, List, Tuple, Optional
 
-from openai import OpenAI
-from PIL import Image
+from tweening import Frame, TweenSequence, link_or_copy, refine_sequences, write_manifest
 
 # ---- Shared description tables (same spirit as other scripts) ----
 
@@ -92,6 +87,31 @@ def load_config(path: str) -> dict:
         return json.load(f)
 
 
+# Tween prompt; filled per sequence by build_prompt_template, leaving only
+# {mid_t} for the worker
+TWEEN_PROMPT = """
+    Watercolor portrait of the same young boy on a transparent background,
+    matching the style, identity, hairstyle, clothing, and framing of the
+    reference images.
+
+    Important: All references to "left" and "right" are from the boy's
+    perspective (his own left/right). If the viewer's left/right is mentioned,
+    treat it as secondary clarification.
+
+    Head pose: {pose_desc}.
+
+    Generate a single in-between frame at relative position t = {{mid_t:.2f}}
+    between these two facial expressions:
+
+      - Start: {expr_start_desc}
+      - End:   {expr_end_desc}
+
+    Only adjust the mouth, eyes, and eyebrows smoothly between the two
+    reference expressions. Do NOT change hairstyle, clothing, earrings,
+    or background. Keep proportions and framing identical.
+    """
+
+
 def describe_expression(expr_id: str, cfg: dict) -> str:
     expr = cfg["expressions"][expr_id]
     mouth = expr["mouth"]
@@ -105,35 +125,12 @@ def describe_expression(expr_id: str, cfg: dict) -> str:
     )
 
 
-@dataclass
-class Frame:
-    t: float
-    file: str  # relative filename in the sequence dir, e.g. "025.png"
-
-
-@dataclass
-class SequenceState:
-    path_id: str          # base_path_id__pose
-    expr_start: str
-    expr_end: str
-    pose_id: str
-    dir: str              # sequence directory
-    frames: List[Frame]   # frames with t in [0,1]
-
-
-@dataclass
-class TweenJob:
-    path_id: str
-    expr_start: str
-    expr_end: str
-    pose_id: str
-    left_t: float
-    right_t: float
-    mid_t: float
-    left_file: str   # relative filenames like "000.png"
-    right_file: str
-    out_file: str    # relative filename like "050.png"
-    size: str
+def build_prompt_template(expr_start_desc: str, expr_end_desc: str, pose_desc: str) -> str:
+    return TWEEN_PROMPT.format(
+        pose_desc=pose_desc,
+        expr_start_desc=expr_start_desc,
+        expr_end_desc=expr_end_desc,
+    )
 
 
 def discover_endpoints(endpoints_dir: str) -> Dict[Tuple[str, str], str]:
@@ -142,69 +139,20 @@ def discover_endpoints(endpoints_dir: str) -> Dict[Tuple[str, str], str]:
     Returns a map (expr_id, pose) -> filepath.
     """
     mapping: Dict[Tuple[str, str], str] = {}
-    for fname in os.listdir(endpoints_dir):
-        if not fname.lower().endswith(".png"):
-            continue
-        stem = fname[:-4]
-        if "__" not in stem:
-            continue
-        expr_id, pose = stem.split("__", 1)
-        full_path = os.path.join(endpoints_dir, fname)
-        mapping[(expr_id, pose)] = full_path
+    with os.scandir(endpoints_dir) as entries:
+        for entry in entries:
+            if not entry.name.lower().endswith(".png") or not entry.is_file():
+                continue
+            stem = entry.name[:-4]
+            if "__" not in stem:
+                continue
+            expr_id, pose = stem.split("__", 1)
+            mapping[(expr_id, pose)] = entry.path
     return mapping
 
 
-def generate_midframe(job: TweenJob, seq_dir: str, cfg: dict) -> None:
-    client = OpenAI()  # Initialize per-thread
-    
-    expr_start_desc = describe_expression(job.expr_start, cfg)
-    expr_end_desc = describe_expression(job.expr_end, cfg)
-    pose_desc = POSE_DESCRIPTIONS.get(job.pose_id, job.pose_id.replace("_", " "))
-
-    prompt = f"""
-    Watercolor portrait of the same young boy on a transparent background,
-    matching the style, identity, hairstyle, clothing, and framing of the
-    reference images.
-
-    Important: All references to "left" and "right" are from the boy's
-    perspective (his own left/right). If the viewer's left/right is mentioned,
-    treat it as secondary clarification.
-
-    Head pose: {pose_desc}.
-
-    Generate a single in-between frame at relative position t = {job.mid_t:.2f}
-    between these two facial expressions:
-
-      - Start: {expr_start_desc}
-      - End:   {expr_end_desc}
-
-    Only adjust the mouth, eyes, and eyebrows smoothly between the two
-    reference expressions. Do NOT change hairstyle, clothing, earrings,
-    or background. Keep proportions and framing identical.
-    """
-
-    left_path = os.path.join(seq_dir, job.left_file)
-    right_path = os.path.join(seq_dir, job.right_file)
-
-    with open(left_path, "rb") as fa, open(right_path, "rb") as fb:
-        result = client.images.edit(
-            model="gpt-image-1",
-            image=[fa, fb],
-            prompt=prompt,
-            size=job.size,
-            n=1,
-            quality="high",
-        )
-
-    b64 = result.data[0].b64_json
-    img_bytes = base64.b64decode(b64)
-    img = Image.open(BytesIO(img_bytes)).convert("RGBA")
-    out_path = os.path.join(seq_dir, job.out_file)
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
-    img.save(out_path)
-
-
-def main():
+def main(argv: Optional[List[str]] = None, cfg: Optional[dict] = None):
+    # argv/cfg let generate_all_assets.py run this stage in-process with its loaded config
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", required=True, help="Path to expressions.json")
     parser.add_argument(
@@ -239,9 +187,27 @@ def main():
         action="store_true",
         help="If set, overwrite existing tween frames (endpoints are always copied).",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--no-hardlink",
+        action="store_true",
+        help="Copy endpoints into sequence dirs instead of hard-linking them "
+        "(use if downstream tools edit frames in place).",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default="frames/tween_cache",
+        help="Directory of cached tween results keyed by prompt and parent frames "
+        "(default: frames/tween_cache)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always call the API for tweens, bypassing the tween cache.",
+    )
+    args = parser.parse_args(argv)
 
-    cfg = load_config(args.config)
+    if cfg is None:
+        cfg = load_config(args.config)
     endpoints_map = discover_endpoints(args.endpoints_dir)
     if not endpoints_map:
         raise SystemExit(f"No endpoints found in {args.endpoints_dir}")
@@ -250,51 +216,72 @@ def main():
     print(f"[i] Found poses in endpoints: {poses}")
 
     base_paths = cfg["base_paths"]  # list of {id, start, end}
-    os.makedirs(args.sequences_dir, exist_ok=True)
-
-    # Build initial sequence states (just endpoints 0 and 1)
-    sequences: Dict[str, SequenceState] = {}
-
-    for pose_id in poses:
-        for bp in base_paths:
-            expr_start = bp["start"]
-            expr_end = bp["end"]
-            path_base_id = bp["id"]
-            path_id = f"{path_base_id}__{pose_id}"
-
-            key_start = (expr_start, pose_id)
-            key_end = (expr_end, pose_id)
-
-            if key_start not in endpoints_map or key_end not in endpoints_map:
-                # missing endpoints for this pose, skip
-                continue
 
-            start_img = endpoints_map[key_start]
-            end_img = endpoints_map[key_end]
+    # Check every endpoint the (pose, base_path) pairs need in one pass, report
+    # the gaps once, and only touch the filesystem for pairs that are complete
+    available = endpoints_map.keys()
+    needed = {
+        (bp[end], pose_id)
+        for pose_id in poses
+        for bp in base_paths
+        for end in ("start", "end")
+    }
+    missing = sorted(needed - available)
+    if missing:
+        print(f"[i] {len(missing)} endpoints missing; sequences needing them are skipped:")
+        for expr_id, pose_id in missing:
+            print(f"    {expr_id}__{pose_id}.png")
+
+    pairs = [
+        (pose_id, bp)
+        for pose_id in poses
+        for bp in base_paths
+        if {(bp["start"], pose_id), (bp["end"], pose_id)} <= available
+    ]
 
-            seq_dir = os.path.join(args.sequences_dir, path_id)
-            os.makedirs(seq_dir, exist_ok=True)
-
-            # Copy endpoints into sequence dir as 000.png and 100.png
-            f_start = os.path.join(seq_dir, "000.png")
-            f_end = os.path.join(seq_dir, "100.png")
-
-            shutil.copy2(start_img, f_start)
-            shutil.copy2(end_img, f_end)
-
-            frames = [
-                Frame(t=0.0, file="000.png"),
-                Frame(t=1.0, file="100.png"),
-            ]
-
-            sequences[path_id] = SequenceState(
-                path_id=path_id,
-                expr_start=expr_start,
-                expr_end=expr_end,
-                pose_id=pose_id,
-                dir=seq_dir,
-                frames=frames,
-            )
+    # Build initial sequence states (just endpoints 0 and 1)
+    sequences: Dict[str, TweenSequence] = {}
+
+    for pose_id, bp in pairs:
+        expr_start = bp["start"]
+        expr_end = bp["end"]
+        path_id = f"{bp['id']}__{pose_id}"
+
+        start_img = endpoints_map[(expr_start, pose_id)]
+        end_img = endpoints_map[(expr_end, pose_id)]
+
+        seq_dir = os.path.join(args.sequences_dir, path_id)
+        os.makedirs(seq_dir, exist_ok=True)
+
+        # Link endpoints into sequence dir as 000.png and 100.png
+        f_start = os.path.join(seq_dir, "000.png")
+        f_end = os.path.join(seq_dir, "100.png")
+
+        link_or_copy(start_img, f_start, hardlink=not args.no_hardlink)
+        link_or_copy(end_img, f_end, hardlink=not args.no_hardlink)
+
+        frames = [
+            Frame(t=0.0, file="000.png"),
+            Frame(t=1.0, file="100.png"),
+        ]
+
+        # Descriptions are fixed for the whole sequence, so build the
+        # prompt once here rather than in every tween job
+        expr_start_desc = describe_expression(expr_start, cfg)
+        expr_end_desc = describe_expression(expr_end, cfg)
+        pose_desc = POSE_DESCRIPTIONS.get(pose_id, pose_id.replace("_", " "))
+
+        sequences[path_id] = TweenSequence(
+            path_id=path_id,
+            dir=seq_dir,
+            frames=frames,
+            prompt_template=build_prompt_template(
+                expr_start_desc, expr_end_desc, pose_desc
+            ),
+            manifest={"expr_start": expr_start, "expr_end": expr_end, "pose": pose_id},
+        )
+        # Endpoints-only manifest; tweens are added as they land
+        write_manifest(sequences[path_id])
 
     if not sequences:
         print("[i] No sequences to generate (no matching endpoint pairs).")
@@ -302,118 +289,19 @@ def main():
 
     print(f"[i] Initialized {len(sequences)} sequences with endpoints.")
 
-    # Recursive refinement by depth
-    for depth in range(1, args.max_depth + 1):
-        print(f"\n=== Refinement depth {depth} ===")
-        jobs: List[Tuple[TweenJob, SequenceState]] = []
-
-        # Build jobs for this depth across all sequences
-        for seq in sequences.values():
-            # sort frames by t
-            seq.frames.sort(key=lambda f: f.t)
-
-            # for each adjacent pair, schedule a midpoint if it doesn't exist yet
-            existing_ts = [f.t for f in seq.frames]
-            for i in range(len(seq.frames) - 1):
-                left = seq.frames[i]
-                right = seq.frames[i + 1]
-                mid_t = 0.5 * (left.t + right.t)
-
-                # Only care about midpoints strictly between endpoints
-                if mid_t <= left.t or mid_t >= right.t:
-                    continue
-
-                # Skip if a frame near mid_t already exists
-                if any(abs(mid_t - t) < 1e-6 for t in existing_ts):
-                    continue
-
-                idx = int(round(mid_t * 100))
-                out_file = f"{idx:03d}.png"
-                out_path = os.path.join(seq.dir, out_file)
-
-                if os.path.exists(out_path) and not args.overwrite:
-                    # if it exists and we're not overwriting, just register it
-                    seq.frames.append(Frame(t=mid_t, file=out_file))
-                    existing_ts.append(mid_t)
-                    continue
-
-                job = TweenJob(
-                    path_id=seq.path_id,
-                    expr_start=seq.expr_start,
-                    expr_end=seq.expr_end,
-                    pose_id=seq.pose_id,
-                    left_t=left.t,
-                    right_t=right.t,
-                    mid_t=mid_t,
-                    left_file=left.file,
-                    right_file=right.file,
-                    out_file=out_file,
-                    size=args.size,
-                )
-                jobs.append((job, seq))
-
-        if not jobs:
-            print("[i] No new midpoints to generate at this depth.")
-            continue
-
-        print(f"[i] Depth {depth}: {len(jobs)} tween frames to generate.")
-
-        # Parallel execution at this depth
-        results: List[Tuple[TweenJob, Optional[Exception]]] = []
-
-        def worker(job: TweenJob, seq_dir: str) -> Tuple[TweenJob, Optional[Exception]]:
-            try:
-                generate_midframe(job, seq_dir, cfg)
-                return job, None
-            except Exception as e:
-                return job, e
-
-        with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
-            future_to_job = {
-                executor.submit(worker, job, seq.dir): job for (job, seq) in jobs
-            }
-            for fut in as_completed(future_to_job):
-                job = future_to_job[fut]
-                job_res, err = fut.result()
-                if err is None:
-                    print(
-                        f"[✓] {job_res.path_id} t={job_res.mid_t:.3f} "
-                        f"-> {job_res.out_file}"
-                    )
-                else:
-                    print(
-                        f"[!] Failed {job_res.path_id} t={job_res.mid_t:.3f}: {err}"
-                    )
-                results.append((job_res, err))
-
-        # Register successful frames in our sequence states
-        for job_res, err in results:
-            if err is not None:
-                continue
-            seq = sequences[job_res.path_id]
-            # avoid duplicates
-            if not any(abs(f.t - job_res.mid_t) < 1e-6 for f in seq.frames):
-                seq.frames.append(Frame(t=job_res.mid_t, file=job_res.out_file))
-
-        ok = sum(1 for _, e in results if e is None)
-        fail = len(results) - ok
-        print(f"[i] Depth {depth} done. Success: {ok}, Failed: {fail}")
+    ok, failed = refine_sequences(
+        sequences.values(),
+        max_depth=args.max_depth,
+        size=args.size,
+        max_workers=args.max_workers,
+        overwrite=args.overwrite,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        hardlink=not args.no_hardlink,
+    )
+    print(f"[i] Refinement done. Success: {ok}, Failed: {failed}")
 
-    # Write manifest.json for each sequence
     for seq in sequences.values():
-        seq.frames.sort(key=lambda f: f.t)
-        frames_list = [{"t": f.t, "file": f.file} for f in seq.frames]
-        manifest = {
-            "path_id": seq.path_id,
-            "expr_start": seq.expr_start,
-            "expr_end": seq.expr_end,
-            "pose": seq.pose_id,
-            "frames": frames_list,
-        }
-        manifest_path = os.path.join(seq.dir, "manifest.json")
-        with open(manifest_path, "w") as f:
-            json.dump(manifest, f, indent=2)
-        print(f"[i] Wrote manifest: {manifest_path}")
+        print(f"[i] Wrote manifest: {os.path.join(seq.dir, 'manifest.json')}")
 
 
 if __name__ == "__main__":
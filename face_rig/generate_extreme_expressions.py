@@ -29,9 +29,10 @@ from io import BytesIO
 from typing import Dict, List, Tuple, Optional
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from openai import OpenAI
 from PIL import Image
 
+from openai_client import get_client
+
 # ---- Expression description tables (same idea as in generate_sequence.py) ----
 
 MOUTH_DESCRIPTIONS: Dict[str, str] = {
@@ -112,7 +113,7 @@ def generate_extreme_for_expression(
     """
     Use gpt-image-1 to edit the base image into the target extreme expression.
     """
-    client = OpenAI()  # Initialize client here, not at module level
+    client = get_client()
     
     expr_desc = describe_expression(expr_id, cfg)
     pose_desc = POSE_DESCRIPTIONS.get(pose_id, pose_id.replace("_", " "))
@@ -155,7 +156,8 @@ def generate_extreme_for_expression(
     img.save(out_path)
 
 
-def main():
+def main(argv: Optional[List[str]] = None, cfg: Optional[dict] = None):
+    # argv/cfg let generate_all_assets.py run this stage in-process with its loaded config
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", required=True, help="Path to expressions.json")
     parser.add_argument(
@@ -193,9 +195,10 @@ def main():
         help="Max number of parallel OpenAI calls (default: 4).",
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
-    cfg = load_config(args.config)
+    if cfg is None:
+        cfg = load_config(args.config)
 
     if args.pose not in cfg.get("poses", []):
         print(
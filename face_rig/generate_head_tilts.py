@@ -34,9 +34,10 @@ from dataclasses import dataclass
 from io import BytesIO
 from typing import Dict, List, Tuple, Optional
 
-from openai import OpenAI
 from PIL import Image
 
+from openai_client import get_client
+
 # --- description tables -------------------------------------------------------
 
 MOUTH_DESCRIPTIONS: Dict[str, str] = {
@@ -112,15 +113,15 @@ def discover_endpoints(endpoints_dir: str) -> Dict[Tuple[str, str], str]:
     Returns a map (expr_id, pose) -> filepath.
     """
     mapping: Dict[Tuple[str, str], str] = {}
-    for fname in os.listdir(endpoints_dir):
-        if not fname.lower().endswith(".png"):
-            continue
-        stem = fname[:-4]
-        if "__" not in stem:
-            continue
-        expr_id, pose = stem.split("__", 1)
-        full_path = os.path.join(endpoints_dir, fname)
-        mapping[(expr_id, pose)] = full_path
+    with os.scandir(endpoints_dir) as entries:
+        for entry in entries:
+            if not entry.name.lower().endswith(".png") or not entry.is_file():
+                continue
+            stem = entry.name[:-4]
+            if "__" not in stem:
+                continue
+            expr_id, pose = stem.split("__", 1)
+            mapping[(expr_id, pose)] = entry.path
     return mapping
 
 
@@ -138,7 +139,7 @@ def generate_head_tilt(job: TiltJob, cfg: dict) -> None:
     """
     Use gpt-image-1 to change only the head pose, keeping expression identical.
     """
-    client = OpenAI()
+    client = get_client()
     
     expr_desc = describe_expression(job.expr_id, cfg)
     pose_desc = POSE_DESCRIPTIONS.get(job.pose_id, job.pose_id.replace("_", " "))
@@ -182,7 +183,8 @@ def generate_head_tilt(job: TiltJob, cfg: dict) -> None:
     img.save(job.out_path)
 
 
-def main():
+def main(argv: Optional[List[str]] = None, cfg: Optional[dict] = None):
+    # argv/cfg let generate_all_assets.py run this stage in-process with its loaded config
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", required=True, help="Path to expressions.json")
     parser.add_argument(
@@ -218,9 +220,10 @@ def main():
         action="store_true",
         help="If set, overwrite existing tilt files instead of skipping.",
     )
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
-    cfg = load_config(args.config)
+    if cfg is None:
+        cfg = load_config(args.config)
     endpoints_dir = args.endpoints_dir
     os.makedirs(endpoints_dir, exist_ok=True)
 
@@ -26,17 +26,11 @@ Example:
 """
 
 import argparse
-import base64
 import json
 import os
-import shutil
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from dataclasses import dataclass
-from io import BytesIO
 from typing import Dict, List, Optional, Tuple
 
-from openai import OpenAI
-from PIL import Image
+from tweening import Frame, TweenSequence, link_or_copy, refine_sequences, write_manifest
 
 MOUTH_DESCRIPTIONS: Dict[str, str] = {
     "neutral": "mouth relaxed and closed in a neutral position",
@@ -88,76 +82,9 @@ def load_config(path: str) -> dict:
         return json.load(f)
 
 
-def describe_expression(expr_id: str, cfg: dict) -> str:
-    expr = cfg["expressions"][expr_id]
-    mouth = expr["mouth"]
-    eyes = expr["eyes"]
-    brows = expr["brows"]
-
-    return (
-        f"{MOUTH_DESCRIPTIONS.get(mouth, mouth)}, "
-        f"{EYE_DESCRIPTIONS.get(eyes, eyes)}, "
-        f"{BROW_DESCRIPTIONS.get(brows, brows)}"
-    )
-
-
-def discover_endpoints(endpoints_dir: str) -> Dict[Tuple[str, str], str]:
-    mapping: Dict[Tuple[str, str], str] = {}
-    for fname in os.listdir(endpoints_dir):
-        if not fname.lower().endswith(".png"):
-            continue
-        stem = fname[:-4]
-        if "__" not in stem:
-            continue
-        expr_id, pose = stem.split("__", 1)
-        full_path = os.path.join(endpoints_dir, fname)
-        mapping[(expr_id, pose)] = full_path
-    return mapping
-
-
-@dataclass
-class Frame:
-    t: float
-    file: str
-
-
-@dataclass
-class PoseSeq:
-    path_id: str
-    pose_start: str
-    pose_end: str
-    expr_id: str
-    dir: str
-    frames: List[Frame]
-
-
-@dataclass
-class TweenJob:
-    path_id: str
-    expr_id: str
-    pose_start: str
-    pose_end: str
-    left_t: float
-    right_t: float
-    mid_t: float
-    left_file: str
-    right_file: str
-    out_file: str
-    size: str
-
-
-def generate_midframe(job: TweenJob, seq_dir: str, cfg: dict) -> None:
-    client = OpenAI()
-    
-    expr_desc = describe_expression(job.expr_id, cfg)
-    pose_start_desc = POSE_DESCRIPTIONS.get(
-        job.pose_start, job.pose_start.replace("_", " ")
-    )
-    pose_end_desc = POSE_DESCRIPTIONS.get(
-        job.pose_end, job.pose_end.replace("_", " ")
-    )
-
-    prompt = f"""
+# Tween prompt; filled per sequence by build_prompt_template, leaving only
+# {mid_t} for the worker
+TWEEN_PROMPT = """
     Watercolor portrait of the same young boy on a transparent background,
     matching the style, identity, hairstyle, clothing, and framing of the
     reference images.
@@ -171,7 +98,7 @@ def generate_midframe(job: TweenJob, seq_dir: str, cfg: dict) -> None:
         {expr_desc}
 
     Head pose:
-      - This frame is an in-between at relative t = {job.mid_t:.2f}
+      - This frame is an in-between at relative t = {{mid_t:.2f}}
         between these head poses:
           * Start: {pose_start_desc}
           * End:   {pose_end_desc}
@@ -181,28 +108,44 @@ def generate_midframe(job: TweenJob, seq_dir: str, cfg: dict) -> None:
         perspective effects), hairstyle, clothing, earrings, or background.
     """
 
-    left_path = os.path.join(seq_dir, job.left_file)
-    right_path = os.path.join(seq_dir, job.right_file)
-
-    with open(left_path, "rb") as fa, open(right_path, "rb") as fb:
-        result = client.images.edit(
-            model="gpt-image-1",
-            image=[fa, fb],
-            prompt=prompt,
-            size=job.size,
-            n=1,
-            quality="high",
-        )
 
-    b64 = result.data[0].b64_json
-    img_bytes = base64.b64decode(b64)
-    img = Image.open(BytesIO(img_bytes)).convert("RGBA")
-    out_path = os.path.join(seq_dir, job.out_file)
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
-    img.save(out_path)
+def describe_expression(expr_id: str, cfg: dict) -> str:
+    expr = cfg["expressions"][expr_id]
+    mouth = expr["mouth"]
+    eyes = expr["eyes"]
+    brows = expr["brows"]
+
+    return (
+        f"{MOUTH_DESCRIPTIONS.get(mouth, mouth)}, "
+        f"{EYE_DESCRIPTIONS.get(eyes, eyes)}, "
+        f"{BROW_DESCRIPTIONS.get(brows, brows)}"
+    )
+
+
+def build_prompt_template(expr_desc: str, pose_start_desc: str, pose_end_desc: str) -> str:
+    return TWEEN_PROMPT.format(
+        expr_desc=expr_desc,
+        pose_start_desc=pose_start_desc,
+        pose_end_desc=pose_end_desc,
+    )
+
+
+def discover_endpoints(endpoints_dir: str) -> Dict[Tuple[str, str], str]:
+    mapping: Dict[Tuple[str, str], str] = {}
+    with os.scandir(endpoints_dir) as entries:
+        for entry in entries:
+            if not entry.name.lower().endswith(".png") or not entry.is_file():
+                continue
+            stem = entry.name[:-4]
+            if "__" not in stem:
+                continue
+            expr_id, pose = stem.split("__", 1)
+            mapping[(expr_id, pose)] = entry.path
+    return mapping
 
 
-def main():
+def main(argv: Optional[List[str]] = None, cfg: Optional[dict] = None):
+    # argv/cfg let generate_all_assets.py run this stage in-process with its loaded config
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", required=True, help="Path to expressions.json")
     parser.add_argument(
@@ -242,9 +185,27 @@ def main():
         action="store_true",
         help="Overwrite existing midframes; endpoints are always copied.",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--no-hardlink",
+        action="store_true",
+        help="Copy endpoints into sequence dirs instead of hard-linking them "
+        "(use if downstream tools edit frames in place).",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default="frames/tween_cache",
+        help="Directory of cached tween results keyed by prompt and parent frames "
+        "(default: frames/tween_cache)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always call the API for tweens, bypassing the tween cache.",
+    )
+    args = parser.parse_args(argv)
 
-    cfg = load_config(args.config)
+    if cfg is None:
+        cfg = load_config(args.config)
     endpoints_map = discover_endpoints(args.endpoints_dir)
     if not endpoints_map:
         raise SystemExit(f"No endpoints found in {args.endpoints_dir}")
@@ -263,6 +224,7 @@ def main():
         raise SystemExit("Expression 'neutral' not found in expressions.json")
 
     expr_id = "neutral"
+    expr_desc = describe_expression(expr_id, cfg)
 
     neutral_source_key = (expr_id, args.source_pose)
     if neutral_source_key not in endpoints_map:
@@ -274,7 +236,7 @@ def main():
     os.makedirs(args.sequences_dir, exist_ok=True)
 
     # Build pose sequences neutral(source) -> neutral(target_pose)
-    sequences: Dict[str, PoseSeq] = {}
+    sequences: Dict[str, TweenSequence] = {}
     for pose in poses:
         if pose == args.source_pose:
             continue
@@ -296,18 +258,31 @@ def main():
         # endpoints
         f_start = os.path.join(seq_dir, "000.png")
         f_end = os.path.join(seq_dir, "100.png")
-        shutil.copy2(src_img, f_start)
-        shutil.copy2(tgt_img, f_end)
+        link_or_copy(src_img, f_start, hardlink=not args.no_hardlink)
+        link_or_copy(tgt_img, f_end, hardlink=not args.no_hardlink)
 
         frames = [Frame(t=0.0, file="000.png"), Frame(t=1.0, file="100.png")]
-        sequences[path_id] = PoseSeq(
+        # Descriptions are fixed for the whole sequence, so build the prompt
+        # once here rather than in every tween job
+        pose_start_desc = POSE_DESCRIPTIONS.get(
+            args.source_pose, args.source_pose.replace("_", " ")
+        )
+        pose_end_desc = POSE_DESCRIPTIONS.get(pose, pose.replace("_", " "))
+        sequences[path_id] = TweenSequence(
             path_id=path_id,
-            pose_start=args.source_pose,
-            pose_end=pose,
-            expr_id=expr_id,
             dir=seq_dir,
             frames=frames,
+            prompt_template=build_prompt_template(
+                expr_desc, pose_start_desc, pose_end_desc
+            ),
+            manifest={
+                "expr_start": expr_id,
+                "expr_end": expr_id,
+                "pose": f"{args.source_pose}_to_{pose}",
+            },
         )
+        # Endpoints-only manifest; tweens are added as they land
+        write_manifest(sequences[path_id])
 
     if not sequences:
         print("[i] No pose sequences to build (maybe missing neutral tilts).")
@@ -315,106 +290,19 @@ def main():
 
     print(f"[i] Initialized {len(sequences)} neutral pose sequences.")
 
-    # Recursive midpoint refinement
-    for depth in range(1, args.max_depth + 1):
-        print(f"\n=== Pose refinement depth {depth} ===")
-        jobs: List[Tuple[TweenJob, PoseSeq]] = []
-
-        for seq in sequences.values():
-            seq.frames.sort(key=lambda f: f.t)
-            existing_ts = [f.t for f in seq.frames]
-
-            for i in range(len(seq.frames) - 1):
-                left = seq.frames[i]
-                right = seq.frames[i + 1]
-                mid_t = 0.5 * (left.t + right.t)
-
-                if mid_t <= left.t or mid_t >= right.t:
-                    continue
-                if any(abs(mid_t - t) < 1e-6 for t in existing_ts):
-                    continue
-
-                idx = int(round(mid_t * 100))
-                out_file = f"{idx:03d}.png"
-                out_path = os.path.join(seq.dir, out_file)
-                if os.path.exists(out_path) and not args.overwrite:
-                    seq.frames.append(Frame(t=mid_t, file=out_file))
-                    existing_ts.append(mid_t)
-                    continue
-
-                job = TweenJob(
-                    path_id=seq.path_id,
-                    expr_id=seq.expr_id,
-                    pose_start=seq.pose_start,
-                    pose_end=seq.pose_end,
-                    left_t=left.t,
-                    right_t=right.t,
-                    mid_t=mid_t,
-                    left_file=left.file,
-                    right_file=right.file,
-                    out_file=out_file,
-                    size=args.size,
-                )
-                jobs.append((job, seq))
-
-        if not jobs:
-            print("[i] No new midpoints to generate at this depth.")
-            continue
-
-        print(f"[i] Depth {depth}: {len(jobs)} pose tween frames to generate.")
-
-        def worker(job: TweenJob, seq_dir: str):
-            try:
-                generate_midframe(job, seq_dir, cfg)
-                return job, None
-            except Exception as e:
-                return job, e
-
-        results: List[Tuple[TweenJob, Optional[Exception]]] = []
-        with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
-            future_to_job = {
-                executor.submit(worker, job, seq.dir): job for (job, seq) in jobs
-            }
-            for fut in as_completed(future_to_job):
-                job = future_to_job[fut]
-                job_res, err = fut.result()
-                if err is None:
-                    print(
-                        f"[✓] {job_res.path_id} t={job_res.mid_t:.3f} "
-                        f"-> {job_res.out_file}"
-                    )
-                else:
-                    print(
-                        f"[!] Failed {job_res.path_id} t={job_res.mid_t:.3f}: {err}"
-                    )
-                results.append((job_res, err))
-
-        for job_res, err in results:
-            if err is not None:
-                continue
-            seq = sequences[job_res.path_id]
-            if not any(abs(f.t - job_res.mid_t) < 1e-6 for f in seq.frames):
-                seq.frames.append(Frame(t=job_res.mid_t, file=job_res.out_file))
-
-        ok = sum(1 for _, e in results if e is None)
-        fail = len(results) - ok
-        print(f"[i] Depth {depth} done. Success: {ok}, Failed: {fail}")
+    ok, failed = refine_sequences(
+        sequences.values(),
+        max_depth=args.max_depth,
+        size=args.size,
+        max_workers=args.max_workers,
+        overwrite=args.overwrite,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        hardlink=not args.no_hardlink,
+    )
+    print(f"[i] Pose refinement done. Success: {ok}, Failed: {failed}")
 
-    # Write manifests
     for seq in sequences.values():
-        seq.frames.sort(key=lambda f: f.t)
-        frames_list = [{"t": f.t, "file": f.file} for f in seq.frames]
-        manifest = {
-            "path_id": seq.path_id,
-            "expr_start": seq.expr_id,
-            "expr_end": seq.expr_id,
-            "pose": f"{seq.pose_start}_to_{seq.pose_end}",
-            "frames": frames_list,
-        }
-        manifest_path = os.path.join(seq.dir, "manifest.json")
-        with open(manifest_path, "w") as f:
-            json.dump(manifest, f, indent=2)
-        print(f"[i] Wrote manifest: {manifest_path}")
+        print(f"[i] Wrote manifest: {os.path.join(seq.dir, 'manifest.json')}")
 
 
 if __name__ == "__main__":
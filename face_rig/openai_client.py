@@ -0,0 +1,32 @@
+"""
+openai_client.py
+
+The OpenAI client shared by the asset generation scripts. generate_all_assets.py
+runs every stage in one process, so keeping the client here (rather than one per
+script) gives the whole run a single connection pool.
+"""
+
+import importlib.util
+import threading
+from typing import Optional
+
+from openai import DefaultHttpxClient, OpenAI
+
+# httpx only speaks HTTP/2 when the optional h2 package is installed
+HTTP2 = importlib.util.find_spec("h2") is not None
+
+_client: Optional[OpenAI] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> OpenAI:
+    """
+    Process-wide OpenAI client, built on first use so importing a stage needs
+    no API key. With h2 installed, concurrent edits multiplex over one HTTP/2
+    connection; otherwise they share the client's HTTP/1.1 pool.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OpenAI(http_client=DefaultHttpxClient(http2=HTTP2))
+        return _client
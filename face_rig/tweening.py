@@ -0,0 +1,315 @@
+"""
+tweening.py
+
+Recursive midpoint refinement shared by generate_all_sequences.py and
+generate_neutral_pose_sequences.py. The scripts decide which sequences exist
+and how their prompts read; this module stages frames, calls gpt-image-1 for
+each midpoint (through the on-disk tween cache), and keeps every sequence's
+manifest.json current.
+
+A sequence directory looks like:
+
+    <sequences_dir>/<path_id>/
+        000.png         # start endpoint (t=0.0)
+        025.png ...     # tweens, named by round(t * 100)
+        100.png         # end endpoint (t=1.0)
+        manifest.json
+"""
+
+import base64
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image
+
+from openai_client import get_client
+
+TWEEN_MODEL = "gpt-image-1"
+
+
+@dataclass
+class Frame:
+    t: float
+    file: str  # relative filename in the sequence dir, e.g. "025.png"
+
+
+@dataclass
+class TweenSequence:
+    path_id: str
+    dir: str              # sequence directory
+    frames: List[Frame]   # frames with t in [0,1]
+    prompt_template: str  # full prompt with a {mid_t} placeholder
+    manifest: Dict[str, str]  # fixed manifest fields: expr_start, expr_end, pose
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+
+@dataclass
+class TweenJob:
+    path_id: str
+    left_t: float
+    right_t: float
+    mid_t: float
+    left_file: str   # relative filenames like "000.png"
+    right_file: str
+    out_file: str    # relative filename like "050.png"
+    size: str
+    prompt_template: str
+
+
+def link_or_copy(src: str, dst: str, hardlink: bool = True) -> None:
+    """
+    Stage an endpoint into a sequence dir: hard-link it (no bytes copied),
+    falling back to a full copy across filesystems or when hardlink=False.
+    """
+    # Unlink first so a dst that is itself a link to src (or to a cache
+    # entry) is replaced, never truncated through the shared inode
+    if os.path.lexists(dst):
+        os.unlink(dst)
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+
+
+def write_manifest(seq: TweenSequence) -> None:
+    """
+    Atomically rewrite seq.dir/manifest.json from seq.frames. Called with
+    seq.lock held after every new frame, so a crash leaves a manifest listing
+    exactly the frames that exist.
+    """
+    seq.frames.sort(key=lambda f: f.t)
+    manifest = {
+        "path_id": seq.path_id,
+        **seq.manifest,
+        "frames": [{"t": f.t, "file": f.file} for f in seq.frames],
+    }
+    manifest_path = os.path.join(seq.dir, "manifest.json")
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+@functools.lru_cache(maxsize=32)
+def _read_frame(path: str, mtime_ns: int, size: int) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def load_frame(path: str) -> Tuple[str, bytes, str]:
+    """
+    Upload tuple for a frame PNG, read from disk once while it is unchanged.
+
+    Endpoints and midpoints are parents of several tweens; the cache is keyed
+    on mtime/size, so a frame rewritten with --overwrite is read afresh.
+    """
+    st = os.stat(path)
+    return os.path.basename(path), _read_frame(path, st.st_mtime_ns, st.st_size), "image/png"
+
+
+def save_png_rgba(img_bytes: bytes, out_path: str) -> None:
+    """
+    Write an API-returned image as an RGBA PNG. RGBA PNGs (what gpt-image-1
+    normally returns) are written as-is; anything else is converted.
+
+    The file is replaced rather than rewritten in place, so an output that is
+    hard-linked to a tween cache entry never clobbers the cached copy.
+    """
+    out_dir = os.path.dirname(out_path)
+    os.makedirs(out_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, suffix=".png.tmp")
+    try:
+        # IHDR color type 6 = truecolor with alpha, 8-bit samples at byte 24
+        if img_bytes[:8] == b"\x89PNG\r\n\x1a\n" and img_bytes[24] == 8 and img_bytes[25] == 6:
+            with os.fdopen(fd, "wb") as f:
+                f.write(img_bytes)
+        else:
+            with os.fdopen(fd, "wb") as f:
+                Image.open(BytesIO(img_bytes)).convert("RGBA").save(f, format="PNG")
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def tween_cache_key(prompt: str, left: bytes, right: bytes, size: str) -> str:
+    """Content hash of everything that determines a tween API result."""
+    h = hashlib.sha256()
+    for part in (
+        TWEEN_MODEL.encode(),
+        prompt.encode(),
+        hashlib.sha256(left).digest(),
+        hashlib.sha256(right).digest(),
+        size.encode(),
+    ):
+        h.update(part)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def generate_midframe(
+    job: TweenJob,
+    seq_dir: str,
+    cache_dir: Optional[str] = None,
+    hardlink: bool = True,
+) -> None:
+    """
+    Generate one tween. With a cache_dir, results are stored there by content
+    key and linked into the sequence, so reruns and retries (resume,
+    --overwrite) of an identical request skip the API call.
+    """
+    prompt = job.prompt_template.format(mid_t=job.mid_t)
+
+    left = load_frame(os.path.join(seq_dir, job.left_file))
+    right = load_frame(os.path.join(seq_dir, job.right_file))
+    out_path = os.path.join(seq_dir, job.out_file)
+
+    cached_path = None
+    if cache_dir:
+        key = tween_cache_key(prompt, left[1], right[1], job.size)
+        cached_path = os.path.join(cache_dir, f"{key}.png")
+        if os.path.exists(cached_path):
+            link_or_copy(cached_path, out_path, hardlink=hardlink)
+            return
+
+    result = get_client().images.edit(
+        model=TWEEN_MODEL,
+        image=[left, right],
+        prompt=prompt,
+        size=job.size,
+        n=1,
+        quality="high",
+    )
+
+    img_bytes = base64.b64decode(result.data[0].b64_json)
+    if cached_path is None:
+        save_png_rgba(img_bytes, out_path)
+        return
+    save_png_rgba(img_bytes, cached_path)
+    link_or_copy(cached_path, out_path, hardlink=hardlink)
+
+
+def refine_sequences(
+    sequences: Iterable[TweenSequence],
+    max_depth: int,
+    size: str,
+    max_workers: int = 4,
+    overwrite: bool = False,
+    cache_dir: Optional[str] = None,
+    hardlink: bool = True,
+) -> Tuple[int, int]:
+    """
+    Split every sequence's [0, 1] at its midpoint, then each half, down to
+    max_depth levels. Returns (tweens generated, tweens failed).
+
+    Refinement is dependency-driven: each finished midpoint immediately
+    schedules its two child segments, keeping the pool busy instead of waiting
+    for every tween at one depth before starting the next. Existing tweens are
+    kept unless overwrite is set; a failed midpoint is retried one level down.
+    """
+    lock = threading.Lock()
+    drained = threading.Event()
+    pending = 1  # held by the caller until the initial segments are scheduled
+    counts = {"ok": 0, "fail": 0}
+
+    def release() -> None:
+        nonlocal pending
+        with lock:
+            pending -= 1
+            if pending == 0:
+                drained.set()
+
+    def register(seq: TweenSequence, frame: Frame) -> None:
+        with seq.lock:
+            if not any(abs(f.t - frame.t) < 1e-6 for f in seq.frames):
+                seq.frames.append(frame)
+                write_manifest(seq)
+
+    def schedule(seq: TweenSequence, left: Frame, right: Frame, levels: int) -> None:
+        nonlocal pending
+        if levels <= 0:
+            return
+        mid_t = 0.5 * (left.t + right.t)
+
+        # Only care about midpoints strictly between endpoints
+        if mid_t <= left.t or mid_t >= right.t:
+            return
+
+        idx = int(round(mid_t * 100))
+        mid = Frame(t=mid_t, file=f"{idx:03d}.png")
+        out_path = os.path.join(seq.dir, mid.file)
+
+        if os.path.exists(out_path) and not overwrite:
+            # if it exists and we're not overwriting, just register it
+            register(seq, mid)
+            schedule(seq, left, mid, levels - 1)
+            schedule(seq, mid, right, levels - 1)
+            return
+
+        job = TweenJob(
+            path_id=seq.path_id,
+            left_t=left.t,
+            right_t=right.t,
+            mid_t=mid_t,
+            left_file=left.file,
+            right_file=right.file,
+            out_file=mid.file,
+            size=size,
+            prompt_template=seq.prompt_template,
+        )
+        with lock:
+            pending += 1
+        future = executor.submit(generate_midframe, job, seq.dir, cache_dir, hardlink)
+        future.add_done_callback(
+            lambda fut: on_done(fut, seq, job, left, mid, right, levels)
+        )
+
+    def on_done(fut, seq: TweenSequence, job: TweenJob, left: Frame, mid: Frame, right: Frame, levels: int) -> None:
+        try:
+            err = fut.exception()
+            if err is None:
+                print(f"[✓] {job.path_id} t={job.mid_t:.3f} -> {job.out_file}")
+                with lock:
+                    counts["ok"] += 1
+                register(seq, mid)
+                schedule(seq, left, mid, levels - 1)
+                schedule(seq, mid, right, levels - 1)
+            else:
+                print(f"[!] Failed {job.path_id} t={job.mid_t:.3f}: {err}")
+                with lock:
+                    counts["fail"] += 1
+                # Retry the segment one level down, as the next depth pass used to
+                schedule(seq, left, right, levels - 1)
+        except Exception as e:
+            print(f"[!] Scheduling error after {job.path_id} t={job.mid_t:.3f}: {e}")
+        finally:
+            # Children were counted before this job is released, so pending
+            # only reaches zero once the whole tree has drained
+            release()
+
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # One pool for the whole tree keeps worker threads warm
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for seq in sequences:
+            schedule(seq, seq.frames[0], seq.frames[-1], max_depth)
+        release()
+        drained.wait()
+    finally:
+        executor.shutdown(wait=True)
+
+    return counts["ok"], counts["fail"]